@@ -0,0 +1,93 @@
+"""
+Who can see which cashbook, materialized in CashbookAccess.
+
+Rows are derived from Business.owner and Member and are kept in sync by the
+signal receivers in books.signals; run the rebuild_access command after
+changing either through queryset.update()/bulk_create().
+"""
+from collections import defaultdict
+
+OWNER = 'OWNER'
+SYNC_BATCH_SIZE = 1000
+
+
+def _access_rows(cashbooks):
+    from .models import CashbookAccess, Member
+
+    cashbooks = list(cashbooks.values_list('id', 'business_id', 'business__owner_id'))
+    members = defaultdict(list)
+    business_ids = {business_id for _, business_id, _ in cashbooks}
+    for user_id, business_id, role in Member.objects.filter(business_id__in=business_ids).values_list(
+        'user_id', 'business_id', 'role'
+    ):
+        members[business_id].append((user_id, role))
+
+    for cashbook_id, business_id, owner_id in cashbooks:
+        yield CashbookAccess(user_id=owner_id, cashbook_id=cashbook_id, business_id=business_id, role=OWNER)
+        for user_id, role in members[business_id]:
+            # An owner who is also listed as a member keeps owner rights
+            if user_id != owner_id:
+                yield CashbookAccess(user_id=user_id, cashbook_id=cashbook_id, business_id=business_id, role=role)
+
+
+def sync_access(business_ids=None, cashbook_ids=None):
+    """
+    Recreate access rows of the given businesses and/or cashbooks (everything when
+    both are None). Returns the number of rows written.
+    """
+    from .models import Cashbook, CashbookAccess
+
+    cashbooks = Cashbook.objects.all()
+    stale = CashbookAccess.objects.all()
+    if business_ids is not None or cashbook_ids is not None:
+        scope = {'business_id__in': business_ids} if business_ids is not None else {'pk__in': cashbook_ids}
+        cashbooks = cashbooks.filter(**scope)
+        # Rows of a cashbook that moved to another business are matched by cashbook
+        stale = stale.filter(cashbook_id__in=cashbooks.values('id'))
+        if business_ids is not None:
+            stale = stale | CashbookAccess.objects.filter(business_id__in=business_ids)
+    stale.delete()
+    return len(CashbookAccess.objects.bulk_create(list(_access_rows(cashbooks)), batch_size=SYNC_BATCH_SIZE))
+
+
+class AccessResolver:
+    """
+    Answers owner/role questions for one user from memory. The user's cashbook access
+    rows and memberships are each loaded with a single query on first use; get one
+    per request with for_request() so permission checks and perform_* hooks share it.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._cashbook_roles = None
+        self._member_roles = None
+
+    @classmethod
+    def for_request(cls, request):
+        resolver = getattr(request, '_access_resolver', None)
+        if resolver is None or resolver.user != request.user:
+            resolver = request._access_resolver = cls(request.user)
+        return resolver
+
+    def cashbook_role(self, cashbook_id):
+        """OWNER/ADMIN/EDITOR/VIEWER of the user in a cashbook, or None without access"""
+        from .models import CashbookAccess
+        if self._cashbook_roles is None:
+            self._cashbook_roles = dict(
+                CashbookAccess.objects.filter(user=self.user).values_list('cashbook_id', 'role')
+            )
+        return self._cashbook_roles.get(cashbook_id)
+
+    def business_role(self, business):
+        """
+        Same for a business. Resolved from Member rather than CashbookAccess, which has
+        no rows for a business that does not have any cashbook yet.
+        """
+        from .models import Member
+        if business.owner_id == self.user.pk:
+            return OWNER
+        if self._member_roles is None:
+            self._member_roles = dict(
+                Member.objects.filter(user=self.user).values_list('business_id', 'role')
+            )
+        return self._member_roles.get(business.pk)
@@ -1,6 +1,7 @@
 from django.contrib import admin
+from django.db import transaction as db_transaction
 from django.utils.html import format_html
-from .models import Business, Cashbook, Member, Category, Party, PaymentMode, Transaction
+from .models import Business, Cashbook, CashbookAccess, CashbookDailyRollup, ExportJob, Member, Category, Party, PaymentMode, SyncTombstone, Transaction
 
 
 # ============================================
@@ -264,3 +265,61 @@ class TransactionAdmin(admin.ModelAdmin):
     get_amount_display.short_description = 'Amount'
     get_amount_display.admin_order_field = 'amount'
 
+    def delete_queryset(self, request, queryset):
+        """One at a time: Transaction.delete() keeps balances, rollups and sync tombstones current"""
+        with db_transaction.atomic():
+            for txn in queryset:
+                txn.delete()
+
+
+# ============================================
+# Daily Rollup Admin
+# ============================================
+@admin.register(CashbookDailyRollup)
+class CashbookDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'cashbook', 'total_in', 'total_out', 'count')
+    list_filter = ('date', 'cashbook')
+    search_fields = ('cashbook__name',)
+    readonly_fields = ('id', 'cashbook', 'date', 'total_in', 'total_out', 'count')
+    list_per_page = 25
+    ordering = ('-date',)
+    date_hierarchy = 'date'
+
+
+# ============================================
+# Cashbook Access Admin
+# ============================================
+@admin.register(CashbookAccess)
+class CashbookAccessAdmin(admin.ModelAdmin):
+    list_display = ('user', 'cashbook', 'business', 'role')
+    list_filter = ('role', 'business')
+    search_fields = ('user__username', 'cashbook__name', 'business__name')
+    readonly_fields = ('id', 'user', 'cashbook', 'business', 'role')
+    list_per_page = 25
+
+
+# ============================================
+# Sync Tombstone Admin
+# ============================================
+@admin.register(SyncTombstone)
+class SyncTombstoneAdmin(admin.ModelAdmin):
+    list_display = ('model', 'object_id', 'cashbook_id', 'business_id', 'deleted_at')
+    list_filter = ('model', 'deleted_at')
+    search_fields = ('object_id',)
+    readonly_fields = ('id', 'model', 'object_id', 'cashbook_id', 'business_id', 'deleted_at')
+    list_per_page = 25
+    ordering = ('-deleted_at',)
+
+
+# ============================================
+# Export Job Admin
+# ============================================
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'cashbook', 'format', 'status', 'requested_by', 'created_at', 'finished_at')
+    list_display_links = ('id',)
+    list_filter = ('status', 'format', 'created_at')
+    search_fields = ('cashbook__name', 'requested_by__username')
+    readonly_fields = ('id', 'created_at', 'started_at', 'finished_at', 'expires_at')
+    list_per_page = 25
+    ordering = ('-created_at',)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import check_fts_triggers
+        checks.register(check_fts_triggers, checks.Tags.database)
@@ -0,0 +1,135 @@
+"""
+Async variants of the read-heavy endpoints (summary, reports list, transaction list),
+routed instead of the sync views when ASYNC_VIEWS is on, as it is under ASGI
+(config/asgi.py, which also documents the worker setup).
+
+A gunicorn sync worker serves one request at a time, so a large report holds up a
+whole worker. These views await their queries through the async ORM instead, and
+the event loop of a uvicorn worker keeps serving other requests meanwhile. The
+other handlers of the same view sets (create, exports, ...) and authentication stay
+sync and run in a thread.
+
+Summaries are one grouped annotate() over the cashbooks rather than an aggregate(),
+so they are read with `async for` (no aaggregate()); the page count uses acount().
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from rest_framework.response import Response
+
+from . import conditional
+from .pagination import AsyncPageNumberPagination, TransactionCursorPagination
+from .report_views import ReportsViewSet
+from .views import SummaryView, TransactionViewSet
+
+
+class AsyncDispatchMixin:
+    """
+    APIView.dispatch() as a coroutine, for (view set) views with async handlers.
+    Sync handlers run in a worker thread; responses are rendered by Django.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        # View sets wrap dispatch() in a plain function, so mark the view for Django to await
+        if not iscoroutinefunction(view):
+            markcoroutinefunction(view)
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication may query the database
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncSummaryView(AsyncDispatchMixin, SummaryView):
+    async def get(self, request):
+        cashbook_ids = self._query_cashbook_ids(request)
+        return await self._respond(request, request.query_params, cashbook_ids, batch=len(cashbook_ids) > 1)
+
+    async def post(self, request):
+        cashbook_ids = request.data.get('cashbooks') or []
+        if not isinstance(cashbook_ids, list):
+            return Response({'error': 'cashbooks must be a list of ids'}, status=400)
+        return await self._respond(request, request.data, cashbook_ids, batch=True)
+
+    async def _respond(self, request, params, cashbook_ids, batch):
+        cashbook_ids, transaction_filter = self._parse(params, cashbook_ids)
+
+        if self._is_conditional(request):
+            versions = await conditional.acashbook_versions(request.user, cashbook_ids)
+            etag = self._etag(request, versions, transaction_filter)
+            if conditional.is_not_modified(request, etag):
+                return conditional.not_modified(etag)
+
+        rows = [row async for row in self._summaries(request.user, transaction_filter, cashbook_ids)]
+        return self._summary_response(request, rows, transaction_filter, batch)
+
+
+class AsyncReportsViewSet(AsyncDispatchMixin, ReportsViewSet):
+    async def list(self, request):
+        """List all cashbooks with summary stats"""
+        etag = conditional.compute_etag(request, 'reports', await conditional.acashbook_versions(request.user))
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
+        data = [self._summary_row(cashbook) async for cashbook in self._summary_queryset()]
+        response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+class AsyncTransactionViewSet(AsyncDispatchMixin, TransactionViewSet):
+    pagination_class = AsyncPageNumberPagination
+
+    async def list(self, request, *args, **kwargs):
+        """List transactions with running balance calculated"""
+        cashbook_id = request.query_params.get('cashbook')
+        etag = conditional.compute_etag(
+            request, 'transactions',
+            await conditional.acashbook_versions(request.user, [cashbook_id] if cashbook_id else None),
+        )
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
+        response = await self._alist(request)
+        response['ETag'] = etag
+        return response
+
+    async def _alist(self, request):
+        # Validating ?category= and the other filterset fields may query the database
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        full_ledger = self._is_full_ledger()
+
+        if self._wants_cursor():
+            paginator = TransactionCursorPagination()
+            page = await paginator.apaginate_queryset(
+                queryset.select_related(*self.LIST_RELATED), request, view=self, carry_balance=not full_ledger,
+            )
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        queryset = self._ledger_queryset(queryset, full_ledger)
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        transactions = page if page is not None else [txn async for txn in queryset]
+        return self._ledger_response(transactions, full_ledger, page is not None)
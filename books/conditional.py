@@ -0,0 +1,63 @@
+"""
+Conditional GET support: strong ETags built from the data versions of the cashbooks
+a response depends on, so unchanged polls are answered with 304 before any
+aggregation or serialization runs.
+"""
+import hashlib
+import json
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Cashbook
+
+
+def _versions(user, cashbook_ids):
+    cashbooks = Cashbook.objects.visible_to(user)
+    if cashbook_ids is not None:
+        cashbooks = cashbooks.filter(id__in=cashbook_ids)
+    return cashbooks.values_list('id', 'data_version')
+
+
+def cashbook_versions(user, cashbook_ids=None):
+    """(id, data_version) of the cashbooks `user` can access, optionally limited to `cashbook_ids`"""
+    return sorted((str(pk), version) for pk, version in _versions(user, cashbook_ids))
+
+
+async def acashbook_versions(user, cashbook_ids=None):
+    """Async version of cashbook_versions()"""
+    return sorted([(str(pk), version) async for pk, version in _versions(user, cashbook_ids)])
+
+
+def compute_etag(request, scope, versions, query_key=None):
+    """
+    Strong ETag over the endpoint, the user, the cashbook versions and the normalized query
+    (`query_key`, e.g. TransactionFilter.cache_key(), or else the sorted query params).
+    Today's date is included because duration presets move at midnight without a data change.
+    """
+    params = query_key if query_key is not None else sorted(
+        (key, value) for key, values in request.query_params.lists() for value in values if value
+    )
+    basis = json.dumps(
+        [scope, str(request.user.pk), timezone.now().date().isoformat(), versions, params],
+        separators=(',', ':'),
+    )
+    return '"%s"' % hashlib.sha256(basis.encode()).hexdigest()[:40]
+
+
+def is_not_modified(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag in candidates
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
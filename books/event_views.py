@@ -0,0 +1,60 @@
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from . import events
+from .models import Business
+
+
+def _authenticate(request):
+    """
+    The user of the request's JWT. EventSource can't send headers, so browsers pass
+    the access token as ?access_token=... instead of an Authorization header.
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else request.GET.get('access_token', '').encode()
+    if not raw_token:
+        return None
+    try:
+        return authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+
+async def change_events(request):
+    """
+    GET /api/v1/events/[?business=<id>]: server-sent events of transaction changes with
+    fresh cashbook totals, for all businesses of the user or one of them (see books.events)
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would run the stream to completion before sending any of it
+        return JsonResponse({'error': 'Change events need the ASGI server (config.asgi)'}, status=501)
+
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+    businesses = Business.objects.visible_to(user)
+    if request.GET.get('business'):
+        try:
+            businesses = businesses.filter(pk=uuid.UUID(request.GET['business']))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid business id'}, status=400)
+    business_ids = [pk async for pk in businesses.values_list('id', flat=True)]
+    if not business_ids:
+        return JsonResponse({'error': 'Business not found'}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    response = StreamingHttpResponse(events.stream(business_ids, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
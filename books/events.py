@@ -0,0 +1,223 @@
+"""
+Live change notifications: GET /api/v1/events/ is a server-sent events stream of
+transaction changes, each with the cashbook's fresh totals, for the businesses the
+user belongs to. Dashboards keep it open instead of polling summaries and listings.
+
+Writes record a ChangeEvent row once they commit (publish()). Each worker process runs
+a single poller (Broker) that reads new rows for all of its open streams at once and
+fans them out to per-connection queues in memory, so an idle dashboard costs no
+queries and the database sees one indexed range scan per worker and poll interval,
+however many streams are open. Rows are read once EVENTS_SETTLE_SECONDS old, as an
+insert may take an id and commit after a later one. Needs ASGI (config/asgi.py); under
+WSGI the endpoint answers 501, as the stream would be buffered and never delivered.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BATCH_SIZE = 500
+
+
+def publish(kind, cashbook_id, object_id=None, count=1):
+    """Record a change for the streams once the current database transaction commits"""
+    from .models import ChangeEvent
+
+    # robust: a failed notification must not fail a write that has already committed
+    transaction.on_commit(
+        lambda: ChangeEvent.objects.create(kind=kind, cashbook_id=cashbook_id, object_id=object_id, count=count),
+        robust=True,
+    )
+
+
+def _settled():
+    """Change events old enough to be read (see EVENTS_SETTLE_SECONDS)"""
+    from .models import ChangeEvent
+
+    cutoff = timezone.now() - timedelta(seconds=settings.EVENTS_SETTLE_SECONDS)
+    return ChangeEvent.objects.filter(created_at__lt=cutoff)
+
+
+async def _fetch(after, limit=EVENTS_BATCH_SIZE):
+    events = _settled().filter(id__gt=after).order_by('id')[:limit]
+    return [event async for event in events]
+
+
+async def _latest_id():
+    """The newest settled event: younger ones are left to the poll, as the resume path skips them too"""
+    return await _settled().order_by('-id').values_list('id', flat=True).afirst() or 0
+
+
+async def _was_pruned(after):
+    """
+    Whether events following `after` may have been pruned already: the client's last
+    event is gone or past EVENTS_RETENTION_HOURS (see prune_events())
+    """
+    from .models import ChangeEvent
+
+    cutoff = timezone.now() - timedelta(hours=settings.EVENTS_RETENTION_HOURS)
+    return not await ChangeEvent.objects.filter(id=after, created_at__gte=cutoff).aexists()
+
+
+async def _messages(events):
+    """(event id, business id, SSE text) per event, with the totals of its cashbook from the daily rollups"""
+    from .models import Cashbook
+
+    cashbooks = Cashbook.objects.filter(id__in={event.cashbook_id for event in events}).values(
+        'id', 'business_id'
+    ).annotate(
+        total_in=Sum('daily_rollups__total_in', default=0),
+        total_out=Sum('daily_rollups__total_out', default=0),
+        count=Sum('daily_rollups__count', default=0),
+    )
+    cashbooks = {row['id']: row async for row in cashbooks}
+
+    messages = []
+    for event in events:
+        cashbook = cashbooks.get(event.cashbook_id)
+        if cashbook is None:
+            continue  # Deleted since
+        data = {
+            'cashbook': str(event.cashbook_id),
+            'business': str(cashbook['business_id']),
+            'transaction': str(event.object_id) if event.object_id else None,
+            'count': event.count,
+            'totals': {
+                'total_in': float(cashbook['total_in']),
+                'total_out': float(cashbook['total_out']),
+                'net_balance': float(cashbook['total_in'] - cashbook['total_out']),
+                'count': cashbook['count'],
+            },
+        }
+        text = f'id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+        messages.append((event.id, cashbook['business_id'], text))
+    return messages
+
+
+class Subscription:
+    """The queue of one open stream"""
+
+    def __init__(self, business_ids):
+        self.business_ids = set(business_ids)
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind refetches instead
+            self.overflowed = True
+
+
+class Broker:
+    """In-process pub/sub: one poller per worker feeding the subscriptions by business"""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.last_id = None
+        self.task = None
+
+    def subscribe(self, business_ids):
+        subscription = Subscription(business_ids)
+        for business_id in subscription.business_ids:
+            self.subscriptions[business_id].add(subscription)
+        if self.task is None or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for business_id in subscription.business_ids:
+            self.subscriptions[business_id].discard(subscription)
+            if not self.subscriptions[business_id]:
+                del self.subscriptions[business_id]
+        if not self.subscriptions and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            # Nobody missed anything while no stream was open
+            self.last_id = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Polling change events failed')
+            await asyncio.sleep(settings.EVENTS_POLL_INTERVAL)
+
+    async def poll(self):
+        if self.last_id is None:
+            self.last_id = await _latest_id()
+            return
+        events = await _fetch(self.last_id)
+        if not events:
+            return
+        self.last_id = events[-1].id
+        for event_id, business_id, text in await _messages(events):
+            for subscription in self.subscriptions.get(business_id, ()):
+                subscription.put((event_id, text))
+
+
+broker = Broker()
+
+
+async def stream(business_ids, last_event_id=None):
+    """
+    Yield the SSE text of one connection: events of `business_ids` as they arrive, a
+    keepalive comment when idle, and a 'reset' event when the client fell too far behind
+    (or asked to resume from a pruned position) and should refetch. Ends after
+    EVENTS_STREAM_MAX_SECONDS; EventSource reconnects, which re-checks access.
+    """
+    subscription = broker.subscribe(business_ids)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.EVENTS_STREAM_MAX_SECONDS
+    last_sent = last_event_id or 0
+    try:
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+        if last_event_id is not None:
+            # Resume after a reconnect from what the client has seen
+            events = await _fetch(last_event_id, limit=settings.EVENTS_QUEUE_SIZE + 1)
+            if len(events) > settings.EVENTS_QUEUE_SIZE or await _was_pruned(last_event_id):
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            for event_id, business_id, text in await _messages(events):
+                if business_id in subscription.business_ids:
+                    last_sent = event_id
+                    yield text
+
+        while (remaining := deadline - loop.time()) > 0:
+            if subscription.overflowed:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            try:
+                event_id, text = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=min(remaining, settings.EVENTS_KEEPALIVE_SECONDS)
+                )
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event_id > last_sent:
+                last_sent = event_id
+                yield text
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def prune_events(older_than=None):
+    """Delete change events past EVENTS_RETENTION_HOURS; resuming from before that resets the client"""
+    from .models import ChangeEvent
+
+    if older_than is None:
+        older_than = timezone.now() - timedelta(hours=settings.EVENTS_RETENTION_HOURS)
+    deleted, _ = ChangeEvent.objects.filter(created_at__lt=older_than).delete()
+    return deleted
@@ -0,0 +1,96 @@
+"""
+Background execution of ExportJob rows.
+
+The run_export_worker command claims pending jobs from the database (no
+external broker) and renders them in a process pool, so large exports never
+occupy a web worker.
+"""
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import exports
+from .models import ExportJob
+
+
+def init_worker_process():
+    """Pool initializer: make sure Django is set up and no DB connection is shared with the parent"""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def run_export_job(job_id):
+    """Render one claimed job into its artifact file (runs inside a pool process)"""
+    job = ExportJob.objects.select_related('cashbook').get(pk=job_id)
+    writer, extension, _ = exports.FORMATS[job.format]
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=exports.SPOOL_MAX_MEMORY) as output:
+            writer(job.cashbook, output)
+            output.seek(0)
+            job.file.save(f"{job.id}.{extension}", File(output), save=False)
+    except Exception as exc:
+        if job.file:
+            # A partially stored artifact
+            job.file.delete(save=False)
+        job.status = 'FAILED'
+        job.error = str(exc)
+    else:
+        job.status = 'DONE'
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + settings.EXPORT_JOB_TTL
+    job.save(update_fields=['file', 'status', 'error', 'finished_at', 'expires_at'])
+    connections.close_all()
+    return job.status
+
+
+def claim_jobs(limit):
+    """
+    Move up to `limit` pending jobs to RUNNING, oldest first, without letting any business
+    exceed EXPORT_JOBS_PER_BUSINESS running jobs. Returns the claimed job ids.
+    """
+    if limit <= 0:
+        return []
+    running = dict(
+        ExportJob.objects.filter(status='RUNNING').order_by()
+        .values_list('business_id').annotate(count=Count('id'))
+    )
+    claimed = []
+    pending = ExportJob.objects.filter(status='PENDING').order_by('created_at').values_list('id', 'business_id')
+    for job_id, business_id in pending.iterator():
+        if running.get(business_id, 0) >= settings.EXPORT_JOBS_PER_BUSINESS:
+            continue
+        # Conditional update so a job can't be claimed twice
+        if ExportJob.objects.filter(pk=job_id, status='PENDING').update(status='RUNNING', started_at=timezone.now()):
+            running[business_id] = running.get(business_id, 0) + 1
+            claimed.append(job_id)
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def requeue_interrupted_jobs():
+    """Jobs left RUNNING by a worker that stopped mid-export go back to the queue"""
+    return ExportJob.objects.filter(status='RUNNING').update(status='PENDING', started_at=None)
+
+
+def cleanup_expired_exports():
+    """Expire finished (DONE or FAILED) jobs past their expiry time, deleting their artifacts"""
+    now = timezone.now()
+    expired = ExportJob.objects.filter(
+        Q(status__in=['DONE', 'FAILED'], expires_at__lt=now) |
+        # Failures recorded without an expiry time
+        Q(status='FAILED', expires_at__isnull=True, finished_at__lt=now - settings.EXPORT_JOB_TTL)
+    )
+    count = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.status = 'EXPIRED'
+        job.save(update_fields=['file', 'status'])
+        count += 1
+    return count
@@ -0,0 +1,244 @@
+"""
+Report file writers that stream rows from the database in chunks,
+so memory use doesn't grow with the size of the cashbook.
+"""
+import csv
+import json
+from decimal import Decimal
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+from .ledger import LEDGER_ORDER, signed_amount
+from .models import Transaction
+
+EXPORT_CHUNK_SIZE = 2000
+# Exports are built in memory up to this size and spill to a temp file beyond it
+SPOOL_MAX_MEMORY = 5 * 1024 * 1024
+
+# Streamed exports are flushed to the client in pieces of roughly this size
+STREAM_BUFFER_SIZE = 64 * 1024
+
+CSV_HEADERS = ['Date', 'Time', 'Type', 'Party', 'Category', 'Payment Mode', 'Remark', 'Cash In', 'Cash Out', 'Balance']
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXCEL_HEADERS = ['Date', 'Type', 'Party', 'Category', 'Payment Mode', 'Remark', 'Cash In', 'Cash Out', 'Balance']
+
+
+def iter_report_rows(cashbook):
+    """
+    Yield one tuple per transaction, oldest first:
+    (date, time, type, party, category, payment_mode, remark, amount_in, amount_out, running_balance)
+    """
+    rows = (
+        Transaction.objects.filter(cashbook=cashbook)
+        .order_by(*LEDGER_ORDER)
+        .values_list(
+            'transaction_date', 'transaction_time', 'type', 'party__name',
+            'category__name', 'payment_mode__name', 'remark', 'amount',
+        )
+    )
+    balance = Decimal('0')
+    for date, time, txn_type, party, category, payment_mode, remark, amount in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        balance += signed_amount(txn_type, amount)
+        yield (
+            date,
+            time,
+            txn_type,
+            party or '-',
+            category or '-',
+            payment_mode or '-',
+            remark,
+            amount if txn_type == 'IN' else 0,
+            amount if txn_type == 'OUT' else 0,
+            balance,
+        )
+
+
+def write_excel(cashbook, fileobj):
+    """Write the cashbook report as .xlsx into `fileobj` using openpyxl's write-only mode"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=f"{cashbook.name} Report")
+
+    def bold(value):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = openpyxl.styles.Font(bold=True)
+        return cell
+
+    ws.append([bold(header) for header in EXCEL_HEADERS])
+
+    total_in = total_out = Decimal('0')
+    for date, _, txn_type, party, category, payment_mode, remark, amount_in, amount_out, balance in iter_report_rows(cashbook):
+        total_in += amount_in
+        total_out += amount_out
+        ws.append([
+            date,
+            txn_type,
+            party,
+            category,
+            payment_mode,
+            remark,
+            amount_in if amount_in > 0 else '',
+            amount_out if amount_out > 0 else '',
+            balance,
+        ])
+
+    # Summary at bottom, after one blank row
+    ws.append([])
+    ws.append([None] * 5 + [bold("TOTALS"), bold(total_in), bold(total_out), bold(total_in - total_out)])
+    wb.save(fileobj)
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer in a generator"""
+    def write(self, value):
+        return value
+
+
+def _buffered(lines):
+    """Join small lines into STREAM_BUFFER_SIZE byte chunks; the first line goes out immediately"""
+    buffer = []
+    size = 0
+    for i, line in enumerate(lines):
+        buffer.append(line)
+        size += len(line)
+        if i == 0 or size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def _format_row(row):
+    date, time, txn_type, party, category, payment_mode, remark, amount_in, amount_out, balance = row
+    return {
+        'date': date.isoformat(),
+        'time': time.strftime('%H:%M') if time else '',
+        'type': txn_type,
+        'party': party,
+        'category': category,
+        'payment_mode': payment_mode,
+        'remark': remark,
+        'amount_in': f"{amount_in:.2f}",
+        'amount_out': f"{amount_out:.2f}",
+        'running_balance': f"{balance:.2f}",
+    }
+
+
+def iter_csv(cashbook):
+    """Yield the cashbook report as CSV bytes"""
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(CSV_HEADERS)
+        for row in iter_report_rows(cashbook):
+            formatted = _format_row(row)
+            yield writer.writerow([
+                formatted['date'],
+                formatted['time'],
+                formatted['type'],
+                formatted['party'],
+                formatted['category'],
+                formatted['payment_mode'],
+                formatted['remark'],
+                formatted['amount_in'] if row[7] > 0 else '',
+                formatted['amount_out'] if row[8] > 0 else '',
+                formatted['running_balance'],
+            ])
+
+    return _buffered(lines())
+
+
+def iter_jsonl(cashbook):
+    """Yield the cashbook report as JSON Lines bytes, one transaction object per line"""
+    return _buffered(json.dumps(_format_row(row)) + '\n' for row in iter_report_rows(cashbook))
+
+
+def write_pdf(cashbook, fileobj):
+    """Write the cashbook report as PDF into `fileobj`"""
+    # reportlab lays out the whole document in memory, so only the row dicts are avoided here
+    table_data = [['Date', 'Type', 'Party', 'Category', 'Mode', 'Remark', 'In', 'Out', 'Balance']]
+    total_in = total_out = Decimal('0')
+    last_date = None
+    for date, _, txn_type, party, category, payment_mode, remark, amount_in, amount_out, balance in iter_report_rows(cashbook):
+        total_in += amount_in
+        total_out += amount_out
+        last_date = date
+        table_data.append([
+            str(date),
+            txn_type,
+            party,
+            category,
+            payment_mode,
+            remark[:20], # Truncate remark for PDF
+            f"{amount_in:.2f}" if amount_in > 0 else '',
+            f"{amount_out:.2f}" if amount_out > 0 else '',
+            f"{balance:.2f}"
+        ])
+
+    doc = SimpleDocTemplate(fileobj, pagesize=landscape(letter))
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # Title
+    elements.append(Paragraph(f"Report: {cashbook.name}", styles['Title']))
+    # The PDF is cached until the cashbook changes, so it is labelled from the data, not the clock
+    elements.append(Paragraph(f"Transactions up to: {last_date or '-'}", styles['Normal']))
+    elements.append(Spacer(1, 20))
+    
+    # Summary
+    summary_data = [
+        ['Total In', 'Total Out', 'Net Balance'],
+        [f"{total_in:.2f}", f"{total_out:.2f}", f"{total_in - total_out:.2f}"]
+    ]
+    t_summary = Table(summary_data, colWidths=[100, 100, 100])
+    t_summary.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(t_summary)
+    elements.append(Spacer(1, 20))
+    
+    # Transactions Table
+    t = Table(table_data, colWidths=[60, 40, 80, 80, 60, 100, 60, 60, 70])
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ]))
+    elements.append(t)
+    
+    doc.build(elements)
+
+
+def write_csv(cashbook, fileobj):
+    for chunk in iter_csv(cashbook):
+        fileobj.write(chunk)
+
+
+def write_jsonl(cashbook, fileobj):
+    for chunk in iter_jsonl(cashbook):
+        fileobj.write(chunk)
+
+
+# format -> (writer(cashbook, fileobj), file extension, content type)
+FORMATS = {
+    'XLSX': (write_excel, 'xlsx', EXCEL_CONTENT_TYPE),
+    'PDF': (write_pdf, 'pdf', 'application/pdf'),
+    'CSV': (write_csv, 'csv', 'text/csv'),
+    'JSONL': (write_jsonl, 'jsonl', 'application/x-ndjson'),
+}
@@ -0,0 +1,151 @@
+"""
+Compiles transaction query params (duration presets, start_date/end_date and the
+row filters) into one normalized form shared by the transaction list and summaries.
+
+Dates become a half-open range [start, end) compared directly against the date
+column, so the (cashbook, transaction_date, ...) indexes apply; `__year`/`__month`
+lookups would wrap the column in EXTRACT and rule them out.
+"""
+import json
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .search import search_q
+
+ROW_FILTER_PARAMS = ('type', 'category', 'party', 'member', 'payment_mode', 'search')
+COMPILED_PARAMS = {'duration', 'start_date', 'end_date', *ROW_FILTER_PARAMS}
+
+
+def _add_months(day, months):
+    """First day of the month `months` after (or before) the month of `day`"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def duration_range(duration, today):
+    """
+    [start, end) of a duration preset; (None, None) for ALL_TIME or an unknown preset.
+    LAST_7_DAYS and LAST_30_DAYS have no end, so they include future-dated transactions.
+    """
+    month_start = today.replace(day=1)
+    if duration == 'TODAY':
+        return today, today + timedelta(days=1)
+    if duration == 'LAST_7_DAYS':
+        return today - timedelta(days=7), None
+    if duration == 'LAST_30_DAYS':
+        return today - timedelta(days=30), None
+    if duration == 'THIS_MONTH':
+        return month_start, _add_months(month_start, 1)
+    if duration == 'THIS_YEAR':
+        return date(today.year, 1, 1), date(today.year + 1, 1, 1)
+    if duration == 'LAST_QUARTER':
+        quarter_start = _add_months(month_start, -((today.month - 1) % 3))
+        return _add_months(quarter_start, -3), quarter_start
+    if duration == 'FINANCIAL_YEAR':
+        year_start = _add_months(month_start, -((today.month - settings.FINANCIAL_YEAR_START_MONTH) % 12))
+        return year_start, _add_months(year_start, 12)
+    return None, None
+
+
+def _parse_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Use the YYYY-MM-DD format.'})
+
+
+class TransactionFilter:
+    """
+    Normalized transaction filters: a half-open date range plus the row filters.
+    Build with compile_filters().
+    """
+
+    def __init__(self, start=None, end=None, **row_filters):
+        self.start = start
+        self.end = end
+        self.row_filters = {name: value for name, value in row_filters.items() if value}
+
+    @property
+    def has_row_filters(self):
+        """Whether individual transactions are needed (daily rollups only know dates)"""
+        return bool(self.row_filters)
+
+    @property
+    def is_empty(self):
+        return self.start is None and self.end is None and not self.row_filters
+
+    def date_q(self, field):
+        lookups = {}
+        if self.start is not None:
+            lookups[f'{field}__gte'] = self.start
+        if self.end is not None:
+            lookups[f'{field}__lt'] = self.end
+        return Q(**lookups)
+
+    def member_q(self, prefix=''):
+        member_id = self.row_filters.get('member')
+        if not member_id:
+            return Q()
+        from .models import Member
+        try:
+            members = Member.objects.filter(id=uuid.UUID(str(member_id)))
+        except ValueError:
+            # Invalid member ID matches no transactions
+            members = Member.objects.filter(id__isnull=True)
+        return Q(**{f'{prefix}created_by_id__in': members.values('user_id')})
+
+    def rows_q(self, prefix='', member=True):
+        """
+        All filters as a Q on Transaction, with lookups prefixed for use through a relation.
+        member=False leaves out the member filter, whose subquery a FilteredRelation
+        condition can't hold; apply member_q() separately then.
+        """
+        q = self.date_q(f'{prefix}transaction_date')
+        if member:
+            q &= self.member_q(prefix)
+        for name in ('type', 'category', 'party', 'payment_mode'):
+            if name in self.row_filters:
+                field = name if name == 'type' else f'{name}_id'
+                q &= Q(**{f'{prefix}{field}': self.row_filters[name]})
+        search = self.row_filters.get('search')
+        if search:
+            q &= search_q(search, prefix)
+        return q
+
+    def cache_key(self):
+        """Canonical form: presets and custom ranges selecting the same dates share a key"""
+        return json.dumps(
+            [
+                self.start.isoformat() if self.start else None,
+                self.end.isoformat() if self.end else None,
+                sorted((name, str(value)) for name, value in self.row_filters.items()),
+            ],
+            separators=(',', ':'),
+        )
+
+
+def compile_filters(params, today=None):
+    """
+    TransactionFilter from request params. A duration preset and a custom
+    start_date/end_date (both inclusive) narrow each other down.
+    """
+    today = today or timezone.localdate()
+    start, end = duration_range(params.get('duration'), today)
+
+    custom_start = _parse_date(params, 'start_date')
+    custom_end = _parse_date(params, 'end_date')
+    if custom_start is not None:
+        start = max(start, custom_start) if start else custom_start
+    if custom_end is not None:
+        custom_end += timedelta(days=1)
+        end = min(end, custom_end) if end else custom_end
+
+    return TransactionFilter(start, end, **{name: params.get(name) for name in ROW_FILTER_PARAMS})
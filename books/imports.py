@@ -0,0 +1,376 @@
+"""
+Bulk import of transactions from CSV or XLSX files, e.g. when moving a customer's
+history over from another bookkeeping tool.
+
+Files are read as a stream (csv over the upload, openpyxl in read-only mode) and
+written in chunks: COPY FROM STDIN on PostgreSQL, bulk_create elsewhere. Category,
+party and payment-mode names are resolved through per-business dictionaries and
+missing ones are created in bulk. The whole import is one database transaction.
+"""
+import csv
+import io
+import time
+import uuid
+import zipfile
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events, ledger, typeahead
+from .models import Cashbook, Category, Party, PaymentMode, Transaction
+
+IMPORT_CHUNK_SIZE = 5000
+
+# Column aliases (lowercased, spaces and dashes as underscores) -> field.
+# The headers written by exports.iter_csv/write_excel are all accepted, so exported files round-trip.
+COLUMNS = {
+    'date': 'date', 'transaction_date': 'date',
+    'time': 'time', 'transaction_time': 'time',
+    'type': 'type',
+    'amount': 'amount',
+    'cash_in': 'cash_in', 'amount_in': 'cash_in', 'in': 'cash_in',
+    'cash_out': 'cash_out', 'amount_out': 'cash_out', 'out': 'cash_out',
+    'remark': 'remark', 'remarks': 'remark', 'description': 'remark', 'note': 'remark',
+    'category': 'category',
+    'party': 'party',
+    'payment_mode': 'payment_mode', 'mode': 'payment_mode',
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M:%S %p')
+TYPES = {'IN': 'IN', 'CASH IN': 'IN', 'CREDIT': 'IN', 'OUT': 'OUT', 'CASH OUT': 'OUT', 'DEBIT': 'OUT'}
+# Exports write '-' for a missing party/category/payment mode
+EMPTY_NAMES = {'', '-'}
+
+# Column order of the COPY statement; search_vector (PostgreSQL) is a generated column
+COPY_COLUMNS = (
+    'id', 'cashbook_id', 'type', 'amount', 'remark', 'category_id', 'party_id', 'payment_mode_id',
+    'created_by_id', 'created_at', 'transaction_date', 'transaction_time', 'running_balance', 'updated_at',
+)
+
+
+class ImportRowError(ValueError):
+    """A row that can't be imported; `row` is its 1-based position in the file, header included"""
+
+    def __init__(self, row, message):
+        super().__init__(f'Row {row}: {message}')
+        self.row = row
+        self.message = message
+
+
+def read_rows(fileobj, file_format):
+    """Yield the rows of an uploaded CSV or XLSX file as tuples, header first"""
+    if file_format == 'XLSX':
+        try:
+            workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError):
+            raise ImportRowError(1, 'Not a valid XLSX file')
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif file_format == 'CSV':
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        reader = csv.reader(text)
+        try:
+            yield from reader
+        except (csv.Error, UnicodeDecodeError) as error:
+            raise ImportRowError(reader.line_num + 1, f'Not a valid UTF-8 CSV file ({error})')
+        finally:
+            text.detach()
+    else:
+        raise ValueError(f'Unsupported import format {file_format}')
+
+
+def detect_format(filename):
+    return 'XLSX' if filename.lower().endswith('.xlsx') else 'CSV'
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = _text(value)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid date "{value}"')
+
+
+def _parse_time(value):
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, dt_time):
+        return value
+    value = _text(value)
+    if not value:
+        return dt_time(0, 0)
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.upper(), fmt).time()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid time "{value}"')
+
+
+def _parse_amount(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+    try:
+        amount = Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount "{value}"')
+    if not amount.is_finite():
+        raise ValueError(f'Invalid amount "{value}"')
+    return amount.quantize(Decimal('0.01'))
+
+
+class _NameLookup:
+    """name (case-insensitive) -> id of one business's categories, parties or payment modes"""
+
+    def __init__(self, model, business_id, **create_defaults):
+        self.model = model
+        self.business_id = business_id
+        self.create_defaults = create_defaults
+        self.max_length = model._meta.get_field('name').max_length
+        self.ids = {
+            name.lower(): pk
+            for pk, name in model.objects.filter(business_id=business_id).order_by('name').values_list('id', 'name')
+        }
+        self.missing = {}
+        self.created = []
+
+    def resolve(self, name):
+        """Id for `name`, or a new id to be created by flush(); None for an empty name"""
+        if name in EMPTY_NAMES:
+            return None
+        key = name.lower()
+        pk = self.ids.get(key)
+        if pk is None:
+            if len(name) > self.max_length:
+                raise ValueError(f'{self.model._meta.verbose_name} "{name[:20]}..." is longer than {self.max_length} characters')
+            pk = self.ids[key] = uuid.uuid4()
+            self.missing[pk] = name
+        return pk
+
+    def flush(self):
+        """Create the names resolved since the last flush, so the transactions referencing them can be inserted"""
+        if not self.missing:
+            return
+        objects = [
+            self.model(id=pk, business_id=self.business_id, name=name, **self.create_defaults)
+            for pk, name in self.missing.items()
+        ]
+        self.model.objects.bulk_create(objects)
+        self.created += objects
+        self.missing = {}
+
+
+def _copy_value(value):
+    """A value in PostgreSQL COPY text format"""
+    if value is None:
+        return '\\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def _copy_transactions(transactions):
+    buffer = io.StringIO()
+    for txn in transactions:
+        buffer.write('\t'.join(_copy_value(getattr(txn, column)) for column in COPY_COLUMNS))
+        buffer.write('\n')
+    buffer.seek(0)
+    sql = 'COPY %s (%s) FROM STDIN' % (Transaction._meta.db_table, ', '.join(COPY_COLUMNS))
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _insert(transactions):
+    now = timezone.now()
+    for txn in transactions:
+        txn.updated_at = now
+    if connection.vendor == 'postgresql':
+        _copy_transactions(transactions)
+    else:
+        Transaction.objects.bulk_create(transactions, batch_size=1000)
+
+
+class _RowParser:
+    """Turns file rows into unsaved Transactions of one cashbook"""
+
+    def __init__(self, header, cashbook, user, lookups):
+        self.fields = {}
+        for position, name in enumerate(header or ()):
+            field = COLUMNS.get(_text(name).lower().replace(' ', '_').replace('-', '_'))
+            if field and field not in self.fields:
+                self.fields[field] = position
+        if 'date' not in self.fields:
+            raise ImportRowError(1, 'A Date column is required')
+        if 'amount' not in self.fields and not {'cash_in', 'cash_out'} & set(self.fields):
+            raise ImportRowError(1, 'An Amount or Cash In/Cash Out column is required')
+        if 'amount' in self.fields and 'type' not in self.fields:
+            raise ImportRowError(1, 'A Type column is required with an Amount column')
+        self.cashbook = cashbook
+        self.user = user
+        self.lookups = lookups
+        self.previous_moment = None
+        self.offset = 0
+
+    def value(self, row, field):
+        position = self.fields.get(field)
+        return row[position] if position is not None and position < len(row) else None
+
+    def parse(self, row):
+        txn_type, amount = self._type_and_amount(row)
+        if amount <= 0:
+            raise ValueError('Amount must be greater than 0')
+        day = _parse_date(self.value(row, 'date'))
+        at = _parse_time(self.value(row, 'time'))
+
+        # Rows sharing a timestamp (e.g. files without a time column) keep their file order,
+        # which the ledger would otherwise break by the random ids
+        moment = timezone.make_aware(datetime.combine(day, at))
+        if moment == self.previous_moment:
+            self.offset += 1
+        else:
+            self.previous_moment = moment
+            self.offset = 0
+
+        return Transaction(
+            cashbook_id=self.cashbook.id, type=txn_type, amount=amount,
+            remark=_text(self.value(row, 'remark')),
+            category_id=self.lookups['category'].resolve(_text(self.value(row, 'category'))),
+            party_id=self.lookups['party'].resolve(_text(self.value(row, 'party'))),
+            payment_mode_id=self.lookups['payment_mode'].resolve(_text(self.value(row, 'payment_mode'))),
+            created_by_id=self.user.id,
+            created_at=moment + timedelta(microseconds=self.offset),
+            transaction_date=day, transaction_time=at,
+        )
+
+    def _type_and_amount(self, row):
+        if 'amount' in self.fields:
+            txn_type = TYPES.get(_text(self.value(row, 'type')).upper())
+            if txn_type is None:
+                raise ValueError(f'Invalid type "{_text(self.value(row, "type"))}"')
+            amount = _parse_amount(self.value(row, 'amount'))
+            if amount is None:
+                raise ValueError('Amount is required')
+            return txn_type, amount
+
+        # Export layout: the amount is in either the Cash In or the Cash Out column
+        cash_in = _parse_amount(self.value(row, 'cash_in'))
+        cash_out = _parse_amount(self.value(row, 'cash_out'))
+        if bool(cash_in) == bool(cash_out):
+            raise ValueError('Exactly one of Cash In and Cash Out must be set')
+        return ('IN', cash_in) if cash_in else ('OUT', cash_out)
+
+
+def import_transactions(cashbook, user, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import `rows` (header first, see read_rows()) into `cashbook` as created by `user`.
+    Yields a progress dict after every chunk and a final one with 'done': True.
+    Raises ImportRowError for the first bad row; nothing is imported in that case.
+    Reading stops at the first blank row (exported spreadsheets have a totals footer after one).
+    """
+    started = time.monotonic()
+
+    def progress(rows_imported, **extra):
+        elapsed = time.monotonic() - started
+        return {
+            'rows': rows_imported,
+            'elapsed': round(elapsed, 2),
+            'rows_per_second': round(rows_imported / elapsed) if elapsed else 0,
+            **extra,
+        }
+
+    rows = iter(rows)
+    with transaction.atomic():
+        ledger.lock_cashbook(cashbook.id)
+        lookups = {
+            'category': _NameLookup(Category, cashbook.business_id, type='BOTH'),
+            'party': _NameLookup(Party, cashbook.business_id),
+            'payment_mode': _NameLookup(PaymentMode, cashbook.business_id),
+        }
+        parser = _RowParser(next(rows, None), cashbook, user, lookups)
+
+        # Balances are carried on from the current end of the ledger, which is exact for
+        # files in date order that come after the existing rows; rebalance() below fixes
+        # up anything else and writes nothing when they were already right
+        balance = (
+            Transaction.objects.filter(cashbook_id=cashbook.id)
+            .order_by(*['-' + field for field in ledger.LEDGER_ORDER])
+            .values_list('running_balance', flat=True)
+            .first()
+        ) or Decimal('0')
+        earliest = None
+        imported = 0
+        chunk = []
+
+        def write(chunk):
+            for lookup in lookups.values():
+                lookup.flush()
+            _insert(chunk)
+
+        for number, row in enumerate(rows, start=2):
+            if not any(_text(value) for value in row):
+                break
+            try:
+                txn = parser.parse(row)
+            except ImportRowError:
+                raise
+            except ValueError as error:
+                raise ImportRowError(number, str(error))
+            balance += ledger.signed_amount(txn.type, txn.amount)
+            txn.running_balance = balance
+            key = ledger.ledger_key(txn)
+            if earliest is None or key < earliest:
+                earliest = key
+            chunk.append(txn)
+            if len(chunk) >= chunk_size:
+                write(chunk)
+                imported += len(chunk)
+                chunk = []
+                yield progress(imported)
+        if chunk:
+            write(chunk)
+            imported += len(chunk)
+
+        if imported:
+            ledger.rebalance(cashbook.id, earliest)
+            ledger.rebuild_rollups([cashbook.id])
+            ledger.bump_data_version([cashbook.id])
+            # The rows' updated_at is older than this long transaction's commit, so delta
+            # sync cursors taken meanwhile may already be past them: make clients start over
+            Cashbook.objects.filter(pk=cashbook.id).update(sync_epoch=F('sync_epoch') + 1)
+            events.publish('transactions.imported', cashbook.id, count=imported)
+        created = {name: lookup.created for name, lookup in lookups.items()}
+        if any(created.values()):
+            # bulk_create skipped ShownInCashbooksMixin.save() and the typeahead signals
+            ledger.bump_business_data_version(cashbook.business_id)
+            transaction.on_commit(lambda: [
+                typeahead.record_saved(obj) for objects in created.values() for obj in objects
+            ])
+
+    yield progress(imported, done=True, created={
+        str(lookups[name].model._meta.verbose_name_plural).lower(): len(objects) for name, objects in created.items()
+    })
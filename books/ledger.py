@@ -0,0 +1,238 @@
+"""
+Bookkeeping that has to happen whenever a Transaction row is written.
+
+Every cashbook keeps a stored running balance on each transaction, ordered by
+LEDGER_ORDER. Writes only touch the rows from the changed position onwards, so
+appending today's entry costs two small queries instead of a full replay.
+Per-day totals are kept in CashbookDailyRollup so summaries don't scan raw rows,
+Cashbook.data_version is bumped so caches keyed on it go stale, and a change
+event is published for live dashboards (books.events).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Q, RowRange, Sum, When, Window
+from django.utils import timezone
+
+from . import events
+
+LEDGER_ORDER = ('transaction_date', 'created_at', 'id')
+REBALANCE_BATCH_SIZE = 1000
+
+
+def signed_amount(txn_type, amount):
+    """Effect of a transaction on the cashbook balance"""
+    return amount if txn_type == 'IN' else -amount
+
+
+def ledger_key(txn):
+    return (txn.transaction_date, txn.created_at, txn.pk)
+
+
+def _after_or_at(key):
+    date, created_at, pk = key
+    return (
+        Q(transaction_date__gt=date) |
+        Q(transaction_date=date, created_at__gt=created_at) |
+        Q(transaction_date=date, created_at=created_at, id__gte=pk)
+    )
+
+
+def signed_amount_expression():
+    """SQL counterpart of signed_amount()"""
+    return Case(
+        When(type='IN', then=F('amount')),
+        default=-F('amount'),
+        output_field=DecimalField(max_digits=19, decimal_places=2),
+    )
+
+
+def running_balance_window():
+    """
+    SUM(CASE type WHEN 'IN' ...) OVER (PARTITION BY cashbook ORDER BY LEDGER_ORDER)
+    for computing balances of an arbitrary filtered queryset in the database.
+    The queryset must not contain duplicate rows (no joins that fan out).
+    """
+    return Window(
+        Sum(signed_amount_expression()),
+        partition_by=[F('cashbook_id')],
+        order_by=[F(field).asc() for field in LEDGER_ORDER],
+        frame=RowRange(start=None, end=0),
+    )
+
+
+def lock_cashbook(cashbook_id):
+    """Serialize ledger writes per cashbook (no-op on SQLite, which locks the whole DB)"""
+    from .models import Cashbook
+    list(Cashbook.objects.select_for_update().filter(pk=cashbook_id).values_list('pk', flat=True))
+
+
+def rebalance(cashbook_id, since=None):
+    """
+    Recompute stored running balances of a cashbook starting at ledger key `since`
+    (or from the very first transaction when `since` is None).
+    Only rows whose balance actually changed are written back.
+    """
+    from .models import Transaction
+
+    transactions = Transaction.objects.filter(cashbook_id=cashbook_id)
+    balance = Decimal('0')
+    if since is not None:
+        previous = (
+            transactions.exclude(_after_or_at(since))
+            .order_by(*['-' + field for field in LEDGER_ORDER])
+            .values_list('running_balance', flat=True)
+            .first()
+        )
+        if previous is not None:
+            balance = previous
+        transactions = transactions.filter(_after_or_at(since))
+
+    # A moved balance is a change of the row for delta sync clients
+    now = timezone.now()
+    changed = []
+    rows = transactions.order_by(*LEDGER_ORDER).values_list('id', 'type', 'amount', 'running_balance')
+    for pk, txn_type, amount, stored in rows.iterator(chunk_size=REBALANCE_BATCH_SIZE):
+        balance += signed_amount(txn_type, amount)
+        if stored != balance:
+            changed.append(Transaction(id=pk, running_balance=balance, updated_at=now))
+        if len(changed) >= REBALANCE_BATCH_SIZE:
+            Transaction.objects.bulk_update(changed, ['running_balance', 'updated_at'])
+            changed = []
+    if changed:
+        Transaction.objects.bulk_update(changed, ['running_balance', 'updated_at'])
+
+
+def bump_data_version(cashbook_ids):
+    """Mark cashbooks as changed; cached reports and ETags are keyed on this version"""
+    from .models import Cashbook
+    Cashbook.objects.filter(pk__in=cashbook_ids).update(data_version=F('data_version') + 1)
+
+
+def bump_business_data_version(business_id):
+    """Names of a business's categories, parties etc. appear in all of its cashbooks"""
+    from .models import Cashbook
+    Cashbook.objects.filter(business_id=business_id).update(data_version=F('data_version') + 1)
+
+
+def _apply_rollup(cashbook_id, day, txn_type, amount, count):
+    """Add (or with negative amount/count, remove) a transaction's contribution to its daily rollup"""
+    from .models import CashbookDailyRollup
+
+    amount_in = amount if txn_type == 'IN' else 0
+    amount_out = amount if txn_type != 'IN' else 0
+    updated = CashbookDailyRollup.objects.filter(cashbook_id=cashbook_id, date=day).update(
+        total_in=F('total_in') + amount_in,
+        total_out=F('total_out') + amount_out,
+        count=F('count') + count,
+    )
+    if not updated:
+        # The cashbook row lock makes this create race-free
+        CashbookDailyRollup.objects.create(
+            cashbook_id=cashbook_id, date=day,
+            total_in=amount_in, total_out=amount_out, count=count,
+        )
+
+
+def rebuild_rollups(cashbook_ids=None):
+    """Recreate daily rollups from the raw transactions (all cashbooks when `cashbook_ids` is None)"""
+    from .models import CashbookDailyRollup, Transaction
+
+    rollups = CashbookDailyRollup.objects.all()
+    transactions = Transaction.objects.all()
+    if cashbook_ids is not None:
+        rollups = rollups.filter(cashbook_id__in=cashbook_ids)
+        transactions = transactions.filter(cashbook_id__in=cashbook_ids)
+
+    rows = (
+        transactions.order_by()
+        .values('cashbook_id', 'transaction_date')
+        .annotate(
+            total_in=Sum('amount', filter=Q(type='IN'), default=0),
+            total_out=Sum('amount', filter=Q(type='OUT'), default=0),
+            count=Count('id'),
+        )
+    )
+    rollups.delete()
+    created = 0
+    batch = []
+    for row in rows.iterator(chunk_size=REBALANCE_BATCH_SIZE):
+        batch.append(CashbookDailyRollup(
+            cashbook_id=row['cashbook_id'], date=row['transaction_date'],
+            total_in=row['total_in'], total_out=row['total_out'], count=row['count'],
+        ))
+        if len(batch) >= REBALANCE_BATCH_SIZE:
+            CashbookDailyRollup.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    CashbookDailyRollup.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+def record_save(txn, previous=None):
+    """
+    Propagate a created or updated transaction to stored balances and daily rollups.
+    `previous` is the row as it was before an update (a Transaction instance), or None on create.
+    """
+    bump_data_version({txn.cashbook_id, previous.cashbook_id} if previous is not None else {txn.cashbook_id})
+    if previous is None:
+        events.publish('transaction.created', txn.cashbook_id, txn.pk)
+    else:
+        events.publish('transaction.updated', txn.cashbook_id, txn.pk)
+        if previous.cashbook_id != txn.cashbook_id:
+            events.publish('transaction.updated', previous.cashbook_id, txn.pk)
+
+    if previous is not None and (
+        previous.cashbook_id == txn.cashbook_id and
+        ledger_key(previous) == ledger_key(txn) and
+        previous.type == txn.type and
+        previous.amount == txn.amount
+    ):
+        # Remark/category edits don't move any balance
+        return
+
+    cashbooks = {txn.cashbook_id: ledger_key(txn)}
+    if previous is not None:
+        old_key = ledger_key(previous)
+        if previous.cashbook_id != txn.cashbook_id:
+            cashbooks[previous.cashbook_id] = old_key
+        else:
+            cashbooks[txn.cashbook_id] = min(old_key, cashbooks[txn.cashbook_id])
+
+    for cashbook_id in cashbooks:
+        lock_cashbook(cashbook_id)
+    if previous is not None:
+        _apply_rollup(previous.cashbook_id, previous.transaction_date, previous.type, -previous.amount, -1)
+    _apply_rollup(txn.cashbook_id, txn.transaction_date, txn.type, txn.amount, 1)
+    for cashbook_id, since in cashbooks.items():
+        rebalance(cashbook_id, since)
+
+
+def record_bulk_create(transactions):
+    """Propagate transactions inserted together with bulk_create() to balances, rollups and versions"""
+    by_cashbook = defaultdict(list)
+    rollups = defaultdict(lambda: [Decimal('0'), 0])
+    for txn in transactions:
+        by_cashbook[txn.cashbook_id].append(txn)
+        totals = rollups[(txn.cashbook_id, txn.transaction_date, txn.type)]
+        totals[0] += txn.amount
+        totals[1] += 1
+
+    bump_data_version(list(by_cashbook))
+    # Fixed lock order so concurrent imports into overlapping cashbooks can't deadlock
+    for cashbook_id in sorted(by_cashbook, key=str):
+        lock_cashbook(cashbook_id)
+    for (cashbook_id, day, txn_type), (amount, count) in rollups.items():
+        _apply_rollup(cashbook_id, day, txn_type, amount, count)
+    for cashbook_id, created in by_cashbook.items():
+        rebalance(cashbook_id, min(ledger_key(txn) for txn in created))
+        events.publish('transactions.created', cashbook_id, count=len(created))
+
+
+def record_delete(txn):
+    """Propagate a deleted transaction (as it was stored) to the rows after it and its rollup"""
+    lock_cashbook(txn.cashbook_id)
+    bump_data_version([txn.cashbook_id])
+    events.publish('transaction.deleted', txn.cashbook_id, txn.pk)
+    _apply_rollup(txn.cashbook_id, txn.transaction_date, txn.type, -txn.amount, -1)
+    rebalance(txn.cashbook_id, ledger_key(txn))
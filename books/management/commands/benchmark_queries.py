@@ -0,0 +1,135 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+
+from books.filters import compile_filters
+from books.ledger import LEDGER_ORDER
+from books.search import search_q
+from books.models import Cashbook, Transaction
+from books.views import SummaryView
+from users.models import CustomUser
+
+NEWEST_FIRST = ['-' + field for field in LEDGER_ORDER]
+
+
+def legacy_transactions(user):
+    """Access scoping as it was: OR of two join paths plus DISTINCT"""
+    return (
+        Transaction.objects.filter(cashbook__business__owner=user) |
+        Transaction.objects.filter(cashbook__business__members__user=user)
+    ).distinct()
+
+
+def first_cashbook_id(user):
+    return Cashbook.objects.visible_to(user).order_by('id').values_list('id', flat=True).first()
+
+
+def summary(user, **params):
+    """The queryset SummaryView runs for one cashbook"""
+    return SummaryView()._summaries(user, compile_filters(params), [first_cashbook_id(user)])
+
+
+# name -> (description, callable(user) returning a queryset to evaluate)
+CASES = {
+    'access-legacy-page': (
+        'OR-joined access + DISTINCT, first page',
+        lambda user: legacy_transactions(user).order_by(*NEWEST_FIRST)[:50],
+    ),
+    'access-scoped-page': (
+        'visible_to() subquery access, first page',
+        lambda user: Transaction.objects.visible_to(user).order_by(*NEWEST_FIRST)[:50],
+    ),
+    'access-legacy-count': (
+        'OR-joined access + DISTINCT, COUNT',
+        lambda user: legacy_transactions(user),
+    ),
+    'access-scoped-count': (
+        'visible_to() subquery access, COUNT',
+        lambda user: Transaction.objects.visible_to(user),
+    ),
+    'ledger-page': (
+        'one cashbook, newest first (transaction list / cursor pagination)',
+        lambda user: Transaction.objects.visible_to(user).filter(
+            cashbook_id=first_cashbook_id(user)
+        ).order_by(*NEWEST_FIRST)[:50],
+    ),
+    'duration-count': (
+        'one cashbook, last 30 days, COUNT (paginated list with a duration filter)',
+        lambda user: Transaction.objects.filter(
+            cashbook_id=first_cashbook_id(user), transaction_date__gte=date.today() - timedelta(days=30)
+        ),
+    ),
+    'summary-type-month': (
+        'summary of one cashbook filtered by type, last 30 days',
+        lambda user: summary(user, type='OUT', duration='LAST_30_DAYS'),
+    ),
+    'search-legacy-count': (
+        'remark icontains scan (previous SearchFilter), COUNT',
+        lambda user: Transaction.objects.visible_to(user).filter(remark__icontains='rent 12'),
+    ),
+    'search-indexed-count': (
+        'full-text index, COUNT',
+        lambda user: Transaction.objects.visible_to(user).filter(search_q('rent 12')),
+    ),
+    'search-amount-legacy': (
+        'amount icontains (text cast of every row), first page',
+        lambda user: Transaction.objects.filter(
+            cashbook_id=first_cashbook_id(user), amount__icontains='2500'
+        ).order_by(*NEWEST_FIRST)[:50],
+    ),
+    'search-amount-range': (
+        'numeric amount range through the (cashbook, amount) index, first page',
+        lambda user: Transaction.objects.filter(
+            search_q('2500..2600'), cashbook_id=first_cashbook_id(user)
+        ).order_by(*NEWEST_FIRST)[:50],
+    ),
+    'summary-category': (
+        'summary of one cashbook filtered by category',
+        lambda user: summary(user, category=Transaction.objects.filter(
+            cashbook_id=first_cashbook_id(user)
+        ).values_list('category_id', flat=True).first()),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Time and EXPLAIN the hot query shapes (seed data first with seed_benchmark_data)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench_member_0', help='Username to run the queries as')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--case', action='append', dest='cases', help='Only run cases containing this text')
+        parser.add_argument('--no-explain', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found; run seed_benchmark_data first")
+
+        self.stdout.write(f'Database: {connection.vendor}, user: {user.username}, runs: {options["runs"]}\n')
+        for name, (description, build) in CASES.items():
+            if options['cases'] and not any(text in name for text in options['cases']):
+                continue
+            counting = name.endswith('-count')
+            timings = []
+            for _ in range(options['runs']):
+                # A fresh queryset each run, evaluated querysets cache their rows
+                queryset = build(user)
+                reset_queries()
+                started = time.perf_counter()
+                queryset.count() if counting else list(queryset)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {description}'))
+            self.stdout.write(
+                f'  median {statistics.median(timings):.2f} ms, min {min(timings):.2f} ms, max {max(timings):.2f} ms'
+            )
+            if not options['no_explain']:
+                plan = queryset.order_by().explain() if counting else queryset.explain()
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+            self.stdout.write('')
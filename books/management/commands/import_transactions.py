@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books import imports
+from books.models import Cashbook
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Import transactions from a CSV or XLSX file into a cashbook. Missing categories, '
+        'parties and payment modes are created; the import is all-or-nothing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('cashbook', help='Cashbook id')
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username recorded as creator of the transactions')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=imports.IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            cashbook = Cashbook.objects.get(pk=options['cashbook'])
+        except (Cashbook.DoesNotExist, ValueError):
+            raise CommandError(f"Cashbook {options['cashbook']} not found")
+        try:
+            user = CustomUser.objects.get(username=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found")
+
+        file_format = (options['format'] or imports.detect_format(options['path'])).upper()
+        with open(options['path'], 'rb') as fileobj:
+            try:
+                for progress in imports.import_transactions(
+                    cashbook, user, imports.read_rows(fileobj, file_format), chunk_size=options['chunk_size']
+                ):
+                    self.stdout.write(
+                        f"  {progress['rows']} rows in {progress['elapsed']:.1f}s "
+                        f"({progress['rows_per_second']:,} rows/s)"
+                    )
+            except imports.ImportRowError as error:
+                raise CommandError(f'{error}; nothing was imported')
+
+        created = ', '.join(f'{count} {name}' for name, count in progress['created'].items())
+        self.stdout.write(self.style.SUCCESS(f"Imported {progress['rows']} transactions into {cashbook.name} (created {created})"))
@@ -0,0 +1,95 @@
+import itertools
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from books.models import Cashbook
+from users.models import CustomUser
+
+# name -> callable(cashbook_id) returning the path requested
+ENDPOINTS = {
+    'summary': lambda cashbook_id: f'/api/v1/summary/?cashbook={cashbook_id}&duration=THIS_YEAR',
+    'reports': lambda cashbook_id: '/api/v1/reports/',
+    'transactions': lambda cashbook_id: f'/api/v1/transactions/?cashbook={cashbook_id}&type=OUT',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Send concurrent GETs of the read endpoints to a running server and report throughput and '
+        'latency, e.g. to compare gunicorn config.wsgi with uvicorn config.asgi:application on the '
+        'same database (seed it first with seed_benchmark_data)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server')
+        parser.add_argument('--user', default='bench_member_0', help='Username to send the requests as')
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight at once')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per endpoint')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', choices=sorted(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found; run seed_benchmark_data first")
+        cashbook_ids = list(Cashbook.objects.visible_to(user).order_by('id').values_list('id', flat=True))
+        if not cashbook_ids:
+            raise CommandError(f'{user.username} has no cashbooks')
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+        self.stdout.write(f"{options['url']}, concurrency {options['concurrency']}, {options['duration']:g}s each\n")
+        for name in options['endpoints'] or ENDPOINTS:
+            paths = itertools.cycle([ENDPOINTS[name](cashbook_id) for cashbook_id in cashbook_ids])
+            timings, statuses, elapsed = self._run(
+                options['url'], paths, headers, options['concurrency'], options['duration']
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if not timings:
+                self.stdout.write(f'  no responses: {dict(statuses)}')
+                continue
+            percentiles = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f'  {len(timings) / elapsed:.1f} req/s, latency p50 {percentiles[49]:.0f} ms, '
+                f'p95 {percentiles[94]:.0f} ms, p99 {percentiles[98]:.0f} ms, max {max(timings):.0f} ms'
+            )
+            self.stdout.write(f"  responses: {', '.join(f'{status}: {count}' for status, count in statuses.items())}")
+
+    def _run(self, base_url, paths, headers, concurrency, duration):
+        """(latencies in ms of successful requests, count per status, seconds taken)"""
+        timings, statuses = [], Counter()
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            while time.monotonic() < deadline:
+                with lock:
+                    path = next(paths)
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(urllib.request.Request(base_url + path, headers=headers)) as response:
+                        response.read()
+                        status = response.status
+                except urllib.error.HTTPError as error:
+                    status = error.code
+                except OSError as error:
+                    status = type(error).__name__
+                latency = (time.perf_counter() - started) * 1000
+                with lock:
+                    statuses[status] += 1
+                    if status == 200:
+                        timings.append(latency)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, statuses, time.monotonic() - started
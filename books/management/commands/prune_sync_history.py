@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from books.events import prune_events
+from books.sync import prune_idempotency_keys, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete sync tombstones, applied operation keys and change events past SYNC_TOMBSTONE_RETENTION_DAYS, '
+        'IDEMPOTENCY_KEY_RETENTION_DAYS and EVENTS_RETENTION_HOURS (run at least daily, e.g. from cron)'
+    )
+
+    def handle(self, *args, **options):
+        tombstones = prune_tombstones()
+        keys = prune_idempotency_keys()
+        change_events = prune_events()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {tombstones} sync tombstones, {keys} idempotency keys and {change_events} change events'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.access import sync_access
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized user/cashbook access table from business owners and members'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--business', action='append', dest='businesses', metavar='BUSINESS_ID',
+            help='Only rebuild this business (can be repeated). Defaults to all businesses.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = sync_access(business_ids=options['businesses'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} access rows'))
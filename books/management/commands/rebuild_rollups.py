@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.ledger import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily per-cashbook transaction rollups from raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cashbook', action='append', dest='cashbooks', metavar='CASHBOOK_ID',
+            help='Only rebuild this cashbook (can be repeated). Defaults to all cashbooks.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_rollups(options['cashbooks'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} daily rollups'))
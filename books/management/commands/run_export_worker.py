@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from books.export_jobs import (
+    claim_jobs, cleanup_expired_exports, init_worker_process, requeue_interrupted_jobs, run_export_job,
+)
+from books.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = 'Run queued report export jobs in a local process pool (run a single instance)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.EXPORT_WORKER_PROCESSES)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        requeued = requeue_interrupted_jobs()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} interrupted jobs')
+
+        running = {}
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_worker_process) as pool:
+            while True:
+                expired = cleanup_expired_exports()
+                if expired:
+                    self.stdout.write(f'Removed {expired} expired exports')
+
+                claimed = claim_jobs(processes - len(running))
+                # Pool processes may be forked on submit; they must not inherit an open connection
+                connections.close_all()
+                for job_id in claimed:
+                    running[pool.submit(run_export_job, job_id)] = job_id
+                    self.stdout.write(f'Started export {job_id}')
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as exc:
+                        # The pool process died before it could record the outcome
+                        finished_at = timezone.now()
+                        ExportJob.objects.filter(pk=job_id).update(
+                            status='FAILED', error=str(exc), finished_at=finished_at,
+                            expires_at=finished_at + settings.EXPORT_JOB_TTL,
+                        )
+                        status = 'FAILED'
+                    self.stdout.write(f'Export {job_id}: {status}')
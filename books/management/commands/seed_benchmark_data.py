@@ -0,0 +1,98 @@
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from books.access import sync_access
+from books.ledger import rebuild_rollups, signed_amount
+from books.models import Business, Cashbook, Category, Member, Party, PaymentMode, Transaction
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large synthetic dataset for query benchmarks. Users are named bench_owner_<n> '
+        '(one business each) and bench_member_<n> (member of every business).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=20)
+        parser.add_argument('--cashbooks', type=int, default=3, help='Cashbooks per business')
+        parser.add_argument('--members', type=int, default=5, help='Member users, each in every business')
+        parser.add_argument('--transactions', type=int, default=100000, help='Total transactions')
+        parser.add_argument('--days', type=int, default=730, help='Spread transaction dates over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        started = time.monotonic()
+
+        members = [
+            CustomUser.objects.get_or_create(username=f'bench_member_{i}', defaults={'full_name': f'Member {i}'})[0]
+            for i in range(options['members'])
+        ]
+        roles = ['ADMIN', 'EDITOR', 'VIEWER']
+        cashbooks = []
+        lookups = {}
+        for b in range(options['businesses']):
+            owner, _ = CustomUser.objects.get_or_create(username=f'bench_owner_{b}', defaults={'full_name': f'Owner {b}'})
+            business = Business.objects.create(name=f'Bench Business {b}', owner=owner)
+            Member.objects.bulk_create([
+                Member(user=user, business=business, role=roles[i % len(roles)]) for i, user in enumerate(members)
+            ])
+            lookups[business.id] = (
+                Category.objects.bulk_create([Category(business=business, name=f'Category {i}') for i in range(10)]),
+                Party.objects.bulk_create([Party(business=business, name=f'Party {i}') for i in range(20)]),
+                PaymentMode.objects.bulk_create([PaymentMode(business=business, name=f'Mode {i}') for i in range(5)]),
+                owner,
+            )
+            cashbooks += [
+                Cashbook.objects.create(business=business, name=f'Book {b}.{c}') for c in range(options['cashbooks'])
+            ]
+
+        per_cashbook = max(1, options['transactions'] // len(cashbooks))
+        start = timezone.now() - timedelta(days=options['days'])
+        step = timedelta(days=options['days']) / per_cashbook
+        written = 0
+        for cashbook in cashbooks:
+            categories, parties, modes, owner = lookups[cashbook.business_id]
+            balance = Decimal('0')
+            batch = []
+            for i in range(per_cashbook):
+                created_at = start + step * i
+                txn_type = 'IN' if rng.random() < 0.55 else 'OUT'
+                amount = Decimal(rng.randint(100, 500000)) / 100
+                balance += signed_amount(txn_type, amount)
+                batch.append(Transaction(
+                    cashbook=cashbook, type=txn_type, amount=amount,
+                    remark=f'{rng.choice(["Invoice", "Salary", "Rent", "Fuel", "Stock"])} {i}',
+                    category=rng.choice(categories), party=rng.choice(parties), payment_mode=rng.choice(modes),
+                    created_by=rng.choice(members) if members and rng.random() < 0.5 else owner,
+                    created_at=created_at, transaction_date=created_at.date(), transaction_time=created_at.time(),
+                    running_balance=balance,
+                ))
+                if len(batch) >= options['batch_size']:
+                    with transaction.atomic():
+                        Transaction.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+                    self._progress(written, per_cashbook * len(cashbooks), started)
+            Transaction.objects.bulk_create(batch)
+            written += len(batch)
+
+        rebuild_rollups([cashbook.id for cashbook in cashbooks])
+        # Members were bulk-created, which skips the access signals
+        sync_access(cashbook_ids=[cashbook.id for cashbook in cashbooks])
+        self._progress(written, written, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(cashbooks)} cashbooks and {written} transactions in {time.monotonic() - started:.1f}s'
+        ))
+
+    def _progress(self, done, total, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'  {done}/{total} transactions ({done / elapsed if elapsed else 0:,.0f} rows/s)')
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:55
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_running_balance(apps, schema_editor):
+    Transaction = apps.get_model('books', 'Transaction')
+    Cashbook = apps.get_model('books', 'Cashbook')
+    for cashbook_id in Cashbook.objects.values_list('id', flat=True).iterator():
+        balance = Decimal('0')
+        changed = []
+        rows = Transaction.objects.filter(cashbook_id=cashbook_id).order_by(
+            'transaction_date', 'created_at', 'id'
+        ).values_list('id', 'type', 'amount')
+        for pk, txn_type, amount in rows.iterator(chunk_size=1000):
+            balance += amount if txn_type == 'IN' else -amount
+            changed.append(Transaction(id=pk, running_balance=balance))
+        Transaction.objects.bulk_update(changed, ['running_balance'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='running_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19),
+        ),
+        migrations.RunPython(backfill_running_balance, migrations.RunPython.noop),
+    ]
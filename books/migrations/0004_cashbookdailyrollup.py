@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:58
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    Transaction = apps.get_model('books', 'Transaction')
+    CashbookDailyRollup = apps.get_model('books', 'CashbookDailyRollup')
+    rows = (
+        Transaction.objects.order_by()
+        .values('cashbook_id', 'transaction_date')
+        .annotate(
+            total_in=Sum('amount', filter=Q(type='IN'), default=0),
+            total_out=Sum('amount', filter=Q(type='OUT'), default=0),
+            count=Count('id'),
+        )
+    )
+    CashbookDailyRollup.objects.bulk_create(
+        [
+            CashbookDailyRollup(
+                cashbook_id=row['cashbook_id'], date=row['transaction_date'],
+                total_in=row['total_in'], total_out=row['total_out'], count=row['count'],
+            )
+            for row in rows.iterator(chunk_size=1000)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_transaction_running_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashbookDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('total_in', models.DecimalField(decimal_places=2, default=0, max_digits=19)),
+                ('total_out', models.DecimalField(decimal_places=2, default=0, max_digits=19)),
+                ('count', models.IntegerField(default=0)),
+                ('cashbook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='books.cashbook')),
+            ],
+            options={
+                'unique_together': {('cashbook', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
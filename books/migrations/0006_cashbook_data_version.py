@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashbook',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
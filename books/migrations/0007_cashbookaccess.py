@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:11
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_access(apps, schema_editor):
+    Cashbook = apps.get_model('books', 'Cashbook')
+    CashbookAccess = apps.get_model('books', 'CashbookAccess')
+    Member = apps.get_model('books', 'Member')
+    members = {}
+    for user_id, business_id, role in Member.objects.values_list('user_id', 'business_id', 'role'):
+        members.setdefault(business_id, []).append((user_id, role))
+    rows = []
+    for cashbook_id, business_id, owner_id in Cashbook.objects.values_list('id', 'business_id', 'business__owner_id'):
+        rows.append(CashbookAccess(user_id=owner_id, cashbook_id=cashbook_id, business_id=business_id, role='OWNER'))
+        rows += [
+            CashbookAccess(user_id=user_id, cashbook_id=cashbook_id, business_id=business_id, role=role)
+            for user_id, role in members.get(business_id, []) if user_id != owner_id
+        ]
+    CashbookAccess.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_cashbook_data_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashbookAccess',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('OWNER', 'Owner'), ('ADMIN', 'Admin'), ('EDITOR', 'Editor'), ('VIEWER', 'Viewer')], max_length=10)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cashbook_access', to='books.business')),
+                ('cashbook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='books.cashbook')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cashbook_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Cashbook access',
+                'unique_together': {('user', 'cashbook')},
+            },
+        ),
+        migrations.RunPython(backfill_access, migrations.RunPython.noop),
+    ]
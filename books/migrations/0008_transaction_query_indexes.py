@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Covering (INCLUDE) partial indexes are PostgreSQL-only, so they live outside Meta.indexes.
+# Summaries filtered by type and date read amounts straight from these (index-only scans).
+POSTGRES_INDEXES = {
+    'txn_in_date_amount_idx': "(cashbook_id, transaction_date) INCLUDE (amount) WHERE type = 'IN'",
+    'txn_out_date_amount_idx': "(cashbook_id, transaction_date) INCLUDE (amount) WHERE type = 'OUT'",
+}
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, definition in POSTGRES_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON books_transaction {definition}')
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_cashbookaccess'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashbook', 'transaction_date', 'created_at', 'id'], name='txn_cashbook_ledger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashbook', 'type', 'transaction_date'], name='txn_cashbook_type_date_idx'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE books_transaction ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(remark, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS txn_search_vector_idx ON books_transaction USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS txn_search_vector_idx",
+    "ALTER TABLE books_transaction DROP COLUMN IF EXISTS search_vector",
+]
+
+# FTS5 rowids live in a map table with an INTEGER PRIMARY KEY: rowids of
+# books_transaction itself (UUID primary key) may change on VACUUM.
+SQLITE_FORWARD = [
+    "CREATE TABLE books_transaction_fts_map ("
+    "rowid INTEGER PRIMARY KEY, transaction_id char(32) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE books_transaction_fts USING fts5(remark, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO books_transaction_fts_map (transaction_id) SELECT id FROM books_transaction",
+    "INSERT INTO books_transaction_fts (rowid, remark) "
+    "SELECT m.rowid, t.remark FROM books_transaction_fts_map m JOIN books_transaction t ON t.id = m.transaction_id",
+    """CREATE TRIGGER books_transaction_fts_insert AFTER INSERT ON books_transaction BEGIN
+        INSERT INTO books_transaction_fts_map (transaction_id) VALUES (new.id);
+        INSERT INTO books_transaction_fts (rowid, remark) VALUES (last_insert_rowid(), new.remark);
+    END""",
+    """CREATE TRIGGER books_transaction_fts_update AFTER UPDATE OF remark ON books_transaction
+    WHEN old.remark IS NOT new.remark BEGIN
+        UPDATE books_transaction_fts SET remark = new.remark
+        WHERE rowid = (SELECT rowid FROM books_transaction_fts_map WHERE transaction_id = new.id);
+    END""",
+    """CREATE TRIGGER books_transaction_fts_delete AFTER DELETE ON books_transaction BEGIN
+        DELETE FROM books_transaction_fts
+        WHERE rowid = (SELECT rowid FROM books_transaction_fts_map WHERE transaction_id = old.id);
+        DELETE FROM books_transaction_fts_map WHERE transaction_id = old.id;
+    END""",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS books_transaction_fts_insert",
+    "DROP TRIGGER IF EXISTS books_transaction_fts_update",
+    "DROP TRIGGER IF EXISTS books_transaction_fts_delete",
+    "DROP TABLE IF EXISTS books_transaction_fts",
+    "DROP TABLE IF EXISTS books_transaction_fts_map",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_transaction_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_transaction_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashbook', 'amount'], name='txn_cashbook_amount_idx'),
+        ),
+    ]
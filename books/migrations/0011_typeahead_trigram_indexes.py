@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Typeahead lookups (books.typeahead) on PostgreSQL; other databases use an in-process index.
+# Creating the extension needs a role allowed to (e.g. the database owner on PostgreSQL 13+).
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS party_name_trgm_idx ON books_party USING GIN (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS category_name_trgm_idx ON books_category USING GIN (name gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS party_name_trgm_idx",
+    "DROP INDEX IF EXISTS category_name_trgm_idx",
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_transaction_amount_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
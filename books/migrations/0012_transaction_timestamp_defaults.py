@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:36
+
+import books.models
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_typeahead_trigram_indexes'),
+    ]
+
+    # auto_now_add -> default only changes how Django fills the columns, not the schema.
+    # Applying it as a real AlterField would rebuild books_transaction on SQLite
+    # (dropping the full-text search triggers of migration 0009) for nothing.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='created_at',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='transaction_date',
+                    field=models.DateField(default=books.models.local_date, editable=False),
+                ),
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='transaction_time',
+                    field=models.TimeField(default=books.models.local_time, editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:43
+
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Adding a NOT NULL column rebuilds books_transaction on SQLite, which drops the
+# full-text search triggers of migration 0009
+SQLITE_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS books_transaction_fts_insert",
+    "DROP TRIGGER IF EXISTS books_transaction_fts_update",
+    "DROP TRIGGER IF EXISTS books_transaction_fts_delete",
+    """CREATE TRIGGER books_transaction_fts_insert AFTER INSERT ON books_transaction BEGIN
+        INSERT INTO books_transaction_fts_map (transaction_id) VALUES (new.id);
+        INSERT INTO books_transaction_fts (rowid, remark) VALUES (last_insert_rowid(), new.remark);
+    END""",
+    """CREATE TRIGGER books_transaction_fts_update AFTER UPDATE OF remark ON books_transaction
+    WHEN old.remark IS NOT new.remark BEGIN
+        UPDATE books_transaction_fts SET remark = new.remark
+        WHERE rowid = (SELECT rowid FROM books_transaction_fts_map WHERE transaction_id = new.id);
+    END""",
+    """CREATE TRIGGER books_transaction_fts_delete AFTER DELETE ON books_transaction BEGIN
+        DELETE FROM books_transaction_fts
+        WHERE rowid = (SELECT rowid FROM books_transaction_fts_map WHERE transaction_id = old.id);
+        DELETE FROM books_transaction_fts_map WHERE transaction_id = old.id;
+    END""",
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_transaction_timestamp_defaults'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Reversed last, after the column is dropped again
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('transaction', 'Transaction'), ('category', 'Category'), ('party', 'Party'), ('payment_mode', 'Payment mode')], max_length=12)),
+                ('object_id', models.UUIDField()),
+                ('cashbook_id', models.UUIDField(blank=True, null=True)),
+                ('business_id', models.UUIDField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cashbook',
+            name='sync_epoch',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='party',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='paymentmode',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['business', 'updated_at', 'id'], name='category_business_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='party',
+            index=models.Index(fields=['business', 'updated_at', 'id'], name='party_business_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentmode',
+            index=models.Index(fields=['business', 'updated_at', 'id'], name='paymode_business_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashbook', 'updated_at', 'id'], name='txn_cashbook_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['cashbook_id', 'deleted_at', 'id'], name='tombstone_cashbook_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['business_id', 'deleted_at', 'id'], name='tombstone_business_idx'),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
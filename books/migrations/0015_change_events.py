@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('cashbook_id', models.UUIDField()),
+                ('kind', models.CharField(choices=[('transaction.created', 'Transaction created'), ('transaction.updated', 'Transaction updated'), ('transaction.deleted', 'Transaction deleted'), ('transactions.created', 'Transactions created in bulk'), ('transactions.imported', 'Transactions imported')], max_length=24)),
+                ('object_id', models.UUIDField(blank=True, null=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,26 +1,113 @@
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 import uuid
 
+from . import ledger
+
+
+def local_date():
+    return timezone.localdate()
+
+
+def local_time():
+    return timezone.localtime().time()
+
+
+class BusinessQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Businesses the user owns or is a member of (IN subquery, so no DISTINCT is needed)"""
+        return self.filter(
+            models.Q(owner=user) |
+            models.Q(pk__in=Member.objects.filter(user=user).values('business_id'))
+        )
+
+
+class BusinessScopedQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Rows belonging to a business the user can access"""
+        return self.filter(business_id__in=Business.objects.visible_to(user).values('id'))
+
+
+class CashbookQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Cashbooks the user can access, from the materialized CashbookAccess table"""
+        return self.filter(pk__in=CashbookAccess.objects.filter(user=user).values('cashbook_id'))
+
+
+class TransactionQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Transactions in cashbooks the user can access"""
+        return self.filter(cashbook_id__in=CashbookAccess.objects.filter(user=user).values('cashbook_id'))
+
 class Business(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='businesses')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BusinessQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        updating = not self._state.adding
+        super().save(*args, **kwargs)
+        if updating:
+            # The business name is part of cashbook reports
+            ledger.bump_business_data_version(self.pk)
+
+class ShownInCashbooksMixin:
+    """
+    For business-level lookups (category, party, payment mode) whose names are shown in
+    transaction listings and reports: any change bumps the business's cashbook versions.
+    `sync_name` is both the SyncTombstone.model value and the Transaction foreign key.
+    """
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        ledger.bump_business_data_version(self.business_id)
+
+    def delete(self, *args, **kwargs):
+        pk, business_id = self.pk, self.business_id
+        with db_transaction.atomic():
+            # Transactions lose the reference through SET NULL, which doesn't touch updated_at
+            Transaction.objects.filter(**{self.sync_name: pk}).update(updated_at=timezone.now())
+            result = super().delete(*args, **kwargs)
+            SyncTombstone.objects.create(model=self.sync_name, object_id=pk, business_id=business_id)
+        ledger.bump_business_data_version(business_id)
+        return result
+
 class Cashbook(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='cashbooks')
     name = models.CharField(max_length=255)
     is_default = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Increases on every change to the cashbook or its transactions (see ledger.bump_data_version)
+    data_version = models.PositiveBigIntegerField(default=0, editable=False)
+    # Increases on writes that delta sync can't follow through updated_at (see books.sync)
+    sync_epoch = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CashbookQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} ({self.business.name})"
 
+    def save(self, *args, **kwargs):
+        updating = not self._state.adding
+        if updating and kwargs.get('update_fields') is None:
+            # Never write back a version that transaction writes may have moved since loading
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('data_version', 'sync_epoch')
+            ]
+        super().save(*args, **kwargs)
+        if updating:
+            ledger.bump_data_version([self.pk])
+
 class Member(models.Model):
     ROLE_CHOICES = [
         ('ADMIN', 'Admin'),
@@ -39,7 +126,26 @@ class Member(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
-class Category(models.Model):
+class CashbookAccess(models.Model):
+    """
+    One row per user and cashbook they can open, derived from Business.owner and Member
+    (see books.access). Role is OWNER or the member's role.
+    """
+    ROLE_CHOICES = [('OWNER', 'Owner')] + Member.ROLE_CHOICES
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cashbook_access')
+    cashbook = models.ForeignKey(Cashbook, on_delete=models.CASCADE, related_name='access')
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='cashbook_access')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+
+    class Meta:
+        unique_together = ('user', 'cashbook')
+        verbose_name_plural = "Cashbook access"
+
+    def __str__(self):
+        return f"{self.user_id} - {self.cashbook_id}: {self.role}"
+
+class Category(ShownInCashbooksMixin, models.Model):
     TYPE_CHOICES = [
         ('IN', 'Cash In'),
         ('OUT', 'Cash Out'),
@@ -49,29 +155,52 @@ class Category(models.Model):
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='categories')
     name = models.CharField(max_length=100)
     type = models.CharField(max_length=4, choices=TYPE_CHOICES, default='BOTH')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BusinessScopedQuerySet.as_manager()
+    sync_name = 'category'
 
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            models.Index(fields=['business', 'updated_at', 'id'], name='category_business_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-class Party(models.Model):
+class Party(ShownInCashbooksMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='parties')
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BusinessScopedQuerySet.as_manager()
+    sync_name = 'party'
 
     class Meta:
         verbose_name_plural = "Parties"
+        indexes = [
+            models.Index(fields=['business', 'updated_at', 'id'], name='party_business_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-class PaymentMode(models.Model):
+class PaymentMode(ShownInCashbooksMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='payment_modes')
     name = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BusinessScopedQuerySet.as_manager()
+    sync_name = 'payment_mode'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'updated_at', 'id'], name='paymode_business_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -85,19 +214,202 @@ class Transaction(models.Model):
     cashbook = models.ForeignKey(Cashbook, on_delete=models.CASCADE, related_name='transactions')
     type = models.CharField(max_length=3, choices=TYPE_CHOICES)
     amount = models.DecimalField(max_digits=19, decimal_places=2)
+    # Indexed for search (books.search). On SQLite the index is kept by triggers that a
+    # table rebuild drops: migrations altering this model there must recreate them
     remark = models.TextField(blank=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     party = models.ForeignKey(Party, on_delete=models.SET_NULL, null=True, blank=True)
     payment_mode = models.ForeignKey(PaymentMode, on_delete=models.SET_NULL, null=True, blank=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
-    created_at = models.DateTimeField(auto_now_add=True)
-    transaction_date = models.DateField(auto_now_add=True) # Added for filtering by date
-    transaction_time = models.TimeField(auto_now_add=True) # Added for filtering by time
+    # Defaults rather than auto_now_add so imports can keep historical dates
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    transaction_date = models.DateField(default=local_date, editable=False) # Added for filtering by date
+    transaction_time = models.TimeField(default=local_time, editable=False) # Added for filtering by time
+    # Cashbook balance after this transaction, in ledger.LEDGER_ORDER; maintained by save()/delete()
+    running_balance = models.DecimalField(max_digits=19, decimal_places=2, default=0, editable=False)
+    # Also set by ledger.rebalance() when the stored balance moves
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TransactionQuerySet.as_manager()
 
     class Meta:
         indexes = [
             models.Index(fields=['cashbook', 'created_at']),
+            # Listing order, keyset cursors and ledger.rebalance() (ledger.LEDGER_ORDER)
+            models.Index(fields=['cashbook', 'transaction_date', 'created_at', 'id'], name='txn_cashbook_ledger_idx'),
+            # Type and duration filters of summaries; PostgreSQL additionally gets covering
+            # per-type partial indexes (migration 0008)
+            models.Index(fields=['cashbook', 'type', 'transaction_date'], name='txn_cashbook_type_date_idx'),
+            # Numeric amount searches (search.parse_search)
+            models.Index(fields=['cashbook', 'amount'], name='txn_cashbook_amount_idx'),
+            # Delta sync keyset (books.sync)
+            models.Index(fields=['cashbook', 'updated_at', 'id'], name='txn_cashbook_updated_idx'),
         ]
 
     def __str__(self):
         return f"{self.type} - {self.amount}"
+
+    def save(self, *args, **kwargs):
+        # Queryset.update()/bulk_create()/delete() bypass this and delete(); call
+        # ledger.rebalance(), ledger.rebuild_rollups() and ledger.bump_data_version() after those
+        with db_transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Transaction.objects.filter(pk=self.pk).only(
+                    'cashbook_id', 'type', 'amount', 'transaction_date', 'created_at'
+                ).first()
+                if kwargs.get('update_fields') is None:
+                    # Never write back a balance that may have moved since this instance was loaded
+                    kwargs['update_fields'] = [
+                        field.name for field in self._meta.concrete_fields
+                        if not field.primary_key and field.name != 'running_balance'
+                    ]
+            super().save(*args, **kwargs)
+            ledger.record_save(self, previous)
+            if previous is not None and previous.cashbook_id != self.cashbook_id:
+                # Gone from the old cashbook for clients syncing only that one
+                SyncTombstone.objects.create(model='transaction', object_id=self.pk, cashbook_id=previous.cashbook_id)
+            self.running_balance = Transaction.objects.values_list('running_balance', flat=True).get(pk=self.pk)
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            # delete() clears the pk, so capture the stored ledger position first
+            stored = Transaction.objects.filter(pk=self.pk).only(
+                'cashbook_id', 'type', 'amount', 'transaction_date', 'created_at'
+            ).first()
+            result = super().delete(*args, **kwargs)
+            if stored is not None:
+                ledger.record_delete(stored)
+                SyncTombstone.objects.create(model='transaction', object_id=stored.pk, cashbook_id=stored.cashbook_id)
+        return result
+
+
+class SyncTombstone(models.Model):
+    """
+    A deleted transaction (scoped by cashbook) or category/party/payment mode (scoped by
+    business), reported by delta sync. A transaction moved to another cashbook leaves
+    one in its old cashbook. Cascade deletes of a whole cashbook or business
+    write none: sync clients see those as a change of scope and start over.
+    Pruned by the prune_sync_history command.
+    """
+    MODEL_CHOICES = [
+        ('transaction', 'Transaction'),
+        ('category', 'Category'),
+        ('party', 'Party'),
+        ('payment_mode', 'Payment mode'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    model = models.CharField(max_length=12, choices=MODEL_CHOICES)
+    object_id = models.UUIDField()
+    # Plain ids rather than foreign keys, the tombstone outlives what it refers to
+    cashbook_id = models.UUIDField(null=True, blank=True)
+    business_id = models.UUIDField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cashbook_id', 'deleted_at', 'id'], name='tombstone_cashbook_idx'),
+            models.Index(fields=['business_id', 'deleted_at', 'id'], name='tombstone_business_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The result of an operation applied through POST /sync/, by the key the client generated
+    for it, so that a replayed operation returns this instead of running again (see books.sync).
+    Pruned by the prune_sync_history command.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=100)
+    result = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id} {self.key}"
+
+
+class ChangeEvent(models.Model):
+    """
+    A committed change to a cashbook's transactions, for the server-sent events stream.
+    Every worker polls this table and fans new rows out to its connections (see books.events).
+    Pruned by the prune_sync_history command.
+    """
+    KIND_CHOICES = [
+        ('transaction.created', 'Transaction created'),
+        ('transaction.updated', 'Transaction updated'),
+        ('transaction.deleted', 'Transaction deleted'),
+        ('transactions.created', 'Transactions created in bulk'),
+        ('transactions.imported', 'Transactions imported'),
+    ]
+    # Ids are the stream's event ids, so this one keeps an increasing integer key
+    id = models.BigAutoField(primary_key=True)
+    # Plain id rather than a foreign key, events outlive deleted cashbooks until pruned
+    cashbook_id = models.UUIDField()
+    kind = models.CharField(max_length=24, choices=KIND_CHOICES)
+    # The transaction, for single-row changes
+    object_id = models.UUIDField(null=True, blank=True)
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.id} {self.kind} {self.cashbook_id}"
+
+
+class CashbookDailyRollup(models.Model):
+    """Per-day transaction totals of a cashbook, kept current by Transaction.save()/delete()"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    cashbook = models.ForeignKey(Cashbook, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    total_in = models.DecimalField(max_digits=19, decimal_places=2, default=0)
+    total_out = models.DecimalField(max_digits=19, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('cashbook', 'date')
+
+    def __str__(self):
+        return f"{self.cashbook_id} {self.date}: +{self.total_in} -{self.total_out}"
+
+
+class ExportJob(models.Model):
+    """A report export rendered in the background by the run_export_worker command"""
+    FORMAT_CHOICES = [
+        ('XLSX', 'Excel'),
+        ('PDF', 'PDF'),
+        ('CSV', 'CSV'),
+        ('JSONL', 'JSON Lines'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+        ('EXPIRED', 'Expired'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='export_jobs')
+    cashbook = models.ForeignKey(Cashbook, on_delete=models.CASCADE, related_name='export_jobs')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    format = models.CharField(max_length=5, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='PENDING')
+    file = models.FileField(upload_to='exports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.format} export of {self.cashbook_id} ({self.status})"
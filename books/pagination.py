@@ -0,0 +1,171 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q, Sum
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .ledger import LEDGER_ORDER, signed_amount, signed_amount_expression
+
+
+class TransactionCursorPagination(BasePagination):
+    """
+    Keyset pagination over (transaction_date, created_at, id), newest first.
+
+    Each page is a single index range scan, however deep the client has scrolled,
+    and no COUNT is run. When balances are not stored on the rows (filtered views),
+    the cursor carries the running balance of each listed cashbook at the page
+    boundary so the next page continues from them instead of re-reading older rows.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None, carry_balance=False):
+        queryset, position = self._start(queryset, request)
+        rows = list(self._page(queryset))
+        balances = None
+        if carry_balance and (position is None or position['balances'] is None):
+            balances = {row['cashbook_id']: row['total'] for row in self._totals(queryset)}
+        return self._finish(rows, position, carry_balance, balances)
+
+    async def apaginate_queryset(self, queryset, request, view=None, carry_balance=False):
+        """paginate_queryset() through the async ORM"""
+        queryset, position = self._start(queryset, request)
+        rows = [row async for row in self._page(queryset)]
+        balances = None
+        if carry_balance and (position is None or position['balances'] is None):
+            balances = {row['cashbook_id']: row['total'] async for row in self._totals(queryset)}
+        return self._finish(rows, position, carry_balance, balances)
+
+    def _start(self, queryset, request):
+        self.request = request
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._before(position))
+        return queryset, position
+
+    def _page(self, queryset):
+        return queryset.order_by(*['-' + field for field in LEDGER_ORDER])[:self.page_size + 1]
+
+    def _totals(self, queryset):
+        """Per cashbook, the sum of the matching rows not yet listed: the balance of its next row"""
+        return queryset.order_by().values('cashbook_id').annotate(total=Sum(signed_amount_expression()))
+
+    def _finish(self, rows, position, carry_balance, totals):
+        """
+        Trim the extra row fetched to detect a next page and, with `carry_balance`, set the
+        running balances, counting each cashbook down from the cursor's balance (or from
+        `totals` when the cursor has none, e.g. on the first page)
+        """
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        self.next_balances = None
+        if carry_balance:
+            if position is not None and position['balances'] is not None:
+                balances = dict(position['balances'])
+            else:
+                balances = dict(totals)
+            for txn in rows:
+                balance = balances.get(txn.cashbook_id, Decimal('0'))
+                txn.running_balance = balance
+                balances[txn.cashbook_id] = balance - signed_amount(txn.type, txn.amount)
+            self.next_balances = balances
+
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor()
+        )
+
+    def encode_cursor(self):
+        payload = {
+            'd': self.last.transaction_date.isoformat(),
+            'c': self.last.created_at.isoformat(),
+            'i': str(self.last.pk),
+        }
+        if self.next_balances is not None:
+            payload['b'] = {str(cashbook_id): str(balance) for cashbook_id, balance in self.next_balances.items()}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return {
+                'date': date.fromisoformat(payload['d']),
+                'created_at': datetime.fromisoformat(payload['c']),
+                'id': UUID(payload['i']),
+                # Cursors from before balances were kept per cashbook recompute them
+                'balances': {
+                    UUID(cashbook_id): Decimal(balance) for cashbook_id, balance in payload['b'].items()
+                } if isinstance(payload.get('b'), dict) else None,
+            }
+        except (TypeError, ValueError, KeyError, InvalidOperation, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _before(self, position):
+        """Rows strictly older than the cursor position"""
+        return (
+            Q(transaction_date__lt=position['date']) |
+            Q(transaction_date=position['date'], created_at__lt=position['created_at']) |
+            Q(transaction_date=position['date'], created_at=position['created_at'], id__lt=position['id'])
+        )
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """The default page number pagination, plus apaginate_queryset() for async views"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the COUNT and the page rows read through the async ORM"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property: set it so the paginator doesn't COUNT synchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+        self.page.object_list = [row async for row in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class ReportCache:
+    """
+    Thread-safe in-process LRU of rendered report bytes, capped by total size.
+    Keys are (cashbook_id, format, data_version), so a cashbook change makes its
+    old entries unreachable; they are dropped on the next store or by LRU eviction.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, cashbook_id, report_format, version):
+        key = (cashbook_id, report_format, version)
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+            return content
+
+    def set(self, cashbook_id, report_format, version, content):
+        if len(content) > self.max_entry_bytes:
+            return False
+        key = (cashbook_id, report_format, version)
+        with self._lock:
+            for stale in [k for k in self._entries if k[:2] == key[:2] and k != key]:
+                self._remove(stale)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = content
+            self._size += len(content)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        self._size -= len(self._entries.pop(key))
+
+
+report_cache = ReportCache(settings.REPORT_CACHE_MAX_BYTES, settings.REPORT_CACHE_MAX_ENTRY_BYTES)
@@ -1,20 +1,18 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import Sum, Q, F, Value, CharField
+from django.db.models import Sum, Max, Q, F, Value, CharField, DecimalField, OuterRef, Subquery
 from django.db.models.functions import Coalesce
-from django.http import HttpResponse
-from .models import Cashbook, Transaction, Member
-from .serializers import CashbookSerializer, TransactionSerializer
-
-import openpyxl
-from openpyxl.utils import get_column_letter
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from .models import Cashbook, CashbookDailyRollup, Transaction, Member, ExportJob
+from .serializers import CashbookSerializer, TransactionSerializer, ExportJobSerializer
+from .ledger import LEDGER_ORDER
+from .access import AccessResolver
+from . import conditional, exports
+from .report_cache import report_cache
+
 from io import BytesIO
-from datetime import datetime
+import tempfile
 
 class ReportsViewSet(viewsets.GenericViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -22,42 +20,53 @@ class ReportsViewSet(viewsets.GenericViewSet):
     def get_queryset(self):
         """Get cashbooks user has access to"""
         user = self.request.user
-        return Cashbook.objects.filter(
-            Q(business__owner=user) | 
-            Q(business__members__user=user)
-        ).distinct()
+        return Cashbook.objects.visible_to(user)
 
     def list(self, request):
         """List all cashbooks with summary stats"""
-        cashbooks = self.get_queryset()
-        data = []
-        
-        for cashbook in cashbooks:
-            # Calculate totals
-            total_in = Transaction.objects.filter(cashbook=cashbook, type='IN').aggregate(Sum('amount'))['amount__sum'] or 0
-            total_out = Transaction.objects.filter(cashbook=cashbook, type='OUT').aggregate(Sum('amount'))['amount__sum'] or 0
-            net_balance = total_in - total_out
-            
-            last_txn = Transaction.objects.filter(cashbook=cashbook).order_by('-created_at').first()
-            last_updated = last_txn.created_at if last_txn else cashbook.created_at
-
-            data.append({
-                'id': cashbook.id,
-                'name': cashbook.name,
-                'business_name': cashbook.business.name,
-                'total_in': total_in,
-                'total_out': total_out,
-                'net_balance': net_balance,
-                'last_updated': last_updated
-            })
-            
-        return Response(data)
+        etag = conditional.compute_etag(request, 'reports', conditional.cashbook_versions(request.user))
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
+        data = [self._summary_row(cashbook) for cashbook in self._summary_queryset()]
+        response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def _summary_queryset(self):
+        # One query regardless of how many cashbooks the user can see: totals come
+        # from the daily rollups and the last activity from the (cashbook, created_at) index
+        rollups = CashbookDailyRollup.objects.filter(cashbook=OuterRef('pk')).order_by().values('cashbook')
+        last_created = Transaction.objects.filter(cashbook=OuterRef('pk')).order_by().values('cashbook')
+        amount_field = DecimalField(max_digits=19, decimal_places=2)
+        return self.get_queryset().select_related('business').annotate(
+            total_in=Coalesce(
+                Subquery(rollups.annotate(total=Sum('total_in')).values('total')), Value(0), output_field=amount_field
+            ),
+            total_out=Coalesce(
+                Subquery(rollups.annotate(total=Sum('total_out')).values('total')), Value(0), output_field=amount_field
+            ),
+            last_transaction_at=Subquery(last_created.annotate(last=Max('created_at')).values('last')),
+        )
+
+    @staticmethod
+    def _summary_row(cashbook):
+        return {
+            'id': cashbook.id,
+            'name': cashbook.name,
+            'business_name': cashbook.business.name,
+            'total_in': cashbook.total_in,
+            'total_out': cashbook.total_out,
+            'net_balance': cashbook.total_in - cashbook.total_out,
+            'last_updated': cashbook.last_transaction_at or cashbook.created_at
+        }
 
     def _get_report_data(self, cashbook):
         """Helper to get transactions with running balance"""
-        transactions = Transaction.objects.filter(cashbook=cashbook).order_by('transaction_date', 'created_at')
+        transactions = Transaction.objects.filter(cashbook=cashbook).select_related(
+            'party', 'category', 'payment_mode'
+        ).order_by(*LEDGER_ORDER)
         
-        running_balance = 0
         txns_data = []
         
         total_in = 0
@@ -65,10 +74,8 @@ class ReportsViewSet(viewsets.GenericViewSet):
 
         for txn in transactions:
             if txn.type == 'IN':
-                running_balance += txn.amount
                 total_in += txn.amount
             else:
-                running_balance -= txn.amount
                 total_out += txn.amount
             
             txns_data.append({
@@ -81,7 +88,7 @@ class ReportsViewSet(viewsets.GenericViewSet):
                 'remark': txn.remark,
                 'amount_in': txn.amount if txn.type == 'IN' else 0,
                 'amount_out': txn.amount if txn.type == 'OUT' else 0,
-                'running_balance': running_balance
+                'running_balance': txn.running_balance
             })
             
         return {
@@ -98,122 +105,102 @@ class ReportsViewSet(viewsets.GenericViewSet):
         if not cashbook:
              return Response({'error': 'Cashbook not found'}, status=404)
 
+        etag = conditional.compute_etag(request, 'report', [(str(cashbook.id), cashbook.data_version)])
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
         report_data = self._get_report_data(cashbook)
         # Reverse transactions for display (newest first) but keep calculation order correct
         report_data['transactions'].reverse()
         
-        return Response(report_data)
+        response = Response(report_data)
+        response['ETag'] = etag
+        return response
+
+    def _cached_report_response(self, cashbook, report_format, content):
+        _, extension, content_type = exports.FORMATS[report_format]
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{cashbook.name}_report.{extension}"'
+        return response
 
     @action(detail=True, methods=['get'], url_path='export_excel')
     def export_excel(self, request, pk=None):
         cashbook = self.get_object()
-        data = self._get_report_data(cashbook)
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = f"{cashbook.name} Report"
-        
-        # Headers
-        headers = ['Date', 'Type', 'Party', 'Category', 'Payment Mode', 'Remark', 'Cash In', 'Cash Out', 'Balance']
-        ws.append(headers)
-        
-        # Style headers
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col)
-            cell.font = openpyxl.styles.Font(bold=True)
-        
-        # Data
-        for txn in data['transactions']:
-            ws.append([
-                txn['date'],
-                txn['type'],
-                txn['party'],
-                txn['category'],
-                txn['payment_mode'],
-                txn['remark'],
-                txn['amount_in'] if txn['amount_in'] > 0 else '',
-                txn['amount_out'] if txn['amount_out'] > 0 else '',
-                txn['running_balance']
-            ])
-            
-        # Summary at bottom
-        last_row = len(data['transactions']) + 3
-        ws.cell(row=last_row, column=6, value="TOTALS").font = openpyxl.styles.Font(bold=True)
-        ws.cell(row=last_row, column=7, value=data['total_in']).font = openpyxl.styles.Font(bold=True)
-        ws.cell(row=last_row, column=8, value=data['total_out']).font = openpyxl.styles.Font(bold=True)
-        ws.cell(row=last_row, column=9, value=data['net_balance']).font = openpyxl.styles.Font(bold=True)
-
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="{cashbook.name}_report.xlsx"'
-        
-        wb.save(response)
+        cached = report_cache.get(cashbook.id, 'XLSX', cashbook.data_version)
+        if cached is not None:
+            return self._cached_report_response(cashbook, 'XLSX', cached)
+
+        # Rows are streamed into a write-only workbook; the file spills to disk
+        # past SPOOL_MAX_MEMORY and is streamed to the client from there
+        output = tempfile.SpooledTemporaryFile(max_size=exports.SPOOL_MAX_MEMORY)
+        exports.write_excel(cashbook, output)
+        size = output.tell()
+        output.seek(0)
+
+        if size <= report_cache.max_entry_bytes:
+            content = output.read()
+            output.close()
+            report_cache.set(cashbook.id, 'XLSX', cashbook.data_version, content)
+            return self._cached_report_response(cashbook, 'XLSX', content)
+
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=f"{cashbook.name}_report.xlsx",
+            content_type=exports.EXCEL_CONTENT_TYPE,
+        )
+
+    @action(detail=True, methods=['get'], url_path='export_csv')
+    def export_csv(self, request, pk=None):
+        cashbook = self.get_object()
+        response = StreamingHttpResponse(exports.iter_csv(cashbook), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{cashbook.name}_report.csv"'
+        return response
+
+    @action(detail=True, methods=['get'], url_path='export_jsonl')
+    def export_jsonl(self, request, pk=None):
+        cashbook = self.get_object()
+        response = StreamingHttpResponse(exports.iter_jsonl(cashbook), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{cashbook.name}_report.jsonl"'
         return response
 
     @action(detail=True, methods=['get'], url_path='export_pdf')
     def export_pdf(self, request, pk=None):
         cashbook = self.get_object()
-        data = self._get_report_data(cashbook)
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(letter))
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        elements.append(Paragraph(f"Report: {cashbook.name}", styles['Title']))
-        elements.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", styles['Normal']))
-        elements.append(Spacer(1, 20))
-        
-        # Summary
-        summary_data = [
-            ['Total In', 'Total Out', 'Net Balance'],
-            [f"{data['total_in']:.2f}", f"{data['total_out']:.2f}", f"{data['net_balance']:.2f}"]
-        ]
-        t_summary = Table(summary_data, colWidths=[100, 100, 100])
-        t_summary.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(t_summary)
-        elements.append(Spacer(1, 20))
-        
-        # Transactions Table
-        table_data = [['Date', 'Type', 'Party', 'Category', 'Mode', 'Remark', 'In', 'Out', 'Balance']]
-        
-        for txn in data['transactions']:
-            table_data.append([
-                str(txn['date']),
-                txn['type'],
-                txn['party'],
-                txn['category'],
-                txn['payment_mode'],
-                txn['remark'][:20], # Truncate remark for PDF
-                f"{txn['amount_in']:.2f}" if txn['amount_in'] > 0 else '',
-                f"{txn['amount_out']:.2f}" if txn['amount_out'] > 0 else '',
-                f"{txn['running_balance']:.2f}"
-            ])
-            
-        t = Table(table_data, colWidths=[60, 40, 80, 80, 60, 100, 60, 60, 70])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ]))
-        elements.append(t)
-        
-        doc.build(elements)
-        buffer.seek(0)
-        
-        response = HttpResponse(buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{cashbook.name}_report.pdf"'
-        return response
+        content = report_cache.get(cashbook.id, 'PDF', cashbook.data_version)
+        if content is None:
+            buffer = BytesIO()
+            exports.write_pdf(cashbook, buffer)
+            content = buffer.getvalue()
+            report_cache.set(cashbook.id, 'PDF', cashbook.data_version, content)
+        
+        return self._cached_report_response(cashbook, 'PDF', content)
+
+
+class ExportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Submit an export, poll its status, then download the artifact once it is DONE"""
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(requested_by=self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        cashbook = serializer.validated_data['cashbook']
+        if AccessResolver.for_request(self.request).cashbook_role(cashbook.id) is None:
+            raise permissions.PermissionDenied("You do not have access to this cashbook.")
+        serializer.save(requested_by=user, business_id=cashbook.business_id)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'DONE' or not job.file:
+            return Response({'error': f'Export is {job.status.lower()}', 'status': job.status}, status=409)
+        _, extension, content_type = exports.FORMATS[job.format]
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=f"{job.cashbook.name}_report.{extension}",
+            content_type=content_type,
+        )
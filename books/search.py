@@ -0,0 +1,210 @@
+"""
+Indexed transaction search.
+
+Remarks are searched through a full-text index:
+PostgreSQL: a generated `search_vector` tsvector column with a GIN index.
+SQLite: an FTS5 table (books_transaction_fts) whose rowids map to transactions
+through books_transaction_fts_map; triggers keep both in sync with every write,
+including bulk_create() and queryset.update().
+Both are created by migration 0009. Other databases fall back to icontains.
+A migration that rebuilds books_transaction on SQLite drops the triggers and must
+recreate them; check_fts_triggers() reports them missing.
+
+Every search word is matched as a prefix ("inv" finds "Invoice") and all words must
+match. Numeric terms become predicates on amount (see parse_search()).
+"""
+import re
+from decimal import Decimal
+
+from django.core import checks
+from django.db import connection, connections
+from django.db.models import CharField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from rest_framework.filters import BaseFilterBackend
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+# The database wraps matches in these control characters; render_highlight() escapes
+# the remark and only then turns them into the tags above
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+SQLITE_FTS_TRIGGERS = {'books_transaction_fts_insert', 'books_transaction_fts_update', 'books_transaction_fts_delete'}
+# ~250 matches amounts within 5% of 250
+APPROXIMATE_TOLERANCE = Decimal('0.05')
+
+_NUMBER = r'(\d+(?:\.\d+)?)'
+_RANGE = re.compile(rf'{_NUMBER}\.\.{_NUMBER}')
+_COMPARISON = re.compile(rf'(>=|<=|>|<){_NUMBER}')
+_APPROXIMATE = re.compile(rf'~{_NUMBER}')
+_PLAIN = re.compile(_NUMBER)
+_LOOKUPS = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}
+
+_SQLITE_MATCH = (
+    "FROM books_transaction_fts JOIN books_transaction_fts_map m ON m.rowid = books_transaction_fts.rowid "
+    "WHERE books_transaction_fts MATCH %s"
+)
+
+
+def _words(text):
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def parse_search(search):
+    """
+    Split a search into (remark words, plain numbers, amount lookups).
+
+    `100..500` (inclusive), `>1000`, `>=`, `<`, `<=` and `~250` only constrain the amount.
+    A plain number matches a remark word starting with it, or the amount: `250` any amount
+    from 250 up to (excluding) 251, `250.5` exactly 250.50.
+    Thousands separators are ignored. Everything else is searched in remarks.
+    """
+    words, numbers, amount_lookups = [], [], []
+    for term in search.split():
+        number_term = term.replace(',', '')
+        if match := _RANGE.fullmatch(number_term):
+            low, high = sorted([Decimal(match[1]), Decimal(match[2])])
+            amount_lookups.append({'amount__gte': low, 'amount__lte': high})
+        elif match := _COMPARISON.fullmatch(number_term):
+            amount_lookups.append({f'amount__{_LOOKUPS[match[1]]}': Decimal(match[2])})
+        elif match := _APPROXIMATE.fullmatch(number_term):
+            amount = Decimal(match[1])
+            amount_lookups.append({
+                'amount__gte': amount * (1 - APPROXIMATE_TOLERANCE),
+                'amount__lte': amount * (1 + APPROXIMATE_TOLERANCE),
+            })
+        elif _PLAIN.fullmatch(number_term):
+            numbers.append(number_term)
+        else:
+            words += _words(term)
+    return words, numbers, amount_lookups
+
+
+def is_indexed():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def _match_query(words):
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f'{word}:*' for word in words)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matching_ids(words):
+    """Subquery of the ids of transactions whose remark contains all `words` (as prefixes)"""
+    query = _match_query(words)
+    if connection.vendor == 'postgresql':
+        return RawSQL(
+            "SELECT id FROM books_transaction WHERE search_vector @@ to_tsquery('simple', %s)", [query]
+        )
+    return RawSQL(f'SELECT m.transaction_id {_SQLITE_MATCH}', [query])
+
+
+def _remark_q(words, prefix):
+    if not is_indexed():
+        return Q(**{f'{prefix}remark__icontains': ' '.join(words)})
+    return Q(**{f'{prefix}id__in': matching_ids(words)})
+
+
+def _number_q(number, prefix):
+    amount = Decimal(number)
+    if '.' in number:
+        amount_q = Q(**{f'{prefix}amount': amount})
+    else:
+        amount_q = Q(**{f'{prefix}amount__gte': amount, f'{prefix}amount__lt': amount + 1})
+    return amount_q | _remark_q(_words(number), prefix)
+
+
+def search_q(search, prefix=''):
+    """Q matching transactions by remark and amount; nothing for a search without terms (e.g. `"`)"""
+    words, numbers, amount_lookups = parse_search(search)
+    if not (words or numbers or amount_lookups):
+        # pk IS NULL: matches no row, and unlike pk__in=[] also works in join conditions
+        return Q(**{f'{prefix}pk': None})
+    q = Q()
+    if words:
+        q &= _remark_q(words, prefix)
+    for number in numbers:
+        q &= _number_q(number, prefix)
+    for lookups in amount_lookups:
+        q &= Q(**{f'{prefix}{lookup}': value for lookup, value in lookups.items()})
+    return q
+
+
+def rank_expression(words):
+    """Relevance of each listed transaction (higher is better); evaluated per output row"""
+    query = _match_query(words)
+    if connection.vendor == 'postgresql':
+        return RawSQL(
+            "ts_rank(books_transaction.search_vector, to_tsquery('simple', %s))", [query],
+            output_field=FloatField(),
+        )
+    return RawSQL(
+        f'(SELECT -bm25(books_transaction_fts) {_SQLITE_MATCH} AND m.transaction_id = books_transaction.id)',
+        [query], output_field=FloatField(),
+    )
+
+
+def highlight_expression(words):
+    """The remark with matched words marked up for render_highlight()"""
+    query = _match_query(words)
+    if connection.vendor == 'postgresql':
+        return RawSQL(
+            "ts_headline('simple', books_transaction.remark, to_tsquery('simple', %s), %s)",
+            [query, f'StartSel={_MATCH_START}, StopSel={_MATCH_END}, HighlightAll=true'],
+            output_field=CharField(),
+        )
+    return RawSQL(
+        f"(SELECT highlight(books_transaction_fts, 0, %s, %s) "
+        f"{_SQLITE_MATCH} AND m.transaction_id = books_transaction.id)",
+        [_MATCH_START, _MATCH_END, query], output_field=CharField(),
+    )
+
+
+def render_highlight(value):
+    """HTML of a highlight_expression() value: the escaped remark with matches in <mark> tags"""
+    return escape(value).replace(_MATCH_START, HIGHLIGHT_START).replace(_MATCH_END, HIGHLIGHT_END)
+
+
+def check_fts_triggers(app_configs, databases=None, **kwargs):
+    """
+    SQLite drops a table's triggers when a migration rebuilds it, as it does for most
+    field changes on books_transaction; the FTS index would then silently go stale.
+    """
+    errors = []
+    for alias in databases or []:
+        db = connections[alias]
+        if db.vendor != 'sqlite':
+            continue
+        with db.cursor() as cursor:
+            if 'books_transaction_fts' not in db.introspection.table_names(cursor):
+                continue  # Not migrated yet
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'books_transaction'")
+            missing = SQLITE_FTS_TRIGGERS - {name for name, in cursor.fetchall()}
+        if missing:
+            errors.append(checks.Error(
+                f"Search index triggers missing on books_transaction: {', '.join(sorted(missing))}",
+                hint='Recreate them in the migration that rebuilt the table, as 0013_delta_sync does.',
+                id='books.E001',
+            ))
+    return errors
+
+
+class TransactionSearchFilter(BaseFilterBackend):
+    """
+    ?search= for the transaction list. Remark matches get search_rank and
+    search_highlight annotations; ?ordering=relevance sorts by rank.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        search = request.query_params.get(self.search_param, '').strip()
+        if not search:
+            return queryset
+        queryset = queryset.filter(search_q(search))
+        words, numbers, _ = parse_search(search)
+        if is_indexed() and words:
+            queryset = queryset.annotate(
+                search_rank=rank_expression(words), search_highlight=highlight_expression(words)
+            )
+        return queryset
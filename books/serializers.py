@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Business, Cashbook, Member, Category, Party, PaymentMode, Transaction
+from .models import Business, Cashbook, Member, Category, Party, PaymentMode, Transaction, ExportJob
+from .search import render_highlight
 
 class BusinessSerializer(serializers.ModelSerializer):
     class Meta:
@@ -44,12 +45,21 @@ class PaymentModeSerializer(serializers.ModelSerializer):
         fields = '__all__'
         # business is required for creation
 
+class HighlightField(serializers.CharField):
+    """Remark with search matches in <mark> tags, safe to insert as HTML"""
+
+    def to_representation(self, value):
+        return render_highlight(value)
+
 class TransactionSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     party_name = serializers.CharField(source='party.name', read_only=True)
     payment_mode_name = serializers.CharField(source='payment_mode.name', read_only=True)
     created_by_name = serializers.CharField(source='created_by.full_name', read_only=True)
-    running_balance = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True, required=False)
+    running_balance = serializers.DecimalField(max_digits=19, decimal_places=2, read_only=True, required=False)
+    # Only present in ?search= results
+    search_rank = serializers.FloatField(read_only=True)
+    search_highlight = HighlightField(read_only=True)
 
     class Meta:
         model = Transaction
@@ -71,3 +81,42 @@ class TransactionSerializer(serializers.ModelSerializer):
         if not data.get('amount'):
             raise serializers.ValidationError({"amount": "Amount is required"})
         return data
+
+
+class TransactionBulkRowSerializer(serializers.Serializer):
+    """
+    One row of POST /transactions/bulk/. Related objects are given as ids and resolved
+    for all rows at once by the view, so validating a row runs no queries.
+    """
+    cashbook = serializers.UUIDField()
+    type = serializers.ChoiceField(choices=Transaction.TYPE_CHOICES)
+    amount = serializers.DecimalField(max_digits=19, decimal_places=2)
+    remark = serializers.CharField(required=False, allow_blank=True, default='')
+    category = serializers.UUIDField(error_messages={'required': 'Category is required'})
+    party = serializers.UUIDField(required=False, allow_null=True)
+    payment_mode = serializers.UUIDField(error_messages={'required': 'Payment mode is required'})
+
+    def validate_amount(self, value):
+        """Ensure amount is positive"""
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be greater than 0")
+        return value
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = (
+            'id', 'cashbook', 'format', 'status', 'error',
+            'created_at', 'started_at', 'finished_at', 'expires_at', 'download_url',
+        )
+        read_only_fields = ('status', 'error', 'created_at', 'started_at', 'finished_at', 'expires_at')
+
+    def get_download_url(self, obj):
+        if obj.status != 'DONE':
+            return None
+        request = self.context.get('request')
+        url = f"/api/v1/export-jobs/{obj.id}/download/"
+        return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,62 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import access, typeahead
+from .models import Business, Cashbook, CashbookAccess, Category, Member, Party
+
+
+@receiver(pre_save, sender=Business)
+@receiver(pre_save, sender=Cashbook)
+@receiver(pre_save, sender=Member)
+def remember_access_fields(sender, instance, **kwargs):
+    """Keep the stored owner/business/user/role so post_save can tell whether access changed"""
+    fields = {Business: ('owner_id',), Cashbook: ('business_id',), Member: ('user_id', 'business_id', 'role')}[sender]
+    instance._stored_access = (
+        None if instance._state.adding
+        else sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    )
+
+
+@receiver(post_save, sender=Business)
+def sync_business_access(sender, instance, created, **kwargs):
+    if created:
+        return  # No cashbooks yet
+    if instance._stored_access != (instance.owner_id,):
+        access.sync_access(business_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Cashbook)
+def sync_cashbook_access(sender, instance, created, **kwargs):
+    if created or instance._stored_access != (instance.business_id,):
+        access.sync_access(cashbook_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Member)
+def sync_member_access(sender, instance, created, **kwargs):
+    stored = instance._stored_access
+    if stored == (instance.user_id, instance.business_id, instance.role):
+        return
+    business_ids = {instance.business_id}
+    if stored is not None:
+        business_ids.add(stored[1])
+    access.sync_access(business_ids=list(business_ids))
+
+
+@receiver(post_delete, sender=Member)
+def drop_member_access(sender, instance, **kwargs):
+    # Only delete here: this also runs while a whole business is being cascade-deleted
+    CashbookAccess.objects.filter(user_id=instance.user_id, business_id=instance.business_id).exclude(
+        role=access.OWNER
+    ).delete()
+
+
+@receiver(post_save, sender=Party)
+@receiver(post_save, sender=Category)
+def update_typeahead(sender, instance, **kwargs):
+    typeahead.record_saved(instance)
+
+
+@receiver(post_delete, sender=Party)
+@receiver(post_delete, sender=Category)
+def remove_from_typeahead(sender, instance, **kwargs):
+    typeahead.record_deleted(instance)
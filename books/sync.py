@@ -0,0 +1,295 @@
+"""
+Sync for offline clients.
+
+GET /api/v1/sync/?cursor=... returns the transactions, categories, parties and payment
+modes changed since the cursor, and tombstones of deleted ones, so a client only
+downloads what it doesn't have yet.
+
+Each stream is read in (updated_at, id) keyset order. Rows are only handed out once
+they are SYNC_SETTLE_SECONDS old: updated_at is stamped before the write commits, so
+without that delay a slower transaction could commit a row behind a cursor that has
+already moved past it. Changes that can't be followed through updated_at (access to
+a cashbook gained or lost, a whole cashbook or business deleted, bulk imports via
+Cashbook.sync_epoch) alter the scope fingerprint in the cursor, and the client is
+told to discard its copy and start over.
+
+POST /api/v1/sync/ applies the client's queued transaction creates, updates and deletes
+(see apply_operations()); each carries a client-generated key so retried batches
+don't apply anything twice.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .access import OWNER
+from .models import Business, Cashbook, Category, IdempotencyKey, Party, PaymentMode, SyncTombstone, Transaction
+from .serializers import CategorySerializer, PartySerializer, PaymentModeSerializer, TransactionSerializer
+
+CURSOR_VERSION = 1
+STREAMS = ('transactions', 'categories', 'parties', 'payment_modes', 'deleted')
+
+
+def encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Cursor state: {'scope': fingerprint, 'positions': {stream: (datetime, id or None)}}"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        if state['v'] != CURSOR_VERSION:
+            raise ValueError(state['v'])
+        positions = {}
+        for stream in STREAMS:
+            timestamp, pk = state['positions'][stream]
+            positions[stream] = (parse_datetime(timestamp), pk)
+            if positions[stream][0] is None:
+                raise ValueError(timestamp)
+        return {'scope': state['scope'], 'positions': positions}
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise ValidationError({'cursor': 'Invalid sync cursor'})
+
+
+def _scope(user, cashbook_id=None):
+    """(cashbook ids, business ids, fingerprint) of what `user` syncs"""
+    cashbooks = Cashbook.objects.visible_to(user)
+    businesses = Business.objects.visible_to(user)
+    if cashbook_id is not None:
+        cashbooks = cashbooks.filter(pk=cashbook_id)
+        businesses = businesses.filter(pk__in=cashbooks.values('business_id'))
+    cashbooks = sorted((str(pk), epoch) for pk, epoch in cashbooks.values_list('id', 'sync_epoch'))
+    if cashbook_id is not None and not cashbooks:
+        raise NotFound('Cashbook not found')
+    business_ids = sorted(str(pk) for pk in businesses.values_list('id', flat=True))
+    basis = json.dumps([cashbooks, business_ids], separators=(',', ':'))
+    return [pk for pk, _ in cashbooks], business_ids, hashlib.sha256(basis.encode()).hexdigest()[:32]
+
+
+def _after(timestamp, position):
+    """Rows past a keyset position; (t, None) means everything from t on"""
+    after, pk = position
+    if pk is None:
+        return Q(**{f'{timestamp}__gte': after})
+    # The first condition lets the (scope, timestamp, id) index bound the range
+    return Q(**{f'{timestamp}__gte': after}) & (Q(**{f'{timestamp}__gt': after}) | Q(id__gt=pk))
+
+
+def _page(queryset, timestamp, position, horizon, limit):
+    """(rows, next position, more rows pending) of one stream"""
+    queryset = queryset.filter(**{f'{timestamp}__lt': horizon})
+    if position is not None:
+        queryset = queryset.filter(_after(timestamp, position))
+    rows = list(queryset.order_by(timestamp, 'id')[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (getattr(rows[-1], timestamp), str(rows[-1].pk)), True
+    return rows, (horizon, None), False
+
+
+def changes(user, cursor=None, cashbook_id=None, limit=None):
+    """
+    The sync response for `user`: each stream's rows changed since `cursor` (at most
+    `limit` per stream), 'deleted' tombstones, the next 'cursor', 'has_more' when the
+    client should ask again right away, and 'reset' when it must drop everything it
+    has first (always true without a cursor).
+    """
+    limit = min(limit or settings.SYNC_PAGE_SIZE, settings.SYNC_PAGE_SIZE)
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    cashbook_ids, business_ids, fingerprint = _scope(user, cashbook_id)
+
+    state = decode_cursor(cursor) if cursor else None
+    retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    reset = (
+        state is None or state['scope'] != fingerprint or
+        # Tombstones the client hasn't seen may have been pruned
+        state['positions']['deleted'][0] < now - retention
+    )
+    # A client starting from scratch has nothing to delete
+    positions = {'deleted': (horizon, None)} if reset else state['positions']
+
+    streams = {
+        'transactions': (
+            Transaction.objects.filter(cashbook_id__in=cashbook_ids)
+            .select_related('category', 'party', 'payment_mode', 'created_by'),
+            'updated_at', lambda rows: TransactionSerializer(rows, many=True).data,
+        ),
+        'categories': (
+            Category.objects.filter(business_id__in=business_ids),
+            'updated_at', lambda rows: CategorySerializer(rows, many=True).data,
+        ),
+        'parties': (
+            Party.objects.filter(business_id__in=business_ids),
+            'updated_at', lambda rows: PartySerializer(rows, many=True).data,
+        ),
+        'payment_modes': (
+            PaymentMode.objects.filter(business_id__in=business_ids),
+            'updated_at', lambda rows: PaymentModeSerializer(rows, many=True).data,
+        ),
+        'deleted': (
+            SyncTombstone.objects.filter(Q(cashbook_id__in=cashbook_ids) | Q(business_id__in=business_ids)).exclude(
+                # Moved between two synced cashbooks: the row itself comes with the transactions
+                model='transaction', object_id__in=Transaction.objects.filter(cashbook_id__in=cashbook_ids).values('id'),
+            ),
+            'deleted_at', lambda rows: [{'type': row.model, 'id': row.object_id} for row in rows],
+        ),
+    }
+
+    response = {'reset': reset}
+    next_positions = {}
+    has_more = False
+    for stream, (queryset, timestamp, serialize) in streams.items():
+        rows, next_positions[stream], more = _page(queryset, timestamp, positions.get(stream), horizon, limit)
+        response[stream] = serialize(rows)
+        has_more = has_more or more
+
+    response['has_more'] = has_more
+    response['cursor'] = encode_cursor({
+        'v': CURSOR_VERSION,
+        'scope': fingerprint,
+        'positions': {stream: [after.isoformat(), pk] for stream, (after, pk) in next_positions.items()},
+    })
+    return response
+
+
+class _Failed(Exception):
+    """Rolls back the savepoint of an operation that was rejected"""
+
+    def __init__(self, code, errors):
+        self.result = {'status': code, 'errors': errors}
+
+
+def _parse_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise _Failed(status.HTTP_400_BAD_REQUEST, {'id': ['Must be a valid UUID']})
+
+
+def _require_role(access, cashbook_id, allowed, message):
+    role = access.cashbook_role(cashbook_id)
+    if role is None:
+        raise _Failed(status.HTTP_404_NOT_FOUND, {'cashbook': ['Cashbook not found or access denied']})
+    if role not in allowed:
+        raise _Failed(status.HTTP_403_FORBIDDEN, {'detail': message})
+
+
+def _apply(operation, user, access, transactions):
+    """Apply one operation; `transactions` maps ids to the instances ops may still refer to"""
+    kind = operation.get('op')
+    data = operation.get('data') or {}
+    if kind == 'create':
+        serializer = TransactionSerializer(data=data)
+        if not serializer.is_valid():
+            raise _Failed(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        _require_role(access, serializer.validated_data['cashbook'].id, (OWNER, 'ADMIN', 'EDITOR'),
+                      'Viewers cannot create transactions.')
+        extra = {}
+        if operation.get('id') is not None:
+            # Offline clients name their rows up front so later operations can refer to them
+            extra['id'] = _parse_id(operation['id'])
+            if extra['id'] in transactions or Transaction.objects.filter(pk=extra['id']).exists():
+                raise _Failed(status.HTTP_409_CONFLICT, {'id': ['A transaction with this id already exists']})
+        txn = serializer.save(created_by=user, **extra)
+        transactions[txn.pk] = txn
+        return {'status': status.HTTP_201_CREATED, 'id': txn.pk, 'data': TransactionSerializer(txn).data}
+
+    if kind not in ('update', 'delete'):
+        raise _Failed(status.HTTP_400_BAD_REQUEST, {'op': ['Must be create, update or delete']})
+    txn = transactions.get(_parse_id(operation.get('id')))
+    if txn is None:
+        raise _Failed(status.HTTP_404_NOT_FOUND, {'id': ['Transaction not found']})
+
+    if kind == 'update':
+        _require_role(access, txn.cashbook_id, (OWNER, 'ADMIN', 'EDITOR'), 'Viewers cannot edit transactions.')
+        serializer = TransactionSerializer(txn, data=data, partial=True)
+        if not serializer.is_valid():
+            raise _Failed(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        if 'cashbook' in serializer.validated_data:
+            _require_role(access, serializer.validated_data['cashbook'].id, (OWNER, 'ADMIN', 'EDITOR'),
+                          'Viewers cannot edit transactions.')
+        txn = serializer.save()
+        return {'status': status.HTTP_200_OK, 'id': txn.pk, 'data': TransactionSerializer(txn).data}
+
+    _require_role(access, txn.cashbook_id, (OWNER, 'ADMIN'), 'Only admins can delete transactions.')
+    pk = txn.pk
+    txn.delete()
+    del transactions[pk]
+    return {'status': status.HTTP_204_NO_CONTENT, 'id': pk}
+
+
+def apply_operations(user, access, operations):
+    """
+    Apply a batch of {"key", "op": create|update|delete, "id", "data"} operations in order,
+    in one database transaction. Every operation runs in its own savepoint, so a rejected
+    one leaves no trace and doesn't stop the others; its result carries the status and
+    errors. Applied operations are recorded in IdempotencyKey: replaying a key (a retried
+    request, or concurrently) returns the recorded result with "replayed": true.
+    Roles come from `access` (an AccessResolver), which loads them all in one query.
+    """
+    keys = [operation.get('key') for operation in operations]
+    results = []
+    with db_transaction.atomic():
+        recorded = dict(
+            IdempotencyKey.objects.filter(user=user, key__in=[key for key in keys if isinstance(key, str)])
+            .values_list('key', 'result')
+        )
+        referenced = set()
+        for operation in operations:
+            if operation.get('op') in ('update', 'delete'):
+                try:
+                    referenced.add(uuid.UUID(str(operation.get('id'))))
+                except ValueError:
+                    pass
+        transactions = Transaction.objects.visible_to(user).in_bulk(referenced)
+
+        for key, operation in zip(keys, operations):
+            if not isinstance(key, str) or not 0 < len(key) <= IdempotencyKey._meta.get_field('key').max_length:
+                results.append({'key': key, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'key': ['Required, at most 100 characters']}})
+                continue
+            if key in recorded:
+                results.append({'key': key, **recorded[key], 'replayed': True})
+                continue
+            try:
+                with db_transaction.atomic():
+                    result = _apply(operation, user, access, transactions)
+                    # Blocks behind a concurrent request holding the same key until it finishes
+                    recorded[key] = IdempotencyKey.objects.create(user=user, key=key, result=result).result
+                results.append({'key': key, **result, 'replayed': False})
+            except _Failed as failed:
+                results.append({'key': key, **failed.result})
+            except IntegrityError:
+                stored = IdempotencyKey.objects.filter(user=user, key=key).values_list('result', flat=True).first()
+                if stored is None:
+                    results.append({'key': key, 'status': status.HTTP_409_CONFLICT, 'errors': {'detail': 'Conflicting write'}})
+                else:
+                    recorded[key] = stored
+                    results.append({'key': key, **stored, 'replayed': True})
+    return results
+
+
+def prune_tombstones(older_than=None):
+    """Delete tombstones past the retention period; cursors that old get a reset instead"""
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=older_than).delete()
+    return deleted
+
+
+def prune_idempotency_keys(older_than=None):
+    """Forget applied operations past IDEMPOTENCY_KEY_RETENTION_DAYS; clients don't retry that late"""
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=settings.IDEMPOTENCY_KEY_RETENTION_DAYS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=older_than).delete()
+    return deleted
@@ -1,3 +1,1315 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import tempfile
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction as db_transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import CustomUser
+from . import events, export_jobs, exports, typeahead
+from .access import AccessResolver
+from .async_views import AsyncReportsViewSet, AsyncSummaryView, AsyncTransactionViewSet
+from .exports import write_excel
+from .filters import compile_filters, duration_range
+from .ledger import LEDGER_ORDER
+from .report_cache import report_cache
+from .report_views import ReportsViewSet
+from .search import check_fts_triggers, parse_search
+from .pagination import TransactionCursorPagination
+from .models import (
+    Business, Cashbook, CashbookAccess, CashbookDailyRollup, Category, ChangeEvent, ExportJob, IdempotencyKey,
+    Member, Party, PaymentMode, SyncTombstone, Transaction,
+)
+from .views import SummaryView, TransactionViewSet
+
+
+class ReportsListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_cashbooks(self, count):
+        for i in range(count):
+            cashbook = Cashbook.objects.create(name=f'Book {i}', business=self.business)
+            Transaction.objects.create(cashbook=cashbook, type='IN', amount=Decimal('100'), created_by=self.user)
+            Transaction.objects.create(cashbook=cashbook, type='OUT', amount=Decimal('40'), created_by=self.user)
+
+    def test_query_count_is_independent_of_cashbook_count(self):
+        # One query for the ETag versions, one for the annotated cashbooks
+        self.add_cashbooks(2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/reports/')
+        self.assertEqual(len(response.json()), 2)
+
+        self.add_cashbooks(20)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/reports/')
+        self.assertEqual(len(response.json()), 22)
+
+    def test_totals(self):
+        self.add_cashbooks(1)
+        member = CustomUser.objects.create_user('member', 'password')
+        Member.objects.create(user=member, business=self.business, role='VIEWER')
+        Member.objects.create(user=CustomUser.objects.create_user('other', 'password'), business=self.business)
+        self.client.force_authenticate(member)
+
+        [row] = self.client.get('/api/v1/reports/').json()
+        self.assertEqual(Decimal(str(row['total_in'])), Decimal('100'))
+        self.assertEqual(Decimal(str(row['total_out'])), Decimal('40'))
+        self.assertEqual(Decimal(str(row['net_balance'])), Decimal('60'))
+        self.assertEqual(row['business_name'], 'Shop')
+
+
+class AccessResolverTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner', 'password')
+        self.editor = CustomUser.objects.create_user('editor', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.owner)
+        self.cashbooks = [Cashbook.objects.create(name=f'Book {i}', business=self.business) for i in range(3)]
+        Member.objects.create(user=self.editor, business=self.business, role='EDITOR')
+
+    def test_roles_are_loaded_once(self):
+        resolver = AccessResolver(self.editor)
+        with self.assertNumQueries(1):
+            for cashbook in self.cashbooks * 2:
+                self.assertEqual(resolver.cashbook_role(cashbook.id), 'EDITOR')
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.business_role(self.business), 'EDITOR')
+            self.assertEqual(resolver.business_role(self.business), 'EDITOR')
+        with self.assertNumQueries(0):
+            self.assertEqual(AccessResolver(self.owner).business_role(self.business), 'OWNER')
+
+    def test_create_transaction_checks_access_with_one_query(self):
+        category = Category.objects.create(business=self.business, name='Sales')
+        payment_mode = PaymentMode.objects.create(business=self.business, name='Cash')
+        client = APIClient()
+        client.force_authenticate(self.editor)
+        payload = {
+            'cashbook': self.cashbooks[0].id, 'type': 'IN', 'amount': '10.00',
+            'category': category.id, 'payment_mode': payment_mode.id,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/api/v1/transactions/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        access_queries = [q for q in queries if 'books_cashbookaccess' in q['sql'] or 'books_member' in q['sql']]
+        self.assertEqual(len(access_queries), 1)
+
+
+class VisibleToTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner', 'password')
+        self.viewer = CustomUser.objects.create_user('viewer', 'password')
+        self.stranger = CustomUser.objects.create_user('stranger', 'password')
+        self.shop = Business.objects.create(name='Shop', owner=self.owner)
+        self.other = Business.objects.create(name='Other', owner=self.viewer)
+        # Owner of one business and member of the other, several times over through the joins
+        Member.objects.create(user=self.owner, business=self.other, role='EDITOR')
+        Member.objects.create(user=self.viewer, business=self.shop, role='VIEWER')
+        for business in (self.shop, self.other):
+            Category.objects.create(business=business, name='Sales')
+            for i in range(2):
+                cashbook = Cashbook.objects.create(name=f'Book {i}', business=business)
+                Transaction.objects.create(cashbook=cashbook, type='IN', amount=Decimal('1'), created_by=self.owner)
+
+    def test_rows_are_listed_once_per_user(self):
+        for user in (self.owner, self.viewer):
+            self.assertEqual(Business.objects.visible_to(user).count(), 2)
+            self.assertEqual(Category.objects.visible_to(user).count(), 2)
+            self.assertEqual(Cashbook.objects.visible_to(user).count(), 4)
+            self.assertEqual(Transaction.objects.visible_to(user).count(), 4)
+        self.assertFalse(Business.objects.visible_to(self.stranger).exists())
+        self.assertFalse(Transaction.objects.visible_to(self.stranger).exists())
+
+    def test_querysets_are_not_distinct(self):
+        for queryset in (Business.objects.visible_to(self.owner), Transaction.objects.visible_to(self.owner)):
+            sql = str(queryset.query).upper()
+            self.assertNotIn('DISTINCT', sql)
+            self.assertNotIn('JOIN', sql)
+
+
+class CashbookAccessTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner', 'password')
+        self.member = CustomUser.objects.create_user('member', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.owner)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+
+    def access(self):
+        return set(CashbookAccess.objects.values_list('user__username', 'cashbook__name', 'role'))
+
+    def test_signals_keep_access_current(self):
+        self.assertEqual(self.access(), {('owner', 'Main', 'OWNER')})
+
+        membership = Member.objects.create(user=self.member, business=self.business, role='VIEWER')
+        Cashbook.objects.create(name='Petty', business=self.business)
+        self.assertEqual(self.access(), {
+            ('owner', 'Main', 'OWNER'), ('owner', 'Petty', 'OWNER'),
+            ('member', 'Main', 'VIEWER'), ('member', 'Petty', 'VIEWER'),
+        })
+
+        membership.role = 'EDITOR'
+        membership.save()
+        self.assertEqual(AccessResolver(self.member).cashbook_role(self.cashbook.id), 'EDITOR')
+
+        # Handing the business to its member: the old owner loses access, the member keeps owner rights
+        self.business.owner = self.member
+        self.business.save()
+        self.assertEqual(self.access(), {('member', 'Main', 'OWNER'), ('member', 'Petty', 'OWNER')})
+
+        self.business.owner = self.owner
+        self.business.save()
+        membership.delete()
+        self.assertEqual(self.access(), {('owner', 'Main', 'OWNER'), ('owner', 'Petty', 'OWNER')})
+        self.assertFalse(Cashbook.objects.visible_to(self.member).exists())
+
+    def test_moving_a_cashbook_moves_its_access(self):
+        other = Business.objects.create(name='Other', owner=self.member)
+        self.cashbook.business = other
+        self.cashbook.save()
+        self.assertEqual(self.access(), {('member', 'Main', 'OWNER')})
+
+    def test_rebuild_access_restores_rows_written_around_signals(self):
+        Member.objects.bulk_create([Member(user=self.member, business=self.business, role='ADMIN')])
+        CashbookAccess.objects.filter(role='OWNER').delete()
+        call_command('rebuild_access', stdout=StringIO())
+        self.assertEqual(self.access(), {('owner', 'Main', 'OWNER'), ('member', 'Main', 'ADMIN')})
+
+
+class SummaryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbooks = [Cashbook.objects.create(name=f'Book {i}', business=business) for i in range(3)]
+        for i, cashbook in enumerate(self.cashbooks):
+            Transaction.objects.create(cashbook=cashbook, type='IN', amount=Decimal('100') * (i + 1), created_by=self.user)
+            Transaction.objects.create(cashbook=cashbook, type='OUT', amount=Decimal('30'), remark='rent', created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_single_cashbook_in_one_query(self):
+        for params in ({}, {'search': 'rent'}):
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/v1/summary/', {'cashbook': self.cashbooks[1].id, **params})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.json()['total_out'])), Decimal('30'))
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_batch(self):
+        ids = ','.join(str(cashbook.id) for cashbook in self.cashbooks)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/summary/', {'cashbook': ids})
+        summaries = response.json()
+        self.assertEqual(set(summaries), {str(cashbook.id) for cashbook in self.cashbooks})
+        self.assertEqual(Decimal(str(summaries[str(self.cashbooks[2].id)]['net_balance'])), Decimal('270'))
+
+        response = self.client.post(
+            '/api/v1/summary/', {'cashbooks': [str(self.cashbooks[0].id)], 'type': 'IN'}, format='json'
+        )
+        self.assertEqual(response.json(), {str(self.cashbooks[0].id): {
+            'total_in': 100.0, 'total_out': 0.0, 'net_balance': 100.0, 'count': 1,
+        }})
+
+    def test_member_filter(self):
+        clerk = CustomUser.objects.create_user('clerk', 'password')
+        membership = Member.objects.create(user=clerk, business=self.cashbooks[0].business, role='EDITOR')
+        Transaction.objects.create(cashbook=self.cashbooks[0], type='OUT', amount=Decimal('12'), created_by=clerk)
+        for member, expected in ((membership.id, (0, 12, 1)), (self.user.id, (0, 0, 0)), ('not-a-uuid', (0, 0, 0))):
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/v1/summary/', {'cashbook': self.cashbooks[0].id, 'member': member})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertEqual((body['total_in'], body['total_out'], body['count']), expected)
+
+    def test_no_access(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('stranger', 'password'))
+        response = self.client.get('/api/v1/summary/', {'cashbook': self.cashbooks[0].id})
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        self.add('100')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cashbook = self.cashbook.id
+        self.paths = {
+            'summary': f'/api/v1/summary/?cashbook={cashbook}',
+            'transactions': f'/api/v1/transactions/?cashbook={cashbook}',
+            'reports': '/api/v1/reports/',
+            'report': f'/api/v1/reports/{cashbook}/',
+        }
+
+    def add(self, amount):
+        Transaction.objects.create(cashbook=self.cashbook, type='IN', amount=Decimal(amount), created_by=self.user)
+
+    def get(self, path, etag=None):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(path)
+
+    def test_matching_etag_short_circuits(self):
+        for name, path in self.paths.items():
+            response = self.get(path)
+            self.assertEqual(response.status_code, 200, name)
+            etag = response['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(path, etag)
+            self.assertEqual(response.status_code, 304, name)
+            self.assertEqual(response['ETag'], etag, name)
+            self.assertEqual(response.content, b'', name)
+            # Only the cashbook versions are read
+            self.assertFalse([q for q in queries if 'books_transaction' in q['sql']], name)
+            self.assertEqual(self.get(path, f'W/{etag}, "other"').status_code, 304, name)
+
+    def test_writes_change_the_etag(self):
+        etags = {name: self.get(path)['ETag'] for name, path in self.paths.items()}
+        self.add('5')
+        for name, path in self.paths.items():
+            response = self.get(path, etags[name])
+            self.assertEqual(response.status_code, 200, name)
+            self.assertNotEqual(response['ETag'], etags[name], name)
+
+    def test_etag_depends_on_query_and_user(self):
+        for name in ('summary', 'transactions'):
+            path = self.paths[name]
+            self.assertNotEqual(self.get(path)['ETag'], self.get(f'{path}&type=OUT')['ETag'], name)
+        # Presets and custom ranges selecting the same dates share a summary ETag
+        today = date.today()
+        self.assertEqual(
+            self.get(f"{self.paths['summary']}&duration=TODAY")['ETag'],
+            self.get(f"{self.paths['summary']}&start_date={today}&end_date={today}")['ETag'],
+        )
+
+        etags = {name: self.get(path)['ETag'] for name, path in self.paths.items()}
+        viewer = CustomUser.objects.create_user('viewer', 'password')
+        Member.objects.create(user=viewer, business=self.business, role='VIEWER')
+        self.client.force_authenticate(viewer)
+        for name, path in self.paths.items():
+            response = self.get(path, etags[name])
+            self.assertEqual(response.status_code, 200, name)
+            self.assertNotEqual(response['ETag'], etags[name], name)
+
+
+class FilterCompilerTests(SimpleTestCase):
+    today = date(2026, 2, 14)
+
+    def test_presets_are_half_open_ranges(self):
+        self.assertEqual(duration_range('TODAY', self.today), (date(2026, 2, 14), date(2026, 2, 15)))
+        self.assertEqual(duration_range('THIS_MONTH', self.today), (date(2026, 2, 1), date(2026, 3, 1)))
+        self.assertEqual(duration_range('THIS_YEAR', self.today), (date(2026, 1, 1), date(2027, 1, 1)))
+        self.assertEqual(duration_range('LAST_QUARTER', self.today), (date(2025, 10, 1), date(2026, 1, 1)))
+        self.assertEqual(duration_range('ALL_TIME', self.today), (None, None))
+
+    def test_last_days_presets_are_open_ended(self):
+        self.assertEqual(duration_range('LAST_7_DAYS', self.today), (date(2026, 2, 7), None))
+        self.assertEqual(duration_range('LAST_30_DAYS', self.today), (date(2026, 1, 15), None))
+        compiled = compile_filters({'duration': 'LAST_7_DAYS', 'end_date': '2026-02-20'}, today=self.today)
+        self.assertEqual((compiled.start, compiled.end), (date(2026, 2, 7), date(2026, 2, 21)))
+
+    @override_settings(FINANCIAL_YEAR_START_MONTH=4)
+    def test_financial_year(self):
+        self.assertEqual(duration_range('FINANCIAL_YEAR', self.today), (date(2025, 4, 1), date(2026, 4, 1)))
+        self.assertEqual(duration_range('FINANCIAL_YEAR', date(2026, 4, 1)), (date(2026, 4, 1), date(2027, 4, 1)))
+
+    def test_custom_range_narrows_preset_and_shares_cache_key(self):
+        compiled = compile_filters({'duration': 'THIS_MONTH', 'end_date': '2026-02-09'}, today=self.today)
+        self.assertEqual((compiled.start, compiled.end), (date(2026, 2, 1), date(2026, 2, 10)))
+        same = compile_filters({'start_date': '2026-02-01', 'end_date': '2026-02-09'}, today=self.today)
+        self.assertEqual(compiled.cache_key(), same.cache_key())
+        self.assertFalse(compiled.has_row_filters)
+        self.assertTrue(compile_filters({'duration': 'ALL_TIME', 'type': ''}, today=self.today).is_empty)
+
+
+class TransactionSearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.cashbook = Cashbook.objects.create(name='Book', business=Business.objects.create(name='Shop', owner=self.user))
+        self.invoice = Transaction.objects.create(
+            cashbook=self.cashbook, type='IN', amount=Decimal('250'), remark='Invoice 42 paid', created_by=self.user
+        )
+        Transaction.objects.create(
+            cashbook=self.cashbook, type='OUT', amount=Decimal('80'), remark='Office rent', created_by=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, text, **params):
+        response = self.client.get('/api/v1/transactions/', {'cashbook': self.cashbook.id, 'search': text, **params})
+        return response.json()['results']
+
+    def test_prefix_match_with_highlight(self):
+        [row] = self.search('inv')
+        self.assertEqual(row['id'], str(self.invoice.id))
+        self.assertEqual(row['search_highlight'], '<mark>Invoice</mark> 42 paid')
+        self.assertIn('search_rank', row)
+        self.assertEqual(self.search('invoice rent'), [])
+        self.assertEqual(len(self.search('80')), 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.invoice.remark = 'Refund'
+        self.invoice.save()
+        self.assertEqual(self.search('invoice'), [])
+        self.assertEqual(len(self.search('refund')), 1)
+        self.invoice.delete()
+        self.assertEqual(self.search('refund'), [])
+
+    def test_amount_terms(self):
+        self.assertEqual(len(self.search('250')), 1)
+        self.assertEqual(len(self.search('42')), 1)  # remark word
+        self.assertEqual(len(self.search('25')), 0)
+        self.assertEqual(len(self.search('50..300')), 2)
+        self.assertEqual(len(self.search('>100')), 1)
+        self.assertEqual(len(self.search('<=80')), 1)
+        self.assertEqual(len(self.search('~245')), 1)
+        self.assertEqual(len(self.search('paid >=1,000')), 0)
+        [row] = self.search('paid >=100')
+        self.assertEqual(row['search_highlight'], 'Invoice 42 <mark>paid</mark>')
+
+        # Whole numbers match the amounts they start
+        Transaction.objects.create(cashbook=self.cashbook, type='OUT', amount=Decimal('123.45'), created_by=self.user)
+        self.assertEqual(len(self.search('123')), 1)
+        self.assertEqual(len(self.search('123.45')), 1)
+        self.assertEqual(len(self.search('123.4')), 0)
+        self.assertEqual(len(self.search('124')), 0)
+
+    def test_parse_search(self):
+        words, numbers, lookups = parse_search('rent 1,250 10..5 >7 ~100')
+        self.assertEqual((words, numbers), (['rent'], ['1250']))
+        self.assertEqual(lookups[0], {'amount__gte': Decimal('5'), 'amount__lte': Decimal('10')})
+        self.assertEqual(lookups[1], {'amount__gt': Decimal('7')})
+        self.assertEqual(lookups[2], {'amount__gte': Decimal('95'), 'amount__lte': Decimal('105')})
+
+    def test_summary_search(self):
+        response = self.client.get('/api/v1/summary/', {'cashbook': self.cashbook.id, 'search': 'office'})
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(Decimal(str(response.json()['total_out'])), Decimal('80'))
+
+    def test_search_without_terms_matches_nothing(self):
+        for text in ('"', '*', '- "'):
+            self.assertEqual(self.search(text), [])
+            response = self.client.get('/api/v1/summary/', {'cashbook': self.cashbook.id, 'search': text})
+            self.assertEqual(response.json()['count'], 0)
+
+    def test_highlight_escapes_remark(self):
+        Transaction.objects.create(
+            cashbook=self.cashbook, type='IN', amount=Decimal('5'), created_by=self.user,
+            remark='<img src=x onerror=alert(1)> payout & "tip"',
+        )
+        [row] = self.search('payout')
+        self.assertEqual(
+            row['search_highlight'], '&lt;img src=x onerror=alert(1)&gt; <mark>payout</mark> &amp; &quot;tip&quot;'
+        )
+
+    def test_missing_fts_triggers_fail_the_database_check(self):
+        self.assertEqual(check_fts_triggers(None, databases=['default']), [])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER books_transaction_fts_update')
+        [error] = check_fts_triggers(None, databases=['default'])
+        self.assertEqual(error.id, 'books.E001')
+        self.assertIn('books_transaction_fts_update', error.msg)
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        Party.objects.bulk_create([
+            Party(business=self.business, name=name)
+            for name in ['Ramesh Traders', 'Rajesh Kumar', 'Suresh Sharma', 'Sharma Brothers']
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def lookup(self, q, **params):
+        response = self.client.get('/api/v1/parties/typeahead/', {'business': self.business.id, 'q': q, **params})
+        return [row['name'] for row in response.json()]
+
+    def test_prefix_then_similar(self):
+        self.assertEqual(self.lookup('ra'), ['Rajesh Kumar', 'Ramesh Traders'])
+        self.assertEqual(self.lookup('sharma')[0], 'Sharma Brothers')
+        self.assertIn('Suresh Sharma', self.lookup('sharma'))
+        self.assertEqual(self.lookup('rmesh traders'), ['Ramesh Traders'])
+        self.assertEqual(self.lookup('ra', limit=1), ['Rajesh Kumar'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(self.lookup('zen'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            party = Party.objects.create(business=self.business, name='Zenith Supplies')
+        self.assertEqual(self.lookup('zen'), ['Zenith Supplies'])
+        party.name = 'Apex Supplies'
+        with self.captureOnCommitCallbacks(execute=True):
+            party.save()
+        self.assertEqual(self.lookup('zen'), [])
+        self.assertEqual(self.lookup('apex'), ['Apex Supplies'])
+        with self.captureOnCommitCallbacks(execute=True):
+            party.delete()
+        self.assertEqual(self.lookup('apex'), [])
+
+    def test_rolled_back_writes_leave_index_alone(self):
+        self.assertEqual(self.lookup('ra'), ['Rajesh Kumar', 'Ramesh Traders'])
+        with self.assertRaises(ValueError), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with db_transaction.atomic():
+                Party.objects.create(business=self.business, name='Ravi Stores')
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.lookup('ra'), ['Rajesh Kumar', 'Ramesh Traders'])
+
+    @override_settings(TYPEAHEAD_INDEX_MAX_ENTRIES=2)
+    def test_least_recently_used_indexes_are_dropped(self):
+        typeahead._indexes.clear()
+        others = [Business.objects.create(name=f'Other {i}', owner=self.user) for i in range(2)]
+        typeahead.lookup(Party, self.business.id, 'ra')
+        typeahead.lookup(Party, others[0].id, 'ra')
+        typeahead.lookup(Party, self.business.id, 'ra')
+        typeahead.lookup(Party, others[1].id, 'ra')
+        self.assertEqual(list(typeahead._indexes), [('books.Party', self.business.id), ('books.Party', others[1].id)])
+
+    def test_requires_access(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('stranger', 'password'))
+        response = self.client.get('/api/v1/parties/typeahead/', {'business': self.business.id, 'q': 'ra'})
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkCreateTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbooks = [Cashbook.objects.create(name=f'Book {i}', business=business) for i in range(2)]
+        self.category = Category.objects.create(business=business, name='Sales')
+        self.payment_mode = PaymentMode.objects.create(business=business, name='Cash')
+        Transaction.objects.create(
+            cashbook=self.cashbooks[0], type='IN', amount=Decimal('100'), created_by=self.user,
+            category=self.category, payment_mode=self.payment_mode,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def row(self, cashbook, txn_type, amount, **extra):
+        return {
+            'cashbook': str(cashbook.id), 'type': txn_type, 'amount': amount,
+            'category': str(self.category.id), 'payment_mode': str(self.payment_mode.id), **extra,
+        }
+
+    def test_creates_rows_and_maintains_ledger(self):
+        rows = [self.row(self.cashbooks[i % 2], 'OUT' if i % 3 == 0 else 'IN', '10.00') for i in range(300)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/transactions/bulk/', {'transactions': rows}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 300)
+        self.assertLess(len(queries), 40)
+
+        for cashbook in self.cashbooks:
+            newest = Transaction.objects.filter(cashbook=cashbook).order_by('-transaction_date', '-created_at', '-id').first()
+            summary = self.client.get('/api/v1/summary/', {'cashbook': cashbook.id}).json()
+            self.assertEqual(Decimal(str(summary['net_balance'])), newest.running_balance)
+        self.assertEqual(Transaction.objects.count(), 301)
+
+    def test_any_invalid_row_rejects_the_batch(self):
+        stranger_book = Cashbook.objects.create(
+            name='Other', business=Business.objects.create(name='Other', owner=CustomUser.objects.create_user('x', 'p'))
+        )
+        rows = [
+            self.row(self.cashbooks[0], 'IN', '5'),
+            self.row(self.cashbooks[0], 'IN', '-5'),
+            self.row(stranger_book, 'IN', '5'),
+            {**self.row(self.cashbooks[0], 'IN', '5'), 'category': str(uuid.uuid4())},
+        ]
+        response = self.client.post('/api/v1/transactions/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2, 3])
+        self.assertIn('category', response.json()['errors'][2]['errors'])
+        self.assertEqual(Transaction.objects.count(), 1)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        Category.objects.create(business=self.business, name='Sales')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, name='history.csv'):
+        response = self.client.post(
+            f'/api/v1/cashbooks/{self.cashbook.id}/import/',
+            {'file': SimpleUploadedFile(name, content)}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_csv_import_resolves_names_and_keeps_ledger(self):
+        content = (
+            'Date,Time,Type,Party,Category,Payment Mode,Remark,Cash In,Cash Out,Balance\n'
+            '2024-01-02,09:00,IN,Acme,sales,Bank,Opening,100.00,,100.00\n'
+            '2024-01-01,10:30,OUT,-,Rent,Cash,"Rent, January",,"1,040.50",-940.50\n'
+            '2024-01-02,,IN,Acme,Sales,Bank,,5,,\n'
+        ).encode()
+        lines = self.upload(content)
+        self.assertEqual(lines[-1]['rows'], 3)
+        self.assertTrue(lines[-1]['done'])
+        self.assertEqual(lines[-1]['created'], {'categories': 1, 'parties': 1, 'payment modes': 2})
+
+        ledger = list(Transaction.objects.filter(cashbook=self.cashbook).order_by('transaction_date', 'created_at', 'id'))
+        self.assertEqual([txn.remark for txn in ledger], ['Rent, January', '', 'Opening'])
+        self.assertEqual([txn.running_balance for txn in ledger], [Decimal('-1040.50'), Decimal('-1035.50'), Decimal('-935.50')])
+        self.assertEqual(ledger[1].category.name, 'Sales')
+        self.assertIsNone(ledger[0].party)
+        summary = self.client.get('/api/v1/summary/', {'cashbook': self.cashbook.id}).json()
+        self.assertEqual(Decimal(str(summary['net_balance'])), Decimal('-935.50'))
+
+    def test_bad_row_imports_nothing(self):
+        content = b'Date,Type,Amount\n2024-01-01,IN,10\n2024-01-02,IN,ten\n'
+        lines = self.upload(content)
+        self.assertEqual(lines, [{'error': 'Row 3: Invalid amount "ten"', 'row': 3}])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_exported_xlsx_round_trips(self):
+        Transaction.objects.create(cashbook=self.cashbook, type='IN', amount=Decimal('70'), created_by=self.user, remark='Sale')
+        Transaction.objects.create(cashbook=self.cashbook, type='OUT', amount=Decimal('20'), created_by=self.user)
+        output = BytesIO()
+        write_excel(self.cashbook, output)
+        self.cashbook = Cashbook.objects.create(name='Copy', business=self.business)
+        lines = self.upload(output.getvalue(), name='report.xlsx')
+        self.assertEqual(lines[-1]['rows'], 2)
+        self.assertEqual(
+            list(Transaction.objects.filter(cashbook=self.cashbook).order_by('created_at').values_list('remark', 'running_balance')),
+            [('Sale', Decimal('70.00')), ('', Decimal('50.00'))],
+        )
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        self.category = Category.objects.create(business=self.business, name='Sales')
+        self.first = self.add('100')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, amount, txn_type='IN'):
+        return Transaction.objects.create(
+            cashbook=self.cashbook, type=txn_type, amount=Decimal(amount), created_by=self.user, category=self.category,
+        )
+
+    def sync(self, cursor=None, **params):
+        response = self.client.get('/api/v1/sync/', {'cursor': cursor, **params} if cursor else params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_only_changes_since_cursor(self):
+        initial = self.sync()
+        self.assertTrue(initial['reset'])
+        self.assertEqual([row['id'] for row in initial['transactions']], [str(self.first.id)])
+        self.assertEqual([row['name'] for row in initial['categories']], ['Sales'])
+        self.assertEqual(self.sync(initial['cursor'])['transactions'], [])
+
+        second = self.add('5', 'OUT')
+        self.first.remark = 'edited'
+        self.first.save()
+        Party.objects.create(business=self.business, name='Acme').delete()
+        delta = self.sync(initial['cursor'])
+        self.assertFalse(delta['reset'])
+        self.assertEqual({row['id'] for row in delta['transactions']}, {str(self.first.id), str(second.id)})
+        self.assertEqual(delta['parties'], [])
+        self.assertEqual([row['type'] for row in delta['deleted']], ['party'])
+
+        # Deleting a category clears it on its transactions, which therefore sync again
+        category_id, first_id = str(self.category.id), str(self.first.id)
+        self.category.delete()
+        delta = self.sync(delta['cursor'])
+        self.assertEqual(len(delta['transactions']), 2)
+        self.assertEqual(delta['deleted'], [{'type': 'category', 'id': category_id}])
+
+        # The balance of the row after a deleted one moves, so it is sent again
+        self.first.delete()
+        delta = self.sync(delta['cursor'])
+        self.assertEqual(delta['deleted'], [{'type': 'transaction', 'id': first_id}])
+        self.assertEqual([(row['id'], row['running_balance']) for row in delta['transactions']], [(str(second.id), '-5.00')])
+
+    def test_moved_transaction_leaves_its_old_cashbook(self):
+        other = Cashbook.objects.create(name='Other', business=self.business)
+        cursors = {
+            scope: self.sync(**params)['cursor']
+            for scope, params in (('main', {'cashbook': self.cashbook.id}), ('other', {'cashbook': other.id}), ('all', {}))
+        }
+        self.first.cashbook = other
+        self.first.save()
+
+        main = self.sync(cursors['main'], cashbook=self.cashbook.id)
+        self.assertFalse(main['reset'])
+        self.assertEqual(main['transactions'], [])
+        self.assertEqual(main['deleted'], [{'type': 'transaction', 'id': str(self.first.id)}])
+        moved_to = self.sync(cursors['other'], cashbook=other.id)
+        self.assertEqual([row['id'] for row in moved_to['transactions']], [str(self.first.id)])
+        self.assertEqual(moved_to['deleted'], [])
+        # Syncing both cashbooks, the row just changes cashbook
+        both = self.sync(cursors['all'])
+        self.assertEqual([row['cashbook'] for row in both['transactions']], [str(other.id)])
+        self.assertEqual(both['deleted'], [])
+
+    def test_pages_through_streams(self):
+        for amount in range(2, 6):
+            self.add(str(amount))
+        cursor, seen = None, []
+        while True:
+            page = self.sync(cursor, limit=2)
+            seen += [row['id'] for row in page['transactions']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(sorted(seen), sorted(str(pk) for pk in Transaction.objects.values_list('id', flat=True)))
+        self.assertEqual(self.sync(cursor)['transactions'], [])
+
+    def test_scope_changes_reset_the_client(self):
+        cursor = self.sync()['cursor']
+        Cashbook.objects.create(name='Second', business=self.business)
+        self.assertTrue(self.sync(cursor)['reset'])
+
+        cursor = self.sync()['cursor']
+        self.client.post(
+            f'/api/v1/cashbooks/{self.cashbook.id}/import/',
+            {'file': SimpleUploadedFile('rows.csv', b'Date,Type,Amount\n2020-01-01,IN,10\n')}, format='multipart',
+        ).getvalue()
+        delta = self.sync(cursor)
+        self.assertTrue(delta['reset'])
+        self.assertEqual(len(delta['transactions']), 2)
+
+    def test_rejects_foreign_cashbook_and_bad_cursor(self):
+        other = Cashbook.objects.create(
+            name='Other', business=Business.objects.create(name='Other', owner=CustomUser.objects.create_user('x', 'p'))
+        )
+        self.assertEqual(self.client.get('/api/v1/sync/', {'cashbook': other.id}).status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/sync/', {'cursor': 'not-a-cursor'}).status_code, 400)
+
+
+class SyncWriteTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        self.category = Category.objects.create(business=self.business, name='Sales')
+        self.payment_mode = PaymentMode.objects.create(business=self.business, name='Cash')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def data(self, amount, **extra):
+        return {
+            'cashbook': str(self.cashbook.id), 'type': 'IN', 'amount': amount,
+            'category': str(self.category.id), 'payment_mode': str(self.payment_mode.id), **extra,
+        }
+
+    def post(self, operations):
+        response = self.client.post('/api/v1/sync/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_applies_batch_in_order_and_dedupes_replays(self):
+        client_id = str(uuid.uuid4())
+        operations = [
+            {'key': 'k1', 'op': 'create', 'id': client_id, 'data': self.data('10')},
+            {'key': 'k2', 'op': 'create', 'data': self.data('5')},
+            {'key': 'k3', 'op': 'update', 'id': client_id, 'data': self.data('30', remark='edited')},
+            {'key': 'k4', 'op': 'create', 'data': self.data('-1')},
+        ]
+        results = self.post(operations)
+        self.assertEqual([result['status'] for result in results], [201, 201, 200, 400])
+        self.assertEqual(results[2]['data']['remark'], 'edited')
+        self.assertIn('amount', results[3]['errors'])
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Transaction.objects.get(pk=client_id).amount, Decimal('30'))
+
+        # A retried batch applies only what failed before
+        operations[3]['data'] = self.data('1')
+        with CaptureQueriesContext(connection) as queries:
+            replay = self.post(operations + [{'key': 'k5', 'op': 'delete', 'id': client_id}])
+        self.assertEqual([result['replayed'] for result in replay], [True, True, True, False, False])
+        self.assertEqual(replay[0]['id'], client_id)
+        self.assertEqual(replay[4]['status'], 204)
+        self.assertEqual(sorted(Transaction.objects.values_list('amount', flat=True)), [Decimal('1'), Decimal('5')])
+        # One role lookup for the whole batch
+        self.assertEqual(sum('"books_cashbookaccess"."role"' in query['sql'] for query in queries.captured_queries), 1)
+
+    def test_rejected_operations_are_isolated(self):
+        viewer = CustomUser.objects.create_user('viewer', 'password')
+        Member.objects.create(user=viewer, business=self.business, role='VIEWER')
+        existing = Transaction.objects.create(
+            cashbook=self.cashbook, type='IN', amount=Decimal('7'), created_by=self.user,
+            category=self.category, payment_mode=self.payment_mode,
+        )
+        self.client.force_authenticate(viewer)
+        results = self.post([
+            {'key': 'a', 'op': 'create', 'data': self.data('10')},
+            {'key': 'b', 'op': 'delete', 'id': str(existing.id)},
+            {'key': 'c', 'op': 'delete', 'id': str(uuid.uuid4())},
+            {'op': 'delete', 'id': str(existing.id)},
+        ])
+        self.assertEqual([result['status'] for result in results], [403, 403, 404, 400])
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(EVENTS_SETTLE_SECONDS=0)
+class ChangeEventTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        self.category = Category.objects.create(business=self.business, name='Sales')
+        self.payment_mode = PaymentMode.objects.create(business=self.business, name='Cash')
+
+    def create(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transaction.objects.create(
+                cashbook=self.cashbook, type='IN', amount=Decimal(amount), created_by=self.user,
+                category=self.category, payment_mode=self.payment_mode,
+            )
+
+    def test_poll_fans_out_events_with_totals(self):
+        other = Business.objects.create(name='Other', owner=self.user)
+        broker = events.Broker()
+        mine, theirs = events.Subscription([self.business.id]), events.Subscription([other.id])
+        broker.subscriptions[self.business.id].add(mine)
+        broker.subscriptions[other.id].add(theirs)
+        broker.last_id = 0
+
+        transaction = self.create('10')
+        self.create('5')
+        async_to_sync(broker.poll)()
+
+        self.assertEqual(theirs.queue.qsize(), 0)
+        self.assertEqual(mine.queue.qsize(), 2)
+        event_id, text = mine.queue.get_nowait()
+        self.assertIn('event: transaction.created\n', text)
+        data = json.loads(text.split('data: ')[1])
+        self.assertEqual(data['transaction'], str(transaction.id))
+        self.assertEqual(data['totals'], {'total_in': 15.0, 'total_out': 0.0, 'net_balance': 15.0, 'count': 2})
+        self.assertEqual(broker.last_id, ChangeEvent.objects.latest('id').id)
+
+    @override_settings(EVENTS_STREAM_MAX_SECONDS=0)
+    def test_stream_resumes_from_last_event_id(self):
+        self.create('10')
+        seen = ChangeEvent.objects.get().id
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.get().delete()
+
+        async def read(**headers):
+            token = str(RefreshToken.for_user(self.user).access_token)
+            response = await AsyncClient().get(f'/api/v1/events/?access_token={token}', headers=headers)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            return ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+        body = async_to_sync(read)(last_event_id=str(seen))
+        self.assertIn('event: transaction.deleted\n', body)
+        self.assertNotIn('transaction.created', body)
+
+        ChangeEvent.objects.filter(pk=seen).delete()
+        self.assertIn('event: reset\n', async_to_sync(read)(last_event_id=str(seen - 1)))
+        self.assertEqual(async_to_sync(AsyncClient().get)('/api/v1/events/').status_code, 401)
+        # The stream would be buffered by a WSGI server
+        self.assertEqual(self.client.get('/api/v1/events/').status_code, 501)
+
+    @override_settings(EVENTS_SETTLE_SECONDS=60)
+    def test_first_poll_leaves_unsettled_events_to_later_polls(self):
+        self.create('10')
+        seen = ChangeEvent.objects.get().id
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.create('5')
+        # A client resuming from `seen` doesn't get the event written just now...
+        self.assertEqual(async_to_sync(events._fetch)(seen), [])
+
+        broker = events.Broker()
+        subscription = events.Subscription([self.business.id])
+        broker.subscriptions[self.business.id].add(subscription)
+        async_to_sync(broker.poll)()
+        self.assertEqual(broker.last_id, seen)
+        # ...so the broker delivers it once it has settled
+        ChangeEvent.objects.filter(id__gt=seen).update(created_at=timezone.now() - timedelta(minutes=2))
+        async_to_sync(broker.poll)()
+        self.assertEqual(subscription.queue.qsize(), 1)
+
+    def test_resuming_past_retention_resets(self):
+        self.create('10')
+        self.create('5')
+        first, second = ChangeEvent.objects.order_by('id').values_list('id', flat=True)
+        was_pruned = async_to_sync(events._was_pruned)
+        self.assertFalse(was_pruned(first))
+        ChangeEvent.objects.filter(pk=first).update(
+            created_at=timezone.now() - timedelta(hours=settings.EVENTS_RETENTION_HOURS, minutes=1)
+        )
+        self.assertTrue(was_pruned(first))
+        self.assertFalse(was_pruned(second))
+        # Everything pruned: nothing is left to tell what the client missed
+        events.prune_events(older_than=timezone.now() + timedelta(seconds=1))
+        self.assertTrue(was_pruned(second))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        self.category = Category.objects.create(business=self.business, name='Sales')
+        self.payment_mode = PaymentMode.objects.create(business=self.business, name='Cash')
+        for transaction_type, amount in [('IN', '100'), ('OUT', '30'), ('IN', '5'), ('OUT', '1')]:
+            Transaction.objects.create(
+                cashbook=self.cashbook, type=transaction_type, amount=Decimal(amount), created_by=self.user,
+                category=self.category, payment_mode=self.payment_mode,
+            )
+
+    def call(self, view, path, method='get', data=None, **headers):
+        factory = APIRequestFactory()
+        request = factory.post(path, data, format='json', headers=headers) if method == 'post' else factory.get(
+            path, headers=headers
+        )
+        force_authenticate(request, self.user)
+        response = async_to_sync(view)(request) if iscoroutinefunction(view) else view(request)
+        response.render()
+        return response
+
+    def assertSameResponses(self, sync_view, async_view, path, method='get', data=None, **headers):
+        expected = self.call(sync_view, path, method, data, **headers)
+        actual = self.call(async_view, path, method, data, **headers)
+        self.assertEqual(actual.status_code, expected.status_code, path)
+        self.assertEqual(actual.content, expected.content, path)
+        self.assertEqual(actual.get('ETag'), expected.get('ETag'), path)
+        return actual
+
+    def test_async_views_match_sync_views(self):
+        self.assertTrue(iscoroutinefunction(AsyncTransactionViewSet.as_view({'get': 'list'})))
+        cashbook = str(self.cashbook.id)
+        transactions = TransactionViewSet.as_view({'get': 'list'}), AsyncTransactionViewSet.as_view({'get': 'list'})
+        for query in [
+            f'cashbook={cashbook}', f'cashbook={cashbook}&type=IN', f'cashbook={cashbook}&type=OUT&page=1',
+            f'cashbook={cashbook}&type=OUT&pagination=cursor', f'cashbook={cashbook}&pagination=cursor',
+            f'cashbook={cashbook}&page=9', f'category={uuid.uuid4()}', f'cashbook={cashbook}&start_date=x',
+        ]:
+            self.assertSameResponses(*transactions, f'/api/v1/transactions/?{query}')
+
+        summary = SummaryView.as_view(), AsyncSummaryView.as_view()
+        path = f'/api/v1/summary/?cashbook={cashbook}&type=IN'
+        response = self.assertSameResponses(*summary, path)
+        self.assertEqual(response.data['total_in'], Decimal('105'))
+        response = self.assertSameResponses(*summary, path, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertSameResponses(*summary, '/api/v1/summary/?cashbook=nope')
+        member = Member.objects.create(user=self.user, business=self.business, role='ADMIN')
+        response = self.assertSameResponses(*summary, f'/api/v1/summary/?cashbook={cashbook}&member={member.id}')
+        self.assertEqual(response.data['count'], 4)
+        self.assertSameResponses(*summary, '/api/v1/summary/', 'post', {'cashbooks': [cashbook, str(uuid.uuid4())]})
+
+        reports = ReportsViewSet.as_view({'get': 'list'}), AsyncReportsViewSet.as_view({'get': 'list'})
+        response = self.assertSameResponses(*reports, '/api/v1/reports/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.call(reports[1], '/api/v1/reports/', if_none_match=response['ETag']).status_code, 304)
+
+    def test_sync_handlers_of_async_view_sets_still_work(self):
+        create = AsyncTransactionViewSet.as_view({'post': 'create'})
+        response = self.call(create, '/api/v1/transactions/', 'post', {
+            'cashbook': str(self.cashbook.id), 'type': 'IN', 'amount': '7',
+            'category': str(self.category.id), 'payment_mode': str(self.payment_mode.id),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.objects.count(), 5)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+
+    def create(self, transaction_type, amount, days_ago=0, cashbook=None):
+        return Transaction.objects.create(
+            cashbook=cashbook or self.cashbook, type=transaction_type, amount=Decimal(amount), created_by=self.user,
+            transaction_date=date.today() - timedelta(days=days_ago),
+        )
+
+    def assertLedger(self, cashbook, expected):
+        """Stored (amount, running balance) pairs in ledger order, checked against a full replay"""
+        rows = list(Transaction.objects.filter(cashbook=cashbook).order_by(*LEDGER_ORDER))
+        self.assertEqual([(txn.amount, txn.running_balance) for txn in rows], [
+            (Decimal(amount), Decimal(balance)) for amount, balance in expected
+        ])
+
+    def test_backdated_insert_rebalances_later_rows(self):
+        self.create('IN', '100', days_ago=1)
+        self.create('OUT', '30')
+        self.create('IN', '5', days_ago=3)
+        self.assertLedger(self.cashbook, [('5', '5'), ('100', '105'), ('30', '75')])
+
+    def test_edits_that_move_the_balance(self):
+        first = self.create('IN', '100', days_ago=2)
+        self.create('OUT', '30', days_ago=1)
+        last = self.create('IN', '5')
+
+        first.amount = Decimal('50')
+        first.save()
+        self.assertLedger(self.cashbook, [('50', '50'), ('30', '20'), ('5', '25')])
+
+        first.type = 'OUT'
+        first.save()
+        self.assertLedger(self.cashbook, [('50', '-50'), ('30', '-80'), ('5', '-75')])
+
+        # Moving the newest row to the front
+        last.transaction_date = date.today() - timedelta(days=5)
+        last.save()
+        self.assertLedger(self.cashbook, [('5', '5'), ('50', '-45'), ('30', '-75')])
+
+        # A remark edit rewrites no other row: savepoint, previous row, UPDATE,
+        # version bump, balance refresh, release
+        with self.assertNumQueries(6):
+            last.remark = 'edited'
+            last.save()
+
+    def test_move_between_cashbooks(self):
+        other = Cashbook.objects.create(name='Other', business=self.business)
+        self.create('IN', '10', days_ago=2, cashbook=other)
+        moving = self.create('IN', '100', days_ago=1)
+        self.create('OUT', '30')
+
+        moving.cashbook = other
+        moving.save()
+        self.assertLedger(self.cashbook, [('30', '-30')])
+        self.assertLedger(other, [('10', '10'), ('100', '110')])
+
+    def test_delete_rebalances_later_rows(self):
+        first = self.create('IN', '100', days_ago=1)
+        self.create('OUT', '30')
+        first.delete()
+        self.assertLedger(self.cashbook, [('30', '-30')])
+
+    def test_admin_bulk_delete_keeps_ledger_current(self):
+        first = self.create('IN', '10', days_ago=1)
+        self.create('IN', '5')
+        version = Cashbook.objects.get(pk=self.cashbook.pk).data_version
+        self.client.force_login(CustomUser.objects.create_superuser('admin', 'password'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/books/transaction/', {
+                'action': 'delete_selected', '_selected_action': [first.pk], 'post': 'yes',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertLedger(self.cashbook, [('5', '5')])
+        rollups = CashbookDailyRollup.objects.filter(cashbook=self.cashbook, count__gt=0)
+        self.assertEqual([(rollup.total_in, rollup.count) for rollup in rollups], [(Decimal('5'), 1)])
+        self.assertGreater(Cashbook.objects.get(pk=self.cashbook.pk).data_version, version)
+        self.assertTrue(SyncTombstone.objects.filter(object_id=first.pk).exists())
+        self.assertTrue(ChangeEvent.objects.filter(kind='transaction.deleted', object_id=first.pk).exists())
+
+
+class TransactionListTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.first = Cashbook.objects.create(name='First', business=self.business)
+        self.second = Cashbook.objects.create(name='Second', business=self.business)
+        for days_ago in (3, 2, 1):
+            self.create(self.first, 'IN', '100', days_ago)
+            self.create(self.second, 'IN', '10', days_ago)
+        self.create(self.first, 'OUT', '7', 0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, cashbook, transaction_type, amount, days_ago):
+        return Transaction.objects.create(
+            cashbook=cashbook, type=transaction_type, amount=Decimal(amount), created_by=self.user,
+            transaction_date=date.today() - timedelta(days=days_ago),
+        )
+
+    def balances(self, results):
+        """Running balances listed per cashbook, newest first"""
+        balances = {}
+        for row in results:
+            balances.setdefault(row['cashbook'], []).append(Decimal(row['running_balance']))
+        return balances
+
+    def test_filtered_listing_balances_count_matching_rows_per_cashbook(self):
+        first, second = str(self.first.id), str(self.second.id)
+        response = self.client.get('/api/v1/transactions/', {'cashbook': first})
+        self.assertEqual(self.balances(response.json()['results']), {first: [293, 300, 200, 100]})
+
+        response = self.client.get('/api/v1/transactions/', {'cashbook': first, 'type': 'IN'})
+        self.assertEqual(self.balances(response.json()['results']), {first: [300, 200, 100]})
+
+        response = self.client.get('/api/v1/transactions/', {'type': 'IN'})
+        self.assertEqual(self.balances(response.json()['results']), {first: [300, 200, 100], second: [30, 20, 10]})
+
+    def pages(self, params):
+        """Results of every cursor page, following the next links"""
+        results, page_sizes = [], []
+        response = self.client.get('/api/v1/transactions/', {**params, 'pagination': 'cursor'})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            results += body['results']
+            page_sizes.append(len(body['results']))
+            if not body['next']:
+                return results, page_sizes
+            response = self.client.get(body['next'])
+
+    @mock.patch.object(TransactionCursorPagination, 'page_size', 2)
+    def test_cursor_pages_carry_balances_per_cashbook(self):
+        first, second = str(self.first.id), str(self.second.id)
+        results, page_sizes = self.pages({'type': 'IN'})
+        self.assertEqual(page_sizes, [2, 2, 2])
+        self.assertEqual(len({row['id'] for row in results}), 6)
+        self.assertEqual(self.balances(results), {first: [300, 200, 100], second: [30, 20, 10]})
+        # Same as the page number listing
+        offset = self.client.get('/api/v1/transactions/', {'type': 'IN'}).json()['results']
+        self.assertEqual([row['id'] for row in results], [row['id'] for row in offset])
+
+        results, _ = self.pages({'cashbook': first})
+        self.assertEqual(self.balances(results), {first: [293, 300, 200, 100]})
+
+    @mock.patch.object(TransactionCursorPagination, 'page_size', 2)
+    def test_cursor_round_trip(self):
+        body = self.client.get('/api/v1/transactions/', {'type': 'IN', 'pagination': 'cursor'}).json()
+        cursor = parse_qs(urlparse(body['next']).query)['cursor'][0]
+        payload = json.loads(base64.urlsafe_b64decode(cursor))
+        last = Transaction.objects.get(pk=body['results'][-1]['id'])
+        self.assertEqual((payload['d'], payload['i']), (last.transaction_date.isoformat(), str(last.pk)))
+        self.assertEqual({key: Decimal(value) for key, value in payload['b'].items()}, {
+            str(self.first.id): Decimal('200'), str(self.second.id): Decimal('20'),
+        })
+
+        # A cursor without per-cashbook balances recomputes them
+        payload['b'] = '999'
+        old_cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        response = self.client.get('/api/v1/transactions/', {'type': 'IN', 'cursor': old_cursor})
+        self.assertEqual(self.balances(response.json()['results']), {str(self.first.id): [200], str(self.second.id): [20]})
+
+        response = self.client.get('/api/v1/transactions/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        self.today = date.today()
+        self.yesterday = self.today - timedelta(days=1)
+
+    def create(self, transaction_type, amount, day, cashbook=None):
+        return Transaction.objects.create(
+            cashbook=cashbook or self.cashbook, type=transaction_type, amount=Decimal(amount),
+            created_by=self.user, transaction_date=day,
+        )
+
+    def rollups(self, cashbook=None):
+        """{date: (total_in, total_out, count)} of the days that have transactions"""
+        return {
+            rollup.date: (rollup.total_in, rollup.total_out, rollup.count)
+            for rollup in CashbookDailyRollup.objects.filter(cashbook=cashbook or self.cashbook) if rollup.count
+        }
+
+    def test_writes_keep_daily_rollups_current(self):
+        sale = self.create('IN', '100', self.yesterday)
+        self.create('OUT', '30', self.yesterday)
+        rent = self.create('OUT', '50', self.today)
+        self.assertEqual(self.rollups(), {self.yesterday: (100, 30, 2), self.today: (0, 50, 1)})
+
+        sale.amount, sale.transaction_date = Decimal('60'), self.today
+        sale.save()
+        self.assertEqual(self.rollups(), {self.yesterday: (0, 30, 1), self.today: (60, 50, 2)})
+
+        other = Cashbook.objects.create(name='Other', business=self.business)
+        rent.cashbook = other
+        rent.save()
+        rent.refresh_from_db()
+        self.assertEqual(self.rollups(), {self.yesterday: (0, 30, 1), self.today: (60, 0, 1)})
+        self.assertEqual(self.rollups(other), {self.today: (0, 50, 1)})
+
+        sale.delete()
+        self.assertEqual(self.rollups(), {self.yesterday: (0, 30, 1)})
+
+    def test_rebuild_matches_raw_transactions(self):
+        self.create('IN', '100', self.yesterday)
+        self.create('OUT', '30', self.today)
+        expected = self.rollups()
+        # Queryset updates bypass the ledger; the rebuild catches up
+        Transaction.objects.filter(type='IN').update(amount=Decimal('70'))
+        call_command('rebuild_rollups', '--cashbook', str(self.cashbook.id), stdout=StringIO())
+        self.assertEqual(self.rollups(), {**expected, self.yesterday: (70, 0, 1)})
+        self.assertEqual(CashbookDailyRollup.objects.count(), 2)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        category = Category.objects.create(business=self.business, name='Sales')
+        party = Party.objects.create(business=self.business, name='Acme')
+        yesterday = date.today() - timedelta(days=1)
+        Transaction.objects.create(
+            cashbook=self.cashbook, type='IN', amount=Decimal('100'), created_by=self.user,
+            category=category, party=party, remark='Invoice 1', transaction_date=yesterday,
+        )
+        Transaction.objects.create(cashbook=self.cashbook, type='OUT', amount=Decimal('30.5'), created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        report_cache.clear()
+
+    def get(self, export):
+        return self.client.get(f'/api/v1/reports/{self.cashbook.id}/{export}/')
+
+    def assertExcelRows(self, content):
+        rows = list(openpyxl.load_workbook(BytesIO(content)).active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:3], ('Date', 'Type', 'Party'))
+        self.assertEqual([row[1:] for row in rows[1:3]], [
+            ('IN', 'Acme', 'Sales', '-', 'Invoice 1', 100, None, 100),
+            ('OUT', '-', '-', '-', None, None, 30.5, 69.5),
+        ])
+        self.assertEqual(rows[-1][5:], ('TOTALS', 100, 30.5, 69.5))
+
+    def test_excel_export(self):
+        response = self.get('export_excel')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], exports.EXCEL_CONTENT_TYPE)
+        self.assertIn('filename="Main_report.xlsx"', response['Content-Disposition'])
+        self.assertExcelRows(response.content)
+
+        # Workbooks too large to cache are streamed from the spooled file
+        report_cache.clear()
+        with mock.patch.object(report_cache, 'max_entry_bytes', 0):
+            response = self.get('export_excel')
+        self.assertTrue(response.streaming)
+        self.assertExcelRows(b''.join(response.streaming_content))
+
+    def test_csv_and_jsonl_exports_stream(self):
+        response = self.get('export_csv')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], exports.CSV_HEADERS)
+        self.assertEqual([row[2:] for row in rows[1:]], [
+            ['IN', 'Acme', 'Sales', '-', 'Invoice 1', '100.00', '', '100.00'],
+            ['OUT', '-', '-', '-', '', '', '30.50', '69.50'],
+        ])
+
+        response = self.get('export_jsonl')
+        self.assertTrue(response.streaming)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(line['type'], line['amount_in'], line['running_balance']) for line in lines], [
+            ('IN', '100.00', '100.00'), ('OUT', '0.00', '69.50'),
+        ])
+
+        self.client.force_authenticate(CustomUser.objects.create_user('stranger', 'password'))
+        self.assertEqual(self.get('export_csv').status_code, 404)
+
+    def test_pdf_cached_until_cashbook_changes(self):
+        with mock.patch.object(exports, 'write_pdf', wraps=exports.write_pdf) as write_pdf:
+            first = self.get('export_pdf')
+            self.assertEqual(first['Content-Type'], 'application/pdf')
+            self.assertEqual(self.get('export_pdf').content, first.content)
+            self.assertEqual(write_pdf.call_count, 1)
+
+            Transaction.objects.create(cashbook=self.cashbook, type='IN', amount=Decimal('5'), created_by=self.user)
+            self.assertNotEqual(self.get('export_pdf').content, first.content)
+            self.assertEqual(write_pdf.call_count, 2)
+
+    def test_empty_cashbook_exports(self):
+        self.cashbook = Cashbook.objects.create(name='Empty', business=self.business)
+        for export in ('export_pdf', 'export_excel', 'export_csv', 'export_jsonl'):
+            response = self.get(export)
+            self.assertEqual(response.status_code, 200, export)
+        self.assertTrue(self.get('export_pdf').content.startswith(b'%PDF'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='export-tests-'))
+@mock.patch('books.export_jobs.connections', mock.MagicMock())
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner', 'password')
+        self.business = Business.objects.create(name='Shop', owner=self.user)
+        self.cashbook = Cashbook.objects.create(name='Main', business=self.business)
+        Transaction.objects.create(cashbook=self.cashbook, type='IN', amount=Decimal('100'), created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, export_format='CSV'):
+        response = self.client.post('/api/v1/export-jobs/', {'cashbook': str(self.cashbook.id), 'format': export_format})
+        self.assertEqual(response.status_code, 201)
+        return ExportJob.objects.get(pk=response.json()['id'])
+
+    def expire(self, job):
+        ExportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(export_jobs.cleanup_expired_exports(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'EXPIRED')
+        self.assertFalse(job.file)
+
+    def test_lifecycle_and_download(self):
+        job = self.submit()
+        self.assertEqual(job.status, 'PENDING')
+        self.assertEqual(self.client.get(f'/api/v1/export-jobs/{job.id}/download/').status_code, 409)
+
+        self.assertEqual(export_jobs.claim_jobs(5), [job.id])
+        self.assertEqual(export_jobs.claim_jobs(5), [])
+        self.assertEqual(export_jobs.run_export_job(job.id), 'DONE')
+
+        body = self.client.get(f'/api/v1/export-jobs/{job.id}/').json()
+        self.assertEqual(body['status'], 'DONE')
+        self.assertTrue(body['download_url'].endswith(f'/api/v1/export-jobs/{job.id}/download/'))
+        response = self.client.get(body['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'100.00', b''.join(response.streaming_content))
+
+        self.client.force_authenticate(CustomUser.objects.create_user('stranger', 'password'))
+        self.assertEqual(self.client.get(f'/api/v1/export-jobs/{job.id}/download/').status_code, 404)
+
+        job.refresh_from_db()
+        path = job.file.path
+        self.expire(job)
+        self.assertFalse(os.path.exists(path))
+
+    def test_empty_cashbook(self):
+        self.cashbook = Cashbook.objects.create(name='Empty', business=self.business)
+        for export_format in ('PDF', 'XLSX', 'CSV'):
+            job = self.submit(export_format)
+            export_jobs.claim_jobs(1)
+            self.assertEqual(export_jobs.run_export_job(job.id), 'DONE', export_format)
+
+    def test_failed_jobs_expire(self):
+        def broken_writer(cashbook, fileobj):
+            fileobj.write(b'partial')
+            raise ValueError('disk full')
+
+        job = self.submit()
+        export_jobs.claim_jobs(1)
+        with mock.patch.dict(exports.FORMATS, {'CSV': (broken_writer, 'csv', 'text/csv')}):
+            self.assertEqual(export_jobs.run_export_job(job.id), 'FAILED')
+        job.refresh_from_db()
+        self.assertEqual((job.error, job.file.name), ('disk full', ''))
+        self.assertIsNotNone(job.expires_at)
+        self.assertEqual(export_jobs.cleanup_expired_exports(), 0)
+        self.expire(job)
+
+        # Failures recorded before they had an expiry time
+        ExportJob.objects.filter(pk=job.pk).update(
+            status='FAILED', expires_at=None, finished_at=timezone.now() - settings.EXPORT_JOB_TTL * 2
+        )
+        self.assertEqual(export_jobs.cleanup_expired_exports(), 1)
@@ -0,0 +1,174 @@
+"""
+Typeahead lookup of a business's parties and categories by name.
+
+PostgreSQL answers from pg_trgm GIN indexes on name (migration 0011): prefix
+matches first, then names similar to the query (the % operator), each by
+similarity. Other databases use NameIndex, an in-process per-business index
+built on first use. Committed saves and deletes in this process update it in
+place (see books.signals); it is rebuilt after TYPEAHEAD_INDEX_TTL seconds, which
+bounds staleness from writes made by other worker processes. At most
+TYPEAHEAD_INDEX_MAX_ENTRIES indexes are kept, least recently used ones are dropped.
+"""
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+# pg_trgm's default similarity threshold
+SIMILARITY_THRESHOLD = 0.3
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def trigrams(text):
+    """Trigrams of each word, padded the way pg_trgm does ("  w", " wo", "wor", "ord", "rd ")"""
+    result = set()
+    for word in text.lower().split():
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class NameIndex:
+    """Names of one business's parties or categories, sorted for prefix search and with trigram postings"""
+
+    def __init__(self, rows):
+        self.names = {}
+        self.gram_counts = {}
+        self.sorted_keys = []
+        self.postings = defaultdict(set)
+        for pk, name in rows:
+            self._add(str(pk), name)
+        self.sorted_keys.sort()
+        self.built_at = time.monotonic()
+
+    def _add(self, pk, name):
+        key = name.lower()
+        grams = trigrams(key)
+        self.names[pk] = (key, name, grams)
+        self.gram_counts[pk] = len(grams)
+        self.sorted_keys.append((key, pk))
+        for gram in grams:
+            self.postings[gram].add(pk)
+
+    def upsert(self, pk, name):
+        self.discard(pk)
+        self._add(pk, name)
+        # _add() appended; move the new key into place
+        self.sorted_keys.pop()
+        bisect.insort(self.sorted_keys, (name.lower(), pk))
+
+    def discard(self, pk):
+        if pk not in self.names:
+            return
+        key, _, grams = self.names.pop(pk)
+        del self.gram_counts[pk]
+        del self.sorted_keys[bisect.bisect_left(self.sorted_keys, (key, pk))]
+        for gram in grams:
+            self.postings[gram].discard(pk)
+
+    def search(self, query, limit):
+        query = query.lower().strip()
+        results = []
+        position = bisect.bisect_left(self.sorted_keys, (query,))
+        while position < len(self.sorted_keys) and len(results) < limit:
+            key, pk = self.sorted_keys[position]
+            if not key.startswith(query):
+                break
+            results.append(pk)
+            position += 1
+
+        if len(results) < limit:
+            query_grams = trigrams(query)
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self.postings.get(gram, ()))
+            for pk in results:
+                shared.pop(pk, None)
+            # similarity >= threshold needs at least this many shared trigrams
+            minimum = SIMILARITY_THRESHOLD * len(query_grams)
+            sizes = self.gram_counts
+            scored = [
+                (count / (len(query_grams) + sizes[pk] - count), pk)
+                for pk, count in shared.items() if count >= minimum
+            ]
+            best = heapq.nsmallest(
+                limit - len(results),
+                (item for item in scored if item[0] >= SIMILARITY_THRESHOLD),
+                key=lambda item: (-item[0], self.names[item[1]][0]),
+            )
+            results += [pk for _, pk in best]
+
+        return [{'id': pk, 'name': self.names[pk][1]} for pk in results]
+
+
+# (model label, business id) -> NameIndex, least recently used first
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _update_index(instance, change):
+    """Apply change(index) to an already built index of the instance's business once the write commits"""
+    key = (instance._meta.label, instance.business_id)
+
+    def apply():
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is not None:
+            change(index)
+
+    transaction.on_commit(apply)
+
+
+def record_saved(instance):
+    pk, name = str(instance.pk), instance.name
+    _update_index(instance, lambda index: index.upsert(pk, name))
+
+
+def record_deleted(instance):
+    pk = str(instance.pk)
+    _update_index(instance, lambda index: index.discard(pk))
+
+
+def _name_index(model, business_id):
+    key = (model._meta.label, business_id)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+    if index is None or time.monotonic() - index.built_at > settings.TYPEAHEAD_INDEX_TTL:
+        index = NameIndex(model.objects.filter(business_id=business_id).values_list('id', 'name'))
+        with _indexes_lock:
+            _indexes[key] = index
+            _indexes.move_to_end(key)
+            while len(_indexes) > settings.TYPEAHEAD_INDEX_MAX_ENTRIES:
+                _indexes.popitem(last=False)
+    return index
+
+
+def lookup(model, business_id, query, limit=DEFAULT_LIMIT):
+    """Up to `limit` {id, name} of `model` rows in a business: prefix matches, then similar names"""
+    if connection.vendor != 'postgresql':
+        return _name_index(model, business_id).search(query, limit)
+
+    table = model._meta.db_table
+    prefix = _like_prefix(query)
+    rows = model.objects.filter(
+        RawSQL(f'({table}.name ILIKE %s OR {table}.name %% %s)', [prefix, query], output_field=BooleanField()),
+        business_id=business_id,
+    ).annotate(
+        is_prefix=RawSQL(f'{table}.name ILIKE %s', [prefix], output_field=BooleanField()),
+        similarity=RawSQL(f'similarity({table}.name, %s)', [query], output_field=FloatField()),
+    ).order_by('-is_prefix', '-similarity', 'name')
+    return [{'id': str(pk), 'name': name} for pk, name in rows.values_list('id', 'name')[:limit]]
+
+
+def _like_prefix(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%'
@@ -1,12 +1,20 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (
     BusinessViewSet, CashbookViewSet, MemberViewSet, 
     CategoryViewSet, PartyViewSet, PaymentModeViewSet, 
-    TransactionViewSet, SummaryView
+    TransactionViewSet, SummaryView, SyncView
 )
-from .report_views import ReportsViewSet
+from .report_views import ReportsViewSet, ExportJobViewSet
+from .event_views import change_events
+
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        AsyncReportsViewSet as ReportsViewSet, AsyncSummaryView as SummaryView,
+        AsyncTransactionViewSet as TransactionViewSet,
+    )
 
 router = DefaultRouter()
 router.register(r'businesses', BusinessViewSet, basename='business')
@@ -17,8 +25,11 @@ router.register(r'parties', PartyViewSet, basename='party')
 router.register(r'payment-modes', PaymentModeViewSet, basename='payment-mode')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
 router.register(r'reports', ReportsViewSet, basename='reports')
+router.register(r'export-jobs', ExportJobViewSet, basename='export-job')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('summary/', SummaryView.as_view(), name='summary'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('events/', change_events, name='events'),
 ]
@@ -1,24 +1,42 @@
+import json
+import uuid
+
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum, F, Q
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Count, FilteredRelation, Sum, F, Q
+from django.http import StreamingHttpResponse
 from .models import Business, Cashbook, Member, Category, Party, PaymentMode, Transaction
+from .access import OWNER, AccessResolver
+from .ledger import LEDGER_ORDER, record_bulk_create, running_balance_window
+from .pagination import TransactionCursorPagination
+from .filters import COMPILED_PARAMS, compile_filters
+from .search import TransactionSearchFilter
+from . import conditional, imports, sync, typeahead
 from .serializers import (
     BusinessSerializer, CashbookSerializer, MemberSerializer, 
-    CategorySerializer, PartySerializer, PaymentModeSerializer, TransactionSerializer
+    CategorySerializer, PartySerializer, PaymentModeSerializer, TransactionSerializer,
+    TransactionBulkRowSerializer,
 )
 
 class IsBusinessMember(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Check if user is a member of the business associated with the object
+        access = AccessResolver.for_request(request)
         if isinstance(obj, Business):
-            return obj.members.filter(user=request.user).exists() or obj.owner == request.user
+            return access.business_role(obj) is not None
+        if isinstance(obj, Cashbook):
+            return access.cashbook_role(obj.pk) is not None
+        if hasattr(obj, 'cashbook_id'):
+            return access.cashbook_role(obj.cashbook_id) is not None
         if hasattr(obj, 'business'):
-            return obj.business.members.filter(user=request.user).exists() or obj.business.owner == request.user
-        if hasattr(obj, 'cashbook'):
-            return obj.cashbook.business.members.filter(user=request.user).exists() or obj.cashbook.business.owner == request.user
+            return access.business_role(obj.business) is not None
         return False
 
 class BusinessViewSet(viewsets.ModelViewSet):
@@ -37,10 +55,7 @@ class CashbookViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # User can see cashbooks they own OR are a member of
-        return Cashbook.objects.filter(
-            Q(business__owner=self.request.user) | 
-            Q(business__members__user=self.request.user)
-        ).distinct()
+        return Cashbook.objects.visible_to(self.request.user)
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -70,20 +85,19 @@ class CashbookViewSet(viewsets.ModelViewSet):
     def user_role(self, request, pk=None):
         """Get the user's role in this cashbook"""
         cashbook = self.get_object()
-        user = request.user
+        role = AccessResolver.for_request(request).cashbook_role(cashbook.id)
         
         # Check if owner
-        if cashbook.business.owner == user:
+        if role == OWNER:
             return Response({'role': 'owner', 'can_create': True, 'can_edit': True, 'can_delete': True})
         
         # Check if member
-        member = Member.objects.filter(business=cashbook.business, user=user).first()
-        if member:
-            can_create = member.role in ['admin', 'editor']
-            can_edit = member.role in ['admin', 'editor']
-            can_delete = member.role == 'admin'
+        if role:
+            can_create = role in ['ADMIN', 'EDITOR']
+            can_edit = role in ['ADMIN', 'EDITOR']
+            can_delete = role == 'ADMIN'
             return Response({
-                'role': member.role,
+                'role': role,
                 'can_create': can_create,
                 'can_edit': can_edit,
                 'can_delete': can_delete
@@ -91,102 +105,134 @@ class CashbookViewSet(viewsets.ModelViewSet):
         
         return Response({'error': 'No access'}, status=403)
 
+    @action(detail=True, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_transactions(self, request, pk=None):
+        """
+        Import a CSV or XLSX file (multipart field `file`, optional `format`) into this cashbook.
+        The response is NDJSON: a progress line per imported chunk, then a final line with
+        "done": true, or an "error" line (with the file row) after which nothing was imported.
+        """
+        cashbook = self.get_object()
+        role = AccessResolver.for_request(request).cashbook_role(cashbook.id)
+        if role is None or role == 'VIEWER':
+            return Response({'error': 'Viewers cannot create transactions.'}, status=403)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=400)
+        file_format = (request.data.get('format') or imports.detect_format(upload.name)).upper()
+        if file_format not in ('CSV', 'XLSX'):
+            return Response({'error': 'format must be CSV or XLSX'}, status=400)
+
+        def lines():
+            try:
+                rows = imports.read_rows(upload, file_format)
+                for progress in imports.import_transactions(cashbook, request.user, rows):
+                    yield json.dumps(progress) + '\n'
+            except ValueError as error:
+                yield json.dumps({'error': str(error), 'row': getattr(error, 'row', None)}) + '\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, TransactionSearchFilter, filters.OrderingFilter]
     filterset_fields = ['cashbook', 'type', 'category', 'party', 'payment_mode', 'created_by']
-    search_fields = ['remark', 'amount']
     ordering_fields = ['transaction_date', 'created_at', 'amount']
     ordering = ['-created_at']  # Default: newest first
 
     def get_queryset(self):
         """Filter transactions based on cashbooks user has access to"""
-        from datetime import datetime, timedelta
-        from django.utils import timezone
-        
         user = self.request.user
-        # Get all cashbooks where user is owner or member
-        queryset = Transaction.objects.filter(
-            cashbook__business__owner=user
-        ) | Transaction.objects.filter(
-            cashbook__business__members__user=user
-        )
+        # Get all cashbooks where user is owner or member. A subquery rather than
+        # joins keeps rows unique, which the running balance window relies on.
+        queryset = Transaction.objects.visible_to(user)
         
         # Apply cashbook filter
         cashbook_id = self.request.query_params.get('cashbook')
         if cashbook_id:
             queryset = queryset.filter(cashbook_id=cashbook_id)
         
-        # Apply duration filter
-        duration = self.request.query_params.get('duration')
-        today = timezone.now().date()
-        
-        if duration == 'TODAY':
-            queryset = queryset.filter(transaction_date=today)
-        elif duration == 'LAST_7_DAYS':
-            start_date = today - timedelta(days=7)
-            queryset = queryset.filter(transaction_date__gte=start_date)
-        elif duration == 'LAST_30_DAYS':
-            start_date = today - timedelta(days=30)
-            queryset = queryset.filter(transaction_date__gte=start_date)
-        elif duration == 'THIS_MONTH':
-            queryset = queryset.filter(
-                transaction_date__year=today.year,
-                transaction_date__month=today.month
-            )
-        # ALL_TIME (default) - no filter needed
-        
-        # Apply member filter (convert Member ID to User)
-        member_id = self.request.query_params.get('member')
-        if member_id:
-            try:
-                member_obj = Member.objects.get(id=member_id)
-                queryset = queryset.filter(created_by=member_obj.user)
-            except (Member.DoesNotExist, ValueError):
-                queryset = queryset.none()
-        
-        # Filter by date range (custom date range if provided)
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
-        if start_date:
-            queryset = queryset.filter(transaction_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(transaction_date__lte=end_date)
-        
-        return queryset.distinct()
+        # Duration preset / custom date range and member; the filter backends
+        # handle type, category, party, payment_mode and search
+        transaction_filter = self.get_transaction_filter()
+        return queryset.filter(transaction_filter.date_q('transaction_date') & transaction_filter.member_q())
+
+    def get_transaction_filter(self):
+        if not hasattr(self, '_transaction_filter'):
+            self._transaction_filter = compile_filters(self.request.query_params)
+        return self._transaction_filter
+
+    # Query params that don't narrow down which rows are listed
+    NON_FILTER_PARAMS = {'cashbook', 'page', 'page_size', 'ordering', 'format', 'cursor', 'pagination'}
+
+    def _wants_cursor(self):
+        """Clients opt into keyset pagination with ?pagination=cursor (or by following a cursor link)"""
+        params = self.request.query_params
+        return params.get('pagination') == 'cursor' or bool(params.get('cursor'))
+
+    def _is_full_ledger(self):
+        """True when listing one whole cashbook, so the stored running balances apply as-is"""
+        params = self.request.query_params
+        if not params.get('cashbook') or not self.get_transaction_filter().is_empty:
+            return False
+        # Whatever else is left (e.g. created_by) is handled by the filter backends
+        known = self.NON_FILTER_PARAMS | COMPILED_PARAMS
+        return not any(value and key not in known for key, value in params.items())
 
     def list(self, request, *args, **kwargs):
         """List transactions with running balance calculated"""
+        cashbook_id = request.query_params.get('cashbook')
+        etag = conditional.compute_etag(
+            request, 'transactions',
+            conditional.cashbook_versions(request.user, [cashbook_id] if cashbook_id else None),
+        )
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
+        response = self._list(request)
+        response['ETag'] = etag
+        return response
+
+    def _list(self, request):
         queryset = self.filter_queryset(self.get_queryset())
-        
-        # For running balance, we need to order by date ascending
-        transactions_ordered = queryset.order_by('transaction_date', 'created_at')
-        
-        # Calculate running balance
-        running_balance = 0
-        transactions_with_balance = []
-        
-        for txn in transactions_ordered:
-            if txn.type == 'IN':
-                running_balance += txn.amount
-            else:  # OUT
-                running_balance -= txn.amount
-            
-            # Attach running balance to transaction
-            txn.running_balance = running_balance
-            transactions_with_balance.append(txn)
-        
-        # Reverse to show newest first
-        transactions_with_balance.reverse()
-        
-        # Paginate
-        page = self.paginate_queryset(transactions_with_balance)
-        if page is not None:
+        full_ledger = self._is_full_ledger()
+
+        if self._wants_cursor():
+            paginator = TransactionCursorPagination()
+            page = paginator.paginate_queryset(
+                queryset.select_related(*self.LIST_RELATED), request, view=self, carry_balance=not full_ledger,
+            )
             serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        queryset = self._ledger_queryset(queryset, full_ledger)
+        page = self.paginate_queryset(queryset)
+        return self._ledger_response(page if page is not None else list(queryset), full_ledger, page is not None)
+
+    LIST_RELATED = ('category', 'party', 'payment_mode', 'created_by')
+
+    def _ledger_queryset(self, queryset, full_ledger):
+        """The page number listing: filtered rows newest first, with their running balances"""
+        if not full_ledger:
+            # Filtered views show the running balance of the matching rows only;
+            # the database computes it before LIMIT/OFFSET so only the page is fetched
+            queryset = queryset.annotate(window_balance=running_balance_window())
+
+        # Newest first, or best search matches first with ?ordering=relevance
+        ordering = ['-' + field for field in LEDGER_ORDER]
+        if self.request.query_params.get('ordering') == 'relevance' and 'search_rank' in queryset.query.annotations:
+            ordering.insert(0, '-search_rank')
+        return queryset.select_related(*self.LIST_RELATED).order_by(*ordering)
+
+    def _ledger_response(self, transactions, full_ledger, paginated):
+        if not full_ledger:
+            for txn in transactions:
+                txn.running_balance = txn.window_balance
+
+        serializer = self.get_serializer(transactions, many=True)
+        if paginated:
             return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(transactions_with_balance, many=True)
         return Response(serializer.data)
 
     def perform_create(self, serializer):
@@ -195,100 +241,173 @@ class TransactionViewSet(viewsets.ModelViewSet):
         cashbook = serializer.validated_data['cashbook']
         
         # Check if user has access to this cashbook
-        is_owner = cashbook.business.owner == user
-        member = Member.objects.filter(business=cashbook.business, user=user).first()
+        role = AccessResolver.for_request(self.request).cashbook_role(cashbook.id)
         
-        if not is_owner and not member:
+        if not role:
             raise permissions.PermissionDenied("You do not have access to this cashbook.")
         
         # Check if user has permission to create transactions
-        if member and member.role == 'VIEWER':
+        if role == 'VIEWER':
             raise permissions.PermissionDenied("Viewers cannot create transactions.")
         
         serializer.save(created_by=user)
 
     def perform_update(self, serializer):
         """Update transaction with permission check"""
-        user = self.request.user
-        transaction = self.get_object()
-        cashbook = transaction.cashbook
-        
-        is_owner = cashbook.business.owner == user
-        member = Member.objects.filter(business=cashbook.business, user=user).first()
+        # update() already loaded the instance through get_object()
+        role = AccessResolver.for_request(self.request).cashbook_role(serializer.instance.cashbook_id)
         
-        if not is_owner and not member:
+        if not role:
             raise permissions.PermissionDenied("You do not have access to this cashbook.")
         
-        if member and member.role == 'VIEWER':
+        if role == 'VIEWER':
             raise permissions.PermissionDenied("Viewers cannot edit transactions.")
         
         serializer.save()
 
     def perform_destroy(self, instance):
         """Delete transaction with permission check"""
-        user = self.request.user
-        cashbook = instance.cashbook
-        
-        is_owner = cashbook.business.owner == user
-        member = Member.objects.filter(business=cashbook.business, user=user).first()
+        role = AccessResolver.for_request(self.request).cashbook_role(instance.cashbook_id)
         
-        if not is_owner and not member:
+        if not role:
             raise permissions.PermissionDenied("You do not have access to this cashbook.")
         
         # Only admins/owners can delete
-        if member and member.role != 'ADMIN':
+        if role not in (OWNER, 'ADMIN'):
             raise permissions.PermissionDenied("Only admins can delete transactions.")
         
         instance.delete()
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many transactions in one request: {"transactions": [row, ...]} or a bare list.
+        Every row is validated first; if any fails nothing is created and the response
+        lists the errors by row index.
+        """
+        rows = request.data.get('transactions') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'transactions must be a non-empty list'}, status=400)
+        if len(rows) > settings.BULK_CREATE_MAX_ROWS:
+            return Response(
+                {'error': f'At most {settings.BULK_CREATE_MAX_ROWS} transactions per request'}, status=400
+            )
+
+        errors = {}
+        valid = []
+        for index, row in enumerate(rows):
+            serializer = TransactionBulkRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors[index] = serializer.errors
+
+        # One query per related model for the whole batch
+        def referenced(field):
+            return {data[field] for _, data in valid if data.get(field)}
+        cashbooks = Cashbook.objects.only('id', 'business_id').in_bulk(referenced('cashbook'))
+        related = {
+            'category': Category.objects.only('id', 'business_id').in_bulk(referenced('category')),
+            'party': Party.objects.only('id', 'business_id').in_bulk(referenced('party')),
+            'payment_mode': PaymentMode.objects.only('id', 'business_id').in_bulk(referenced('payment_mode')),
+        }
+
+        # Roles come from memory after the first lookup, so this is one query for any number of cashbooks
+        access = AccessResolver.for_request(request)
+        transactions = []
+        for index, data in valid:
+            cashbook = cashbooks.get(data['cashbook'])
+            role = access.cashbook_role(cashbook.id) if cashbook else None
+            if role is None:
+                errors[index] = {'cashbook': ['Cashbook not found or access denied']}
+                continue
+            if role == 'VIEWER':
+                errors[index] = {'cashbook': ['Viewers cannot create transactions.']}
+                continue
+            row_errors = {}
+            for field, objects in related.items():
+                value = data.get(field)
+                if value and (value not in objects or objects[value].business_id != cashbook.business_id):
+                    row_errors[field] = ['Not found in the business of this cashbook']
+            if row_errors:
+                errors[index] = row_errors
+                continue
+            transactions.append(Transaction(
+                cashbook=cashbook, type=data['type'], amount=data['amount'], remark=data['remark'],
+                category_id=data['category'], party_id=data.get('party'), payment_mode_id=data['payment_mode'],
+                created_by=request.user,
+            ))
+
+        if errors:
+            return Response(
+                {'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)]},
+                status=400,
+            )
+
+        with db_transaction.atomic():
+            Transaction.objects.bulk_create(transactions, batch_size=settings.BULK_CREATE_BATCH_SIZE)
+            record_bulk_create(transactions)
+        return Response(
+            {'created': len(transactions), 'ids': [str(txn.id) for txn in transactions]},
+            status=status.HTTP_201_CREATED,
+        )
+
+class TypeaheadMixin:
+    """GET <list url>/typeahead/?business=<id>&q=<text>[&limit=N]: best name matches in a business"""
+
+    @action(detail=False, methods=['get'])
+    def typeahead(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            business_id = uuid.UUID(request.query_params.get('business', ''))
+            limit = min(int(request.query_params.get('limit', typeahead.DEFAULT_LIMIT)), typeahead.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'business id and a numeric limit required'}, status=400)
+
+        if not Business.objects.visible_to(request.user).filter(pk=business_id).exists():
+            return Response({'error': 'Business not found or access denied'}, status=404)
+        if not query or limit < 1:
+            return Response([])
+        return Response(typeahead.lookup(self.get_queryset().model, business_id, query, limit))
+
+class CategoryViewSet(TypeaheadMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        return Category.objects.filter(business__owner=user) | Category.objects.filter(business__members__user=user)
+        return Category.objects.visible_to(user)
 
     def perform_create(self, serializer):
         business = serializer.validated_data['business']
-        user = self.request.user
-        
-        is_owner = business.owner == user
-        is_member = business.members.filter(user=user).exists()
+        role = AccessResolver.for_request(self.request).business_role(business)
         
-        if not is_owner and not is_member:
+        if not role:
             raise permissions.PermissionDenied("You do not have access to this business.")
             
         # Check specific role if member (e.g., viewers can't create)
-        if is_member:
-            member = business.members.get(user=user)
-            if member.role == 'VIEWER':
-                 raise permissions.PermissionDenied("Viewers cannot create categories.")
+        if role == 'VIEWER':
+            raise permissions.PermissionDenied("Viewers cannot create categories.")
                  
         serializer.save()
 
-class PartyViewSet(viewsets.ModelViewSet):
+class PartyViewSet(TypeaheadMixin, viewsets.ModelViewSet):
     serializer_class = PartySerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        return Party.objects.filter(business__owner=user) | Party.objects.filter(business__members__user=user)
+        return Party.objects.visible_to(user)
 
     def perform_create(self, serializer):
         business = serializer.validated_data['business']
-        user = self.request.user
+        role = AccessResolver.for_request(self.request).business_role(business)
         
-        is_owner = business.owner == user
-        is_member = business.members.filter(user=user).exists()
-        
-        if not is_owner and not is_member:
+        if not role:
             raise permissions.PermissionDenied("You do not have access to this business.")
             
-        if is_member:
-            member = business.members.get(user=user)
-            if member.role == 'VIEWER':
-                 raise permissions.PermissionDenied("Viewers cannot create parties.")
+        if role == 'VIEWER':
+            raise permissions.PermissionDenied("Viewers cannot create parties.")
                  
         serializer.save()
 
@@ -298,22 +417,17 @@ class PaymentModeViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return PaymentMode.objects.filter(business__owner=user) | PaymentMode.objects.filter(business__members__user=user)
+        return PaymentMode.objects.visible_to(user)
 
     def perform_create(self, serializer):
         business = serializer.validated_data['business']
-        user = self.request.user
-        
-        is_owner = business.owner == user
-        is_member = business.members.filter(user=user).exists()
+        role = AccessResolver.for_request(self.request).business_role(business)
         
-        if not is_owner and not is_member:
+        if not role:
             raise permissions.PermissionDenied("You do not have access to this business.")
             
-        if is_member:
-            member = business.members.get(user=user)
-            if member.role == 'VIEWER':
-                 raise permissions.PermissionDenied("Viewers cannot create payment modes.")
+        if role == 'VIEWER':
+            raise permissions.PermissionDenied("Viewers cannot create payment modes.")
                  
         serializer.save()
 
@@ -327,92 +441,141 @@ class MemberViewSet(viewsets.ModelViewSet):
 from rest_framework.views import APIView
 
 class SummaryView(APIView):
+    """
+    Totals of one cashbook (?cashbook=<id>) or, batched, of several
+    (?cashbook=a,b,c or POST {"cashbooks": [...]}, answered as {cashbook_id: totals}).
+    Access check, data versions and totals come from a single query.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from datetime import datetime, timedelta
-        from django.utils import timezone
-        from django.db.models import Q
-        
-        cashbook_id = request.query_params.get('cashbook')
-        if not cashbook_id:
-            return Response({'error': 'cashbook_id required'}, status=400)
-        
+        cashbook_ids = self._query_cashbook_ids(request)
+        return self._respond(request, request.query_params, cashbook_ids, batch=len(cashbook_ids) > 1)
+
+    def post(self, request):
+        cashbook_ids = request.data.get('cashbooks') or []
+        if not isinstance(cashbook_ids, list):
+            return Response({'error': 'cashbooks must be a list of ids'}, status=400)
+        return self._respond(request, request.data, cashbook_ids, batch=True)
+
+    @staticmethod
+    def _query_cashbook_ids(request):
+        return [
+            cashbook_id for value in request.query_params.getlist('cashbook')
+            for cashbook_id in value.split(',') if cashbook_id
+        ]
+
+    def _respond(self, request, params, cashbook_ids, batch):
+        cashbook_ids, transaction_filter = self._parse(params, cashbook_ids)
+
+        # Polls carrying an ETag are checked against the versions alone, before aggregating
+        if self._is_conditional(request):
+            etag = self._etag(request, conditional.cashbook_versions(request.user, cashbook_ids), transaction_filter)
+            if conditional.is_not_modified(request, etag):
+                return conditional.not_modified(etag)
+
         # Verify ownership or membership
-        cashbook_exists = Cashbook.objects.filter(
-            Q(id=cashbook_id, business__owner=request.user) |
-            Q(id=cashbook_id, business__members__user=request.user)
-        ).exists()
-        
-        if not cashbook_exists:
+        rows = list(self._summaries(request.user, transaction_filter, cashbook_ids))
+        return self._summary_response(request, rows, transaction_filter, batch)
+
+    def _parse(self, params, cashbook_ids):
+        if not cashbook_ids:
+            raise ValidationError({'error': 'cashbook_id required'})
+        try:
+            cashbook_ids = [uuid.UUID(str(cashbook_id)) for cashbook_id in cashbook_ids]
+        except ValueError:
+            raise ValidationError({'error': 'Invalid cashbook id'})
+        return cashbook_ids, compile_filters(params)
+
+    @staticmethod
+    def _is_conditional(request):
+        return request.method == 'GET' and request.headers.get('If-None-Match')
+
+    @staticmethod
+    def _etag(request, versions, transaction_filter):
+        return conditional.compute_etag(request, 'summary', versions, transaction_filter.cache_key())
+
+    def _summary_response(self, request, rows, transaction_filter, batch):
+        if not rows and not batch:
             return Response({'error': 'Cashbook not found or access denied'}, status=404)
 
-        # Start with base queryset
-        transactions = Transaction.objects.filter(cashbook_id=cashbook_id)
-        
-        # Apply duration filter
-        duration = request.query_params.get('duration')
-        today = timezone.now().date()
-        
-        if duration == 'TODAY':
-            transactions = transactions.filter(transaction_date=today)
-        elif duration == 'LAST_7_DAYS':
-            start_date = today - timedelta(days=7)
-            transactions = transactions.filter(transaction_date__gte=start_date)
-        elif duration == 'LAST_30_DAYS':
-            start_date = today - timedelta(days=30)
-            transactions = transactions.filter(transaction_date__gte=start_date)
-        elif duration == 'THIS_MONTH':
-            transactions = transactions.filter(
-                transaction_date__year=today.year,
-                transaction_date__month=today.month
+        summaries = {
+            str(row['id']): {
+                'total_in': row['total_in'],
+                'total_out': row['total_out'],
+                'net_balance': row['total_in'] - row['total_out'],
+                'count': row['count'],
+            }
+            for row in rows
+        }
+        response = Response(summaries if batch else summaries[str(rows[0]['id'])])
+        if request.method == 'GET':
+            response['ETag'] = self._etag(
+                request, sorted((str(row['id']), row['data_version']) for row in rows), transaction_filter
             )
-        # ALL_TIME (default) - no filter needed
-        
-        # Apply type filter
-        txn_type = request.query_params.get('type')
-        if txn_type:
-            transactions = transactions.filter(type=txn_type)
-        
-        # Apply category filter
-        category = request.query_params.get('category')
-        if category:
-            transactions = transactions.filter(category_id=category)
-        
-        # Apply party filter
-        party = request.query_params.get('party')
-        if party:
-            transactions = transactions.filter(party_id=party)
-        
-        # Apply member filter
-        member_id = request.query_params.get('member')
-        if member_id:
-            try:
-                member_obj = Member.objects.get(id=member_id)
-                transactions = transactions.filter(created_by=member_obj.user)
-            except (Member.DoesNotExist, ValueError):
-                # If invalid member ID, return empty or ignore? Let's return empty to be safe
-                transactions = transactions.none()
-        
-        # Apply payment mode filter
-        payment_mode = request.query_params.get('payment_mode')
-        if payment_mode:
-            transactions = transactions.filter(payment_mode_id=payment_mode)
-        
-        # Apply search filter
-        search = request.query_params.get('search')
-        if search:
-            transactions = transactions.filter(
-                Q(remark__icontains=search) | Q(amount__icontains=search)
+        return response
+
+    def _summaries(self, user, transaction_filter, cashbook_ids):
+        """
+        One row per accessible cashbook with its totals, using conditional aggregation
+        (SUM(...) FILTER (WHERE ...)) over either the daily rollups or the transactions.
+        Filters go into the JOIN condition (FilteredRelation) so the (cashbook, type, date)
+        and ledger indexes narrow the joined rows.
+        """
+        cashbooks = Cashbook.objects.visible_to(user).filter(id__in=cashbook_ids).order_by()
+
+        # Unfiltered and date-range-only summaries are answered from the daily rollups
+        if not transaction_filter.has_row_filters:
+            rows = transaction_filter.date_q('daily_rollups__date')
+            return cashbooks.annotate(days=FilteredRelation('daily_rollups', condition=rows)).values(
+                'id', 'data_version'
+            ).annotate(
+                total_in=Sum('days__total_in', default=0),
+                total_out=Sum('days__total_out', default=0),
+                count=Sum('days__count', default=0),
             )
-        
-        # Calculate totals
-        total_in = transactions.filter(type='IN').aggregate(Sum('amount'))['amount__sum'] or 0
-        total_out = transactions.filter(type='OUT').aggregate(Sum('amount'))['amount__sum'] or 0
-        net_balance = total_in - total_out
-
-        return Response({
-            'total_in': total_in,
-            'total_out': total_out,
-            'net_balance': net_balance
-        })
+
+        rows = transaction_filter.rows_q('transactions__', member=False)
+        # The member filter is a subquery, so it narrows the aggregates instead of the JOIN
+        member = transaction_filter.member_q('matching__')
+        return cashbooks.annotate(matching=FilteredRelation('transactions', condition=rows)).values(
+            'id', 'data_version'
+        ).annotate(
+            total_in=Sum('matching__amount', filter=Q(matching__type='IN') & member, default=0),
+            total_out=Sum('matching__amount', filter=Q(matching__type='OUT') & member, default=0),
+            count=Count('matching', filter=member),
+        )
+
+
+class SyncView(APIView):
+    """
+    Sync for offline clients (see books.sync).
+    GET: changes since ?cursor=... (start without one, then send the returned one back);
+    optional ?cashbook=<id> limits the sync to one cashbook and its business, ?limit=<n>
+    the rows per stream.
+    POST {"operations": [{"key", "op", "id", "data"}, ...]}: apply queued transaction
+    writes in order, answered with one result per operation.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        cashbook_id = request.query_params.get('cashbook')
+        limit = request.query_params.get('limit')
+        try:
+            cashbook_id = uuid.UUID(cashbook_id) if cashbook_id else None
+        except ValueError:
+            return Response({'error': 'Invalid cashbook id'}, status=400)
+        if limit is not None and (not limit.isdigit() or int(limit) < 1):
+            return Response({'error': 'limit must be a positive integer'}, status=400)
+        return Response(sync.changes(
+            request.user, request.query_params.get('cursor'), cashbook_id, int(limit) if limit else None,
+        ))
+
+    def post(self, request):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            return Response({'error': 'operations must be a list of objects'}, status=400)
+        if len(operations) > settings.SYNC_MAX_OPERATIONS:
+            return Response({'error': f'At most {settings.SYNC_MAX_OPERATIONS} operations per request'}, status=400)
+        results = sync.apply_operations(request.user, AccessResolver.for_request(request), operations)
+        return Response({'results': results})
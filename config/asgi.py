@@ -2,6 +2,25 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The server-sent events stream (/api/v1/events/) is only served under ASGI, and the
+summary, reports list and transaction list switch to their async variants
+(ASYNC_VIEWS, see books.async_views).
+
+Opt-in: the Procfile serves config.wsgi with gunicorn. Under ASGI, Django buffers
+sync streaming responses completely before sending them: the Excel, CSV and JSON
+Lines exports and the import progress stream, so large exports sit in memory and
+arrive late. On a single-core box with SQLite, load_test also measured gunicorn
+ahead on every endpoint. Switch only once load_test shows a gain against the
+production database; to offer live events alongside streamed exports, route
+/api/v1/events/ to a separate ASGI deployment. Run it with uvicorn:
+
+    uvicorn config.asgi:application --host 0.0.0.0 --port $PORT --lifespan off
+
+Workers: uvicorn starts WEB_CONCURRENCY worker processes (default 1); use about one
+per CPU core. Unlike gunicorn sync workers, a worker doesn't need to be added per
+concurrent request, so keep the count near the core count and the database
+connections (CONN_MAX_AGE 0: one per in-flight request) within the server's
+max_connections. Django has no lifespan support, hence --lifespan off.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +31,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
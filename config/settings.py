@@ -154,6 +154,10 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # Required for production
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Uploaded / generated files (export job artifacts)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -173,6 +177,51 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 50,
 }
 
+# Background export jobs (run with: python manage.py run_export_worker)
+EXPORT_WORKER_PROCESSES = int(os.environ.get('EXPORT_WORKER_PROCESSES', '2'))
+EXPORT_JOBS_PER_BUSINESS = int(os.environ.get('EXPORT_JOBS_PER_BUSINESS', '1'))
+EXPORT_JOB_TTL = timedelta(hours=int(os.environ.get('EXPORT_JOB_TTL_HOURS', '24')))
+
+# In-process LRU cache of rendered Excel/PDF reports, keyed on the cashbook data version
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+REPORT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('REPORT_CACHE_MAX_ENTRY_BYTES', str(8 * 1024 * 1024)))
+
+# POST /api/v1/transactions/bulk/
+BULK_CREATE_MAX_ROWS = int(os.environ.get('BULK_CREATE_MAX_ROWS', '5000'))
+BULK_CREATE_BATCH_SIZE = 500
+
+# Lifetime (seconds) of the in-process party/category typeahead index used outside PostgreSQL
+TYPEAHEAD_INDEX_TTL = int(os.environ.get('TYPEAHEAD_INDEX_TTL', '300'))
+# Businesses' party and category indexes kept per process
+TYPEAHEAD_INDEX_MAX_ENTRIES = int(os.environ.get('TYPEAHEAD_INDEX_MAX_ENTRIES', '1000'))
+
+# First month of the FINANCIAL_YEAR duration preset (4 = April to March)
+FINANCIAL_YEAR_START_MONTH = int(os.environ.get('FINANCIAL_YEAR_START_MONTH', '4'))
+
+# GET /api/v1/sync/: rows per stream and page, how old a change must be before it is handed
+# out (longer than any ordinary write transaction), and how long deletions are remembered
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '500'))
+SYNC_SETTLE_SECONDS = int(os.environ.get('SYNC_SETTLE_SECONDS', '5'))
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '90'))
+# POST /api/v1/sync/: operations per batch, and how long applied operation keys are remembered
+SYNC_MAX_OPERATIONS = int(os.environ.get('SYNC_MAX_OPERATIONS', '500'))
+IDEMPOTENCY_KEY_RETENTION_DAYS = int(os.environ.get('IDEMPOTENCY_KEY_RETENTION_DAYS', '30'))
+
+# Serve the summary, reports list and transaction list from their async variants
+# (books.async_views). On by default under ASGI, see config/asgi.py.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# GET /api/v1/events/ (server-sent events, needs ASGI): how often each worker polls for new
+# change events, how old they must be to be read, and how long they are kept for resuming
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', '1'))
+EVENTS_SETTLE_SECONDS = float(os.environ.get('EVENTS_SETTLE_SECONDS', '1'))
+EVENTS_RETENTION_HOURS = int(os.environ.get('EVENTS_RETENTION_HOURS', '24'))
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_STREAM_MAX_SECONDS = int(os.environ.get('EVENTS_STREAM_MAX_SECONDS', '300'))
+EVENTS_RETRY_MS = 3000
+# Pending events per connection; a client further behind is told to refetch
+EVENTS_QUEUE_SIZE = 1000
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),